@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import UserProfile
 from .models import (
     Event,
@@ -8,6 +8,9 @@ from .models import (
     TicketTier,
     Ticket,
     RSVP,
+    Job,
+    OutboxMessage,
+    SeatHold,
 )
 
 class EventScheduleInline(admin.TabularInline):
@@ -21,6 +24,8 @@ class EventMediaInline(admin.TabularInline):
 class TicketTierInline(admin.TabularInline):
     model = TicketTier
     extra = 1
+    # live counters, maintained by inventory.py
+    readonly_fields = ("sold", "held", "shard_count")
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
@@ -29,6 +34,44 @@ class EventAdmin(admin.ModelAdmin):
     search_fields = ("title", "location", "description")
     inlines = [TicketTierInline, EventScheduleInline, EventMediaInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        # use the full-text index instead of LIKE '%term%' over three text columns
+        from . import search
+        if not search_term.strip() or search.backend() == "like":
+            return super().get_search_results(request, queryset, search_term)
+        ids = [pk for pk, *_ in search.search_ids(search_term, limit=1000)]
+        return queryset.filter(pk__in=ids), False
+
+@admin.register(TicketTier)
+class TicketTierAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "price", "capacity", "sold", "held", "shard_count", "available")
+    list_filter = ("shard_count",)
+    search_fields = ("name", "event__title")
+    readonly_fields = ("sold", "held", "shard_count")
+    actions = ["enable_sharding", "disable_sharding", "consolidate_shards"]
+
+    @admin.action(description="Flash-sale mode: shard sold counters")
+    def enable_sharding(self, request, queryset):
+        from django.conf import settings
+        from . import inventory
+        shards = getattr(settings, 'TIER_SHARDS', 8)
+        for tier in queryset:
+            inventory.set_sharding(tier, shards)
+        self.message_user(request, f"{queryset.count()} tier(s) now use {shards} counter shards.")
+
+    @admin.action(description="Turn off sharding (fold shards into sold)")
+    def disable_sharding(self, request, queryset):
+        from . import inventory
+        for tier in queryset:
+            inventory.set_sharding(tier, 0)
+        self.message_user(request, f"{queryset.count()} tier(s) back on a single counter.")
+
+    @admin.action(description="Consolidate shards now")
+    def consolidate_shards(self, request, queryset):
+        from . import inventory
+        folded = sum(inventory.consolidate(tier) for tier in queryset.filter(shard_count__gt=0))
+        self.message_user(request, f"Folded {folded} seat(s) into sold/held.")
+
 @admin.register(EventCategory)
 class EventCategoryAdmin(admin.ModelAdmin):
     search_fields = ("name",)
@@ -53,3 +96,64 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "role")
     list_filter = ("role",)
     search_fields = ("user__username", "user__email")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("name", "status", "attempts", "max_attempts", "run_after", "locked_by", "created_at")
+    list_filter = ("status", "name")
+    search_fields = ("name", "last_error")
+    readonly_fields = ("created_at", "updated_at")
+    actions = ["retry_jobs"]
+
+    @admin.action(description="Retry selected jobs now")
+    def retry_jobs(self, request, queryset):
+        from django.utils import timezone
+        updated = queryset.exclude(status=Job.STATUS_RUNNING).update(
+            status=Job.STATUS_QUEUED, attempts=0, run_after=timezone.now(), locked_until=None
+        )
+        self.message_user(request, f"{updated} job(s) re-queued.")
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("kind", "to_email", "ticket", "status", "attempts", "next_attempt_at", "sent_at", "created_at")
+    list_filter = ("status", "kind")
+    search_fields = ("to_email", "ticket__code", "last_error")
+    raw_id_fields = ("ticket",)
+    readonly_fields = ("created_at", "sent_at")
+    actions = ["resend_messages", "send_now"]
+
+    @admin.action(description="Re-queue selected messages for delivery")
+    def resend_messages(self, request, queryset):
+        from . import outbox
+        updated = outbox.requeue(queryset)
+        self.message_user(request, f"{updated} message(s) re-queued.")
+
+    @admin.action(description="Send selected messages now")
+    def send_now(self, request, queryset):
+        from . import outbox
+        pks = list(queryset.values_list("pk", flat=True))
+        outbox.requeue(OutboxMessage.objects.filter(pk__in=pks))
+        sent, failed = outbox.drain(queryset=OutboxMessage.objects.filter(pk__in=pks))
+        level = messages.WARNING if failed else messages.SUCCESS
+        self.message_user(request, f"{sent} message(s) sent, {failed} failed.", level=level)
+
+
+@admin.register(SeatHold)
+class SeatHoldAdmin(admin.ModelAdmin):
+    list_display = ("tier", "email", "quantity", "status", "expires_at", "created_at")
+    list_filter = ("status",)
+    search_fields = ("email",)
+    raw_id_fields = ("tier", "user")
+    actions = ["release_holds"]
+
+    def has_delete_permission(self, request, obj=None):
+        # deleting a row would leave its seats counted in TicketTier.held
+        return False
+
+    @admin.action(description="Release selected holds now")
+    def release_holds(self, request, queryset):
+        from . import inventory
+        released = sum(inventory.release_hold(h) for h in queryset)
+        self.message_user(request, f"{released} hold(s) released.")
@@ -0,0 +1,386 @@
+# myapp08/analytics.py
+"""
+Ticket analytics rollups.
+
+``EventStats`` (per event) and ``EventDailyStats`` (per event and local day
+of ticket creation) hold ticket counts, attendees (sum of quantities) and
+revenue. Ticket ``post_save``/``post_delete`` receivers bump them with
+``F()`` increments inside the transaction that writes the ticket, so the
+booking flow commits ticket and totals together and the dashboards never
+aggregate the Ticket table: their cost follows the number of events and
+days, not of tickets sold.
+
+``EventStats.rsvps_going`` follows RSVPs: booking and the RSVP view go
+through ``set_rsvp()``, which moves it in the transaction that changes the
+RSVP. ``reconcile()`` (``manage.py reconcile_event_stats``) recounts the
+EventStats counters chunk by chunk and repairs drift.
+
+``rebuild()`` (``manage.py rebuild_analytics``) recomputes both tables from
+the tickets, streamed in primary-key chunks, for backfills and for edits
+the receivers don't see (quantity/amount changes, bulk inserts).
+
+Dashboard reads (``report()``, ``summary()``) are cached under the
+versioned ``"analytics"`` namespace (caching.py), which every rollup change
+bumps once its transaction commits.
+"""
+import datetime
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import caching
+from .models import RSVP, Event, EventDailyStats, EventStats, Ticket
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "analytics"
+RSVP_GOING = "going"
+# EventStats counters and how reconcile() recounts them
+COUNTERS = ("tickets", "attendees", "revenue", "rsvps_going")
+# bucket name -> truncation of EventDailyStats.day (None: the day itself)
+BUCKETS = {"day": None, "week": TruncWeek, "month": TruncMonth}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def invalidate():
+    """Drop every cached analytics result (bumps the ``"analytics"`` namespace version)."""
+    caching.bump(NAMESPACE)
+
+
+def day_of(moment):
+    """The rollup day of a ticket created at ``moment`` (same as ``TruncDate`` in the current timezone)."""
+    return moment.date() if timezone.is_naive(moment) else timezone.localdate(moment)
+
+
+def _bump(model, lookup, deltas, create=True):
+    updates = {name: F(name) + value for name, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates) or not create:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # someone else created the row first
+        model.objects.filter(**lookup).update(**updates)
+
+
+def record(ticket, sign=1):
+    """Add ``ticket`` to (``sign=-1``: take it out of) its event's rollups."""
+    deltas = {
+        "tickets": sign,
+        "attendees": sign * ticket.quantity,
+        "revenue": sign * Decimal(ticket.total_amount or 0),
+    }
+    # a removal never creates rows: the event itself may be going away
+    create = sign > 0
+    _bump(EventStats, {"event_id": ticket.event_id}, deltas, create)
+    _bump(EventDailyStats, {"event_id": ticket.event_id, "day": day_of(ticket.created_at)}, deltas, create)
+    # after commit: a reader must not cache pre-commit totals under the new version
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Ticket, dispatch_uid="myapp08.analytics.ticket_saved")
+def _ticket_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record(instance)
+
+
+@receiver(post_delete, sender=Ticket, dispatch_uid="myapp08.analytics.ticket_deleted")
+def _ticket_deleted(sender, instance, **kwargs):
+    record(instance, sign=-1)
+
+
+def set_rsvp(user, event, status):
+    """
+    ``update_or_create`` the user's RSVP to ``event`` and move
+    ``EventStats.rsvps_going`` with it, in one transaction. Returns
+    ``(rsvp, created)``.
+    """
+    with transaction.atomic():
+        rsvp, created = RSVP.objects.select_for_update().get_or_create(
+            user=user, event=event, defaults={"status": status},
+        )
+        before = None if created else rsvp.status
+        if before not in (None, status):
+            rsvp.status = status
+            rsvp.save(update_fields=["status"])
+        delta = (status == RSVP_GOING) - (before == RSVP_GOING)
+        if delta:
+            _bump(EventStats, {"event_id": event.pk}, {"rsvps_going": delta})
+    return rsvp, created
+
+
+@receiver(post_delete, sender=RSVP, dispatch_uid="myapp08.analytics.rsvp_deleted")
+def _rsvp_deleted(sender, instance, **kwargs):
+    if instance.status == RSVP_GOING:
+        _bump(EventStats, {"event_id": instance.event_id}, {"rsvps_going": -1}, create=False)
+
+
+# -- rebuilding ---------------------------------------------------------------
+
+def _accumulate(daily, rows):
+    for event_id, created_at, quantity, amount in rows:
+        row = daily[event_id, day_of(created_at)]
+        row[0] += 1
+        row[1] += quantity
+        row[2] += amount or 0
+
+
+def _ticket_rows(queryset):
+    return queryset.order_by("pk").values_list("pk", "event_id", "created_at", "quantity", "total_amount")
+
+
+def rebuild(chunk_size=5000, progress=None):
+    """
+    Recompute both rollup tables from the Ticket table. Returns the number
+    of tickets read.
+
+    Tickets up to the current highest id are read in keyset chunks outside
+    any transaction; the tables are then replaced in one transaction that
+    first locks out concurrent bumps and folds in the tickets created while
+    the scan ran. ``progress(tickets_read)`` is called after every chunk.
+    """
+    high = Ticket.objects.aggregate(high=Max("pk"))["high"] or 0
+    daily = defaultdict(lambda: [0, 0, Decimal("0")])
+    last = seen = 0
+    while True:
+        rows = list(_ticket_rows(Ticket.objects.filter(pk__gt=last, pk__lte=high))[:chunk_size])
+        if not rows:
+            break
+        _accumulate(daily, (row[1:] for row in rows))
+        last = rows[-1][0]
+        seen += len(rows)
+        if progress:
+            progress(seen)
+
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # waits for in-flight bookings to commit and holds new ones until we do
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {EventStats._meta.db_table} IN EXCLUSIVE MODE")
+        # on SQLite the first write takes the database lock, with the same effect
+        EventDailyStats.objects.all().delete()
+        EventStats.objects.all().delete()
+        late = [row[1:] for row in _ticket_rows(Ticket.objects.filter(pk__gt=high))]
+        _accumulate(daily, late)
+        seen += len(late)
+
+        events = defaultdict(lambda: [0, 0, Decimal("0")])
+        for (event_id, _day), (tickets, attendees, revenue) in daily.items():
+            row = events[event_id]
+            row[0] += tickets
+            row[1] += attendees
+            row[2] += revenue
+        EventStats.objects.bulk_create(
+            [EventStats(event_id=event_id, tickets=t, attendees=a, revenue=r) for event_id, (t, a, r) in events.items()],
+            batch_size=1000,
+        )
+        EventDailyStats.objects.bulk_create(
+            [EventDailyStats(event_id=event_id, day=day, tickets=t, attendees=a, revenue=r)
+             for (event_id, day), (t, a, r) in daily.items()],
+            batch_size=1000,
+        )
+    invalidate()
+    logger.info("Rebuilt analytics rollups from %d ticket(s): %d event(s), %d event-day(s)",
+                seen, len(events), len(daily))
+    return seen
+
+
+def _true_counts(event_ids):
+    counts = {pk: {"tickets": 0, "attendees": 0, "revenue": Decimal("0"), "rsvps_going": 0} for pk in event_ids}
+    sales = (
+        Ticket.objects.filter(event_id__in=event_ids).order_by().values("event_id")
+        .annotate(tickets=Count("id"), attendees=Sum("quantity"), revenue=Sum("total_amount"))
+    )
+    for row in sales:
+        counts[row["event_id"]].update(
+            tickets=row["tickets"], attendees=row["attendees"] or 0, revenue=row["revenue"] or Decimal("0"),
+        )
+    going = (
+        RSVP.objects.filter(event_id__in=event_ids, status=RSVP_GOING).order_by().values("event_id")
+        .annotate(n=Count("id"))
+    )
+    for row in going:
+        counts[row["event_id"]]["rsvps_going"] = row["n"]
+    return counts
+
+
+def reconcile(chunk_size=500, repair=True, progress=None):
+    """
+    Recount every event's EventStats from its tickets and RSVPs, ``chunk_size``
+    events at a time, and return the drifted ones as
+    ``[(event_id, {counter: (stored, actual)})]``. With ``repair`` the rows
+    are corrected (or created) in the same per-chunk transaction, which
+    locks the chunk's stats rows first so concurrent bookings queue behind it.
+    """
+    drifted = []
+    last = 0
+    while True:
+        event_ids = list(Event.objects.filter(pk__gt=last).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not event_ids:
+            break
+        last = event_ids[-1]
+        with transaction.atomic():
+            stored = {s.event_id: s for s in EventStats.objects.select_for_update().filter(event_id__in=event_ids)}
+            actual = _true_counts(event_ids)
+            fixes, missing = [], []
+            for pk in event_ids:
+                row = stored.get(pk) or EventStats(event_id=pk)
+                diff = {name: (getattr(row, name), actual[pk][name])
+                        for name in COUNTERS if getattr(row, name) != actual[pk][name]}
+                if not diff:
+                    continue
+                drifted.append((pk, diff))
+                for name, (_, value) in diff.items():
+                    setattr(row, name, value)
+                (fixes if pk in stored else missing).append(row)
+            if repair:
+                EventStats.objects.bulk_update(fixes, COUNTERS, batch_size=1000)
+                EventStats.objects.bulk_create(missing, batch_size=1000)
+        if progress:
+            progress(last, len(drifted))
+    if repair and drifted:
+        transaction.on_commit(invalidate)
+    return drifted
+
+
+# -- reading ------------------------------------------------------------------
+
+def _period_start(day, bucket):
+    if bucket == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def periods(start, end, bucket):
+    """Start dates of the ``bucket`` periods overlapping [start, end]."""
+    period = _period_start(start, bucket)
+    while period <= end:
+        yield period
+        if bucket == "month":
+            period = (period + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            period += datetime.timedelta(days=7 if bucket == "week" else 1)
+
+
+def _date(value):
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValueError("from and to must be ISO dates (YYYY-MM-DD).")
+    return day
+
+
+def parse_filters(params):
+    """
+    ``{'start', 'end', 'bucket', 'event', 'organizer'}`` from the query
+    parameters ``from``, ``to`` (ISO dates, inclusive), ``bucket``,
+    ``event`` and ``organizer`` (ids). Raises ValueError with a message
+    for the client on bad input.
+    """
+    end = _date(params.get("to")) or timezone.localdate()
+    start = _date(params.get("from")) or end - datetime.timedelta(days=_setting("ANALYTICS_DEFAULT_DAYS", 90) - 1)
+    if start > end:
+        raise ValueError("from must not be after to.")
+    bucket = params.get("bucket") or "day"
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}.")
+    if sum(1 for _ in periods(start, end, bucket)) > _setting("ANALYTICS_MAX_BUCKETS", 400):
+        raise ValueError("Requested range has too many buckets; use a wider bucket or a shorter range.")
+    filters = {"start": start, "end": end, "bucket": bucket}
+    for name in ("event", "organizer"):
+        value = params.get(name) or None
+        if value is not None and not str(value).isdigit():
+            raise ValueError(f"{name} must be an id.")
+        filters[name] = int(value) if value else None
+    return filters
+
+
+def _report(start, end, bucket, event, organizer):
+    rows = EventDailyStats.objects.filter(day__gte=start, day__lte=end)
+    if event:
+        rows = rows.filter(event_id=event)
+    if organizer:
+        rows = rows.filter(event__organizer_id=organizer)
+    period = BUCKETS[bucket]("day") if BUCKETS[bucket] else F("day")
+    rows = (
+        rows.annotate(period=period)
+        .values("period", "event_id", "event__title")
+        .annotate(tickets=Sum("tickets"), attendees=Sum("attendees"), revenue=Sum("revenue"))
+        .order_by()
+    )
+
+    # one grouped pass; every series is folded out of its (period, event) rows
+    by_period = {p: [0, 0, Decimal("0")] for p in periods(start, end, bucket)}
+    by_event = {}
+    for row in rows:
+        totals = by_period[row["period"]]
+        totals[0] += row["tickets"] or 0
+        totals[1] += row["attendees"] or 0
+        totals[2] += row["revenue"] or 0
+        per_event = by_event.setdefault(row["event_id"], [row["event__title"], Decimal("0")])
+        per_event[1] += row["revenue"] or 0
+
+    top = sorted(by_event.values(), key=lambda e: (-e[1], e[0]))[:_setting("ANALYTICS_TOP_EVENTS", 20)]
+    days = sorted(by_period)
+    return {
+        "range": {"from": start.isoformat(), "to": end.isoformat(), "bucket": bucket},
+        "filters": {"event": event, "organizer": organizer},
+        "totals": {
+            "tickets": sum(v[0] for v in by_period.values()),
+            "attendees": sum(v[1] for v in by_period.values()),
+            "revenue": float(sum(v[2] for v in by_period.values())),
+        },
+        "revenue_by_event": {"labels": [t for t, _ in top], "values": [float(r) for _, r in top]},
+        "attendees_by_date": {"labels": [d.isoformat() for d in days], "values": [by_period[d][1] for d in days]},
+        "revenue_by_date": {"labels": [d.isoformat() for d in days], "values": [float(by_period[d][2]) for d in days]},
+    }
+
+
+def report(start, end, bucket="day", event=None, organizer=None):
+    """
+    The dashboard series for [start, end] from one grouped query over
+    EventDailyStats, cached per filter set under the ``"analytics"``
+    namespace. Returns ``(payload, cache_hit)``.
+    """
+    return caching.get_or_set(
+        NAMESPACE, ("report", start, end, bucket, event or "-", organizer or "-"),
+        lambda: _report(start, end, bucket, event, organizer),
+        timeout=_setting("ANALYTICS_CACHE_TTL", 300),
+    )
+
+
+def _summary():
+    row = EventStats.objects.aggregate(attendees=Sum("attendees"), revenue=Sum("revenue"))
+    popular = EventStats.objects.select_related("event").filter(attendees__gt=0).order_by("-attendees").first()
+    return {
+        "attendees": row["attendees"] or 0,
+        "revenue": row["revenue"] or Decimal("0.00"),
+        "popular_title": popular.event.title if popular else None,
+        "popular_attendees": popular.attendees if popular else 0,
+    }
+
+
+def summary():
+    """All-time ``{'attendees', 'revenue', 'popular_title', 'popular_attendees'}``, cached."""
+    value, _hit = caching.get_or_set(NAMESPACE, ("summary",), _summary,
+                                     timeout=_setting("ANALYTICS_CACHE_TTL", 300))
+    return value
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class Myapp08Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp08'
+
+    def ready(self):
+        # register background job handlers and the signal receivers that keep derived data in step
+        from . import (  # noqa: F401
+            analytics, calendar_feed, event_pages, fragments, image_variants, inventory, ownership, profile_stats,
+            search, tasks,
+        )
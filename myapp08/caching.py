@@ -0,0 +1,100 @@
+# myapp08/caching.py
+"""
+Versioned cache namespaces with hit/miss accounting.
+
+Every namespace (``"analytics"``, ``"calendar"``, ...) has a version number
+in the default cache, and its keys embed it: ``bump()`` invalidates the
+whole namespace at once without knowing its keys -- entries of older
+versions are simply never read again and age out on their TTL.
+
+``get_or_set()`` counts hits and misses per namespace, also in the cache,
+so with a shared backend ``stats()`` is the hit rate across all processes.
+"""
+import time
+
+from django.core.cache import cache
+
+_MISSING = object()
+
+# namespaces reported by `manage.py cache_stats` and the admin analytics page
+NAMESPACES = ("analytics", "calendar", "event_page", "fragments", "profile")
+
+
+def _version_key(namespace):
+    return f"{namespace}:version"
+
+
+def _initial_version():
+    # not 1: a version evicted from the cache must not come back as one that was used before
+    return int(time.time() * 1000)
+
+
+def version(namespace):
+    value = cache.get(_version_key(namespace))
+    if value is None:
+        cache.add(_version_key(namespace), _initial_version(), None)
+        value = cache.get(_version_key(namespace), 0)
+    return value
+
+
+def versions(namespaces):
+    """``{namespace: version}`` for several namespaces in one cache round trip."""
+    keys = {_version_key(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(list(keys))
+    return {namespace: found[k] if k in found else version(namespace) for k, namespace in keys.items()}
+
+
+def bump(namespace):
+    """Invalidate every key of ``namespace``."""
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.add(_version_key(namespace), _initial_version(), None)
+
+
+def key(namespace, *parts, namespace_version=None):
+    """Cache key for ``parts`` under the current (or the given) version of ``namespace``."""
+    ver = namespace_version or version(namespace)
+    return ":".join([namespace, f"v{ver}", *(str(p) for p in parts)])
+
+
+def _count(namespace, outcome):
+    counter = f"{namespace}:stats:{outcome}"
+    try:
+        cache.incr(counter)
+    except ValueError:
+        if not cache.add(counter, 1, None):
+            cache.incr(counter)
+
+
+def get_or_set(namespace, parts, compute, timeout=None, namespace_version=None):
+    """
+    ``(value, hit)``: the cached value for ``parts``, or ``compute()``
+    stored under the namespace's current version. ``timeout`` may be a
+    callable that gets the computed value and returns its TTL.
+    """
+    cache_key = key(namespace, *parts, namespace_version=namespace_version)
+    value = cache.get(cache_key, _MISSING)
+    if value is not _MISSING:
+        _count(namespace, "hits")
+        return value, True
+    _count(namespace, "misses")
+    value = compute()
+    cache.set(cache_key, value, timeout(value) if callable(timeout) else timeout)
+    return value, False
+
+
+def stats(namespace):
+    """``{'hits', 'misses', 'hit_rate'}`` of ``namespace`` (hit_rate is None before any lookup)."""
+    counts = cache.get_many([f"{namespace}:stats:hits", f"{namespace}:stats:misses"])
+    hits = counts.get(f"{namespace}:stats:hits", 0)
+    misses = counts.get(f"{namespace}:stats:misses", 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+def reset_stats(namespace):
+    cache.delete_many([f"{namespace}:stats:hits", f"{namespace}:stats:misses"])
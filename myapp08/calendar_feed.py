@@ -0,0 +1,103 @@
+# myapp08/calendar_feed.py
+"""
+JSON event feed for the calendar page.
+
+FullCalendar asks for the visible window only (``?start=&end=``, ISO 8601).
+The window is served from per-month chunks: each calendar month is one
+range scan on the ``(starts_at, id)`` index, cached as a compact list under
+the versioned ``"calendar"`` namespace (caching.py), and the window is cut
+out of the months it touches. Any event save/delete bumps the version once
+its transaction commits (a reader in between would cache the pre-commit
+rows under the new version), so stale months are simply never read again
+and expire on their own.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import caching
+from .models import Event
+
+NAMESPACE = "calendar"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def version():
+    return caching.version(NAMESPACE)
+
+
+def invalidate():
+    caching.bump(NAMESPACE)
+
+
+@receiver(post_save, sender=Event, dispatch_uid="myapp08.calendar_feed.event_saved")
+@receiver(post_delete, sender=Event, dispatch_uid="myapp08.calendar_feed.event_deleted")
+def _event_changed(sender, **kwargs):
+    transaction.on_commit(invalidate)
+
+
+def parse_bound(value):
+    """A FullCalendar range bound as a local date, or None if unparsable."""
+    if not value:
+        return None
+    # an unencoded "+05:30" offset arrives as " 05:30"
+    value = value.strip().replace(" ", "+")
+    try:
+        moment = parse_datetime(value)
+        if moment is not None:
+            return timezone.localtime(moment).date() if timezone.is_aware(moment) else moment.date()
+        return parse_date(value[:10])
+    except ValueError:
+        return None
+
+
+def _months(start, end):
+    """First days of the months overlapping [start, end)."""
+    month = start.replace(day=1)
+    while month < end:
+        yield month
+        month = (month + datetime.timedelta(days=32)).replace(day=1)
+
+
+def _item(pk, title, date, time):
+    start = datetime.datetime.combine(date, time).isoformat() if time else date.isoformat()
+    return {"id": pk, "title": title, "start": start, "url": reverse("event_detail", args=[pk])}
+
+
+def month_events(month, feed_version=None):
+    """Compact feed items of one calendar month, cached."""
+    def load():
+        following = (month + datetime.timedelta(days=32)).replace(day=1)
+        rows = (
+            Event.objects.filter(
+                starts_at__gte=Event.compute_starts_at(month, datetime.time.min),
+                starts_at__lt=Event.compute_starts_at(following, datetime.time.min),
+            )
+            .order_by("starts_at", "pk")
+            .values_list("pk", "title", "date", "time")
+        )
+        return [_item(*row) for row in rows]
+
+    items, _hit = caching.get_or_set(
+        NAMESPACE, ("month", f"{month:%Y-%m}"), load,
+        timeout=_setting("CALENDAR_MONTH_CACHE_TTL", 3600), namespace_version=feed_version,
+    )
+    return items
+
+
+def window(start, end):
+    """Feed items with a date in [start, end)."""
+    feed_version = version()
+    items = []
+    for month in _months(start, end):
+        items += [i for i in month_events(month, feed_version) if start.isoformat() <= i["start"][:10] < end.isoformat()]
+    return items
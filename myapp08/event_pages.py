@@ -0,0 +1,111 @@
+# myapp08/event_pages.py
+"""
+Full-page cache of ``event_detail`` for anonymous visitors.
+
+Anonymous visitors all get the same page for an event, except for the
+seats left per tier. The cached page leaves those out, and the page fetches
+them from ``event_availability_json`` instead. A sold-out tier is
+therefore never served from the cache.
+
+Pages live in the ``"event_page"`` namespace of caching.py, keyed on the
+version of their event:
+
+    event_page:v<generation>:<event pk>:<event version>
+
+- A change to the event, its tiers, schedule or media bumps its version.
+- A category change bumps the generation, because category names show on
+  the pages of all their events.
+
+As in fragments.py, each bump happens at once and again on commit. A page
+rendered from pre-commit data in between is never read. An entry never
+outlives the event's start either, because the page changes once the
+event is past. A page that shows an image whose variants are still being
+built is kept for a few seconds only (image_variants.py). Signed-in
+visitors are never served from this cache.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils import timezone
+
+from . import caching, image_variants
+from .models import Event, EventCategory, EventMedia, EventSchedule, TicketTier
+
+NAMESPACE = "event_page"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _event_namespace(event_id):
+    return f"{NAMESPACE}:{event_id}"
+
+
+def _bump(namespace):
+    caching.bump(namespace)
+    transaction.on_commit(lambda: caching.bump(namespace))
+
+
+def invalidate(event_id):
+    """Purge the cached page of one event."""
+    _bump(_event_namespace(event_id))
+
+
+def invalidate_all():
+    _bump(NAMESPACE)
+
+
+def cacheable(request):
+    return request.method in ("GET", "HEAD") and not request.user.is_authenticated
+
+
+def _timeout(entry):
+    ttl = _setting("EVENT_PAGE_CACHE_TTL", 600)
+    if entry["starts_at"] > timezone.now():
+        ttl = min(ttl, max(1, int((entry["starts_at"] - timezone.now()).total_seconds()) + 1))
+    if image_variants.PENDING.encode() in entry["content"]:
+        ttl = image_variants.pending_ttl(ttl)
+    return ttl
+
+
+def get_or_render(event_id, render):
+    """
+    ``(response, hit)`` for the anonymous page of event ``event_id``.
+    ``render()`` returns the response and the event it shows.
+    """
+    def compute():
+        response, event = render()
+        return {"content": response.content, "content_type": response["Content-Type"], "starts_at": event.starts_at}
+
+    entry, hit = caching.get_or_set(
+        NAMESPACE, (event_id, caching.version(_event_namespace(event_id))), compute, timeout=_timeout,
+    )
+    return HttpResponse(entry["content"], content_type=entry["content_type"]), hit
+
+
+@receiver(post_save, sender=Event, dispatch_uid="myapp08.event_pages.event_saved")
+@receiver(post_delete, sender=Event, dispatch_uid="myapp08.event_pages.event_deleted")
+def _event_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(instance.pk)
+
+
+@receiver(post_save, sender=TicketTier, dispatch_uid="myapp08.event_pages.tier_saved")
+@receiver(post_delete, sender=TicketTier, dispatch_uid="myapp08.event_pages.tier_deleted")
+@receiver(post_save, sender=EventSchedule, dispatch_uid="myapp08.event_pages.schedule_saved")
+@receiver(post_delete, sender=EventSchedule, dispatch_uid="myapp08.event_pages.schedule_deleted")
+@receiver(post_save, sender=EventMedia, dispatch_uid="myapp08.event_pages.media_saved")
+@receiver(post_delete, sender=EventMedia, dispatch_uid="myapp08.event_pages.media_deleted")
+def _part_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(instance.event_id)
+
+
+@receiver(post_save, sender=EventCategory, dispatch_uid="myapp08.event_pages.category_saved")
+@receiver(post_delete, sender=EventCategory, dispatch_uid="myapp08.event_pages.category_deleted")
+def _category_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_all()
@@ -42,6 +42,8 @@ class EventForm(forms.ModelForm):
             "location",
             "image",
             "category",
+            "certificate_template",
+            "admission_rate",
         ]
         widgets = {
             "date": forms.DateInput(attrs={"type": "date"}),
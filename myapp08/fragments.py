@@ -0,0 +1,104 @@
+# myapp08/fragments.py
+"""
+Versioned template fragment cache (``{% fragment %}``, templatetags/fragments.py).
+
+A fragment is cached under its name, the version of every object it shows
+and the global generation (all in the ``"fragments"`` namespace of
+caching.py, so hits and misses are counted there):
+
+    fragments:v<generation>:<name>:<digest of "event:<pk>.<version>" ...>:<vary ...>
+
+- An Event save/delete bumps that event's version.
+- A TicketTier save/delete bumps its event's version.
+- An EventCategory change bumps the generation, because a category is
+  shown on the cards of all of its events.
+
+Stale entries are never read again and age out after FRAGMENT_CACHE_TTL.
+A fragment that shows an image whose variants are still being built is
+kept for a few seconds only (see image_variants.py). Bumps made by a
+worker process don't reach a per-process cache.
+Each bump happens at once and again on commit. The second bump drops
+anything rendered from pre-commit data in between.
+
+Only the default cache is used (``cache.get_many`` plus
+``incr``/``add``), so it works on the local-memory, file-based and
+shared backends alike.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, image_variants
+from .models import Event, EventCategory, TicketTier
+
+NAMESPACE = "fragments"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _object_namespace(obj):
+    return f"{obj._meta.model_name}:{obj.pk}"
+
+
+def _bump(namespace):
+    caching.bump(namespace)
+    transaction.on_commit(lambda: caching.bump(namespace))
+
+
+def invalidate(obj):
+    """Drop every fragment showing ``obj``."""
+    _bump(_object_namespace(obj))
+
+
+def invalidate_all():
+    _bump(NAMESPACE)
+
+
+def key_parts(name, objects, vary=()):
+    """Cache key parts of fragment ``name`` showing ``objects`` (one model instance or an iterable)."""
+    if objects is None:
+        objects = []
+    elif hasattr(objects, "_meta"):
+        objects = [objects]
+    namespaces = [_object_namespace(obj) for obj in objects]
+    current = caching.versions(namespaces) if namespaces else {}
+    stamp = ",".join(f"{ns}.{current[ns]}" for ns in namespaces)
+    digest = hashlib.md5(stamp.encode(), usedforsecurity=False).hexdigest()
+    return (name, digest, *(str(v) for v in vary))
+
+
+def _timeout(html):
+    ttl = _setting("FRAGMENT_CACHE_TTL", 3600)
+    return image_variants.pending_ttl(ttl) if image_variants.PENDING in html else ttl
+
+
+def get_or_render(name, objects, render, vary=()):
+    """The cached fragment, or ``render()`` stored under the current versions."""
+    html, _hit = caching.get_or_set(NAMESPACE, key_parts(name, objects, vary), render, timeout=_timeout)
+    return html
+
+
+@receiver(post_save, sender=Event, dispatch_uid="myapp08.fragments.event_saved")
+@receiver(post_delete, sender=Event, dispatch_uid="myapp08.fragments.event_deleted")
+def _event_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate(instance)
+
+
+@receiver(post_save, sender=TicketTier, dispatch_uid="myapp08.fragments.tier_saved")
+@receiver(post_delete, sender=TicketTier, dispatch_uid="myapp08.fragments.tier_deleted")
+def _tier_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _bump(f"{Event._meta.model_name}:{instance.event_id}")
+
+
+@receiver(post_save, sender=EventCategory, dispatch_uid="myapp08.fragments.category_saved")
+@receiver(post_delete, sender=EventCategory, dispatch_uid="myapp08.fragments.category_deleted")
+def _category_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_all()
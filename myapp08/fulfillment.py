@@ -0,0 +1,171 @@
+# myapp08/fulfillment.py
+"""
+Ticket fulfillment pipeline.
+
+A booking produces exactly one certificate PDF. Whoever needs it first (the
+``ticket.fulfill`` job, the outbox building the confirmation, a download)
+claims the stage with a guarded UPDATE on ``certificate_generated_at`` and
+stores the file; everyone else reads the stored file, so re-running the
+pipeline (job retry, expired worker lease, manual re-queue) never renders
+or writes it again. A caller that loses the race while the winner is still
+rendering renders a copy in memory for itself but does not store it. A
+claim older than the job lease with no file is from a run that died and
+can be taken over.
+QR codes are not rendered here: they are built lazily, on first request, by
+qr.py and served from its cache. The confirmation email that carries both is
+queued in the outbox with the booking and delivered by ``drain_outbox``
+(see outbox.py), which sets ``email_sent_at``.
+"""
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.mail import EmailMultiAlternatives
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from . import jobs, qr
+from .models import Ticket
+from .utils_certificates import render_ticket_certificate
+
+
+def qr_payload(ticket):
+    tier_name = ticket.tier.name if ticket.tier else ''
+    return f"EVT:{ticket.event_id}|TCK:{ticket.code}|EMAIL:{ticket.email}|TIER:{tier_name}|QTY:{ticket.quantity}"
+
+
+def render_certificate_pdf(ticket):
+    """Render the certificate for ``ticket`` with its event's design; returns PDF bytes."""
+    return render_ticket_certificate(ticket)
+
+
+def certificate_filename(ticket):
+    return f"certificate_{ticket.code}.pdf"
+
+
+def _mark(ticket, field):
+    """Set a stage marker once; returns False if another run already set it."""
+    now = timezone.now()
+    updated = Ticket.objects.filter(pk=ticket.pk, **{f"{field}__isnull": True}).update(**{field: now})
+    setattr(ticket, field, now)
+    return bool(updated)
+
+
+def _read(fieldfile):
+    fieldfile.open('rb')
+    try:
+        return fieldfile.read()
+    finally:
+        fieldfile.close()
+
+
+def ensure_qr(ticket, fmt='png'):
+    """The e-ticket QR, from the QR cache (rendered on first use). Returns the image bytes."""
+    data = qr.get(qr_payload(ticket), fmt)
+    if not ticket.qr_generated_at:
+        _mark(ticket, 'qr_generated_at')
+    return data
+
+
+def _unclaimed(now):
+    """No run holds the certificate stage: never claimed, or claimed longer than a job lease ago."""
+    return Q(certificate_generated_at__isnull=True) | Q(certificate_generated_at__lt=now - jobs.visibility_timeout())
+
+
+def _claim_certificate(ticket):
+    """Take the certificate stage for ``ticket``; True if this caller renders and stores the PDF."""
+    now = timezone.now()
+    claimed = Ticket.objects.filter(
+        Q(certificate_file='') | Q(certificate_file__isnull=True), _unclaimed(now), pk=ticket.pk,
+    ).update(certificate_generated_at=now)
+    if claimed:
+        ticket.certificate_generated_at = now
+    return bool(claimed)
+
+
+def claim_certificates(tickets, force=False):
+    """
+    ``_claim_certificate`` for many tickets in one UPDATE; returns the ones
+    this caller won. With ``force`` a stored certificate can be claimed too,
+    to be replaced, unless it was claimed within the last job lease.
+    """
+    now = timezone.now()
+    qs = Ticket.objects.filter(_unclaimed(now), pk__in=[t.pk for t in tickets])
+    if not force:
+        qs = qs.filter(Q(certificate_file='') | Q(certificate_file__isnull=True))
+    qs.update(certificate_generated_at=now)
+    won = set(
+        Ticket.objects.filter(pk__in=[t.pk for t in tickets], certificate_generated_at=now)
+        .values_list('pk', flat=True)
+    )
+    claimed = [t for t in tickets if t.pk in won]
+    for ticket in claimed:
+        ticket.certificate_generated_at = now
+    return claimed
+
+
+def ensure_certificate(ticket):
+    """Render the certificate PDF (once). Returns the PDF bytes."""
+    if ticket.certificate_file:
+        return _read(ticket.certificate_file)
+    if not _claim_certificate(ticket):
+        stored = Ticket.objects.filter(pk=ticket.pk).values_list('certificate_file', flat=True).first()
+        if stored:
+            ticket.certificate_file.name = stored
+            return _read(ticket.certificate_file)
+        # another caller is rendering it right now
+        return render_certificate_pdf(ticket)
+    data = render_certificate_pdf(ticket)
+    ticket.certificate_file.save(certificate_filename(ticket), ContentFile(data), save=False)
+    Ticket.objects.filter(pk=ticket.pk).update(certificate_file=ticket.certificate_file.name)
+    return data
+
+
+def build_confirmation_email(ticket, base_url, qr_data, cert_data):
+    event = ticket.event
+    free = not ticket.total_amount
+    subject = ("Free Ticket Confirmation: " if free else "Payment Confirmation & Ticket: ") + event.title
+    context = {
+        'user': ticket.user,
+        'event': event,
+        'event_url': urljoin(base_url, event.get_absolute_url()),
+        'qr_url': urljoin(base_url, reverse('ticket_qr', args=[ticket.code, 'svg'])),
+        'ticket': ticket,
+    }
+    html_content = render_to_string('email/event_confirmation_email.html', context)
+    text_content = strip_tags(html_content)
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
+
+    msg = EmailMultiAlternatives(subject, text_content, from_email, [ticket.email])
+    msg.attach_alternative(html_content, "text/html")
+    msg.attach('e-ticket-qr.png', qr_data, 'image/png')
+    msg.attach(certificate_filename(ticket), cert_data, 'application/pdf')
+    return msg
+
+
+def build_certificate_email(ticket, base_url, cert_data):
+    """Post-event "here is your certificate" email."""
+    context = {
+        'ticket': ticket,
+        'event_url': urljoin(base_url, ticket.event.get_absolute_url()),
+    }
+    html_body = render_to_string('email/certificate_email.html', context)
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
+    msg = EmailMultiAlternatives(
+        f"Your Certificate for {ticket.event.title}", strip_tags(html_body), from_email, [ticket.email],
+    )
+    msg.attach_alternative(html_body, "text/html")
+    msg.attach(certificate_filename(ticket), cert_data, 'application/pdf')
+    return msg
+
+
+def fulfill(ticket_id):
+    """Run every outstanding stage for a ticket."""
+    ticket = Ticket.objects.select_related('event', 'tier', 'user').get(pk=ticket_id)
+    if ticket.certificate_file:
+        return ticket
+    ensure_certificate(ticket)
+    return ticket
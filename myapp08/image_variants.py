@@ -0,0 +1,267 @@
+# myapp08/image_variants.py
+"""
+Resized WebP/JPEG variants of event images.
+
+An uploaded ``Event.image`` or ``EventMedia`` image gets a variant per
+width in IMAGE_VARIANT_WIDTHS, in both formats, stored next to the
+original:
+
+    events/cover/stage.jpg  ->  events/cover/stage.320w.webp, events/cover/stage.320w.jpg, ...
+
+Widths above the original's are capped at its width (never upscaled), and
+the largest variant is at most the largest configured width. The
+multi-megabyte upload itself is never sent to the browser once its
+variants exist.
+
+Variants are built by the ``images.variants`` job, queued in the same
+transaction as the upload (jobs.py), and by ``manage.py
+build_image_variants`` for files that predate the pipeline. The
+``{% picture %}`` tag (templatetags/images.py) renders the ``srcset`` from
+the *manifest*: the original's width and the variant widths present,
+cached per file. It falls back to the original until the variants are
+there.
+
+While an image's variants are pending, its manifest is cached for
+IMAGE_VARIANT_PENDING_TTL seconds only. The markup the tag renders for it
+carries ``PENDING``, and fragments.py and event_pages.py cache markup
+that contains this marker for the same few seconds. Every process
+therefore switches to the variants shortly after the job has built them.
+A finished job also purges the cached fragments and pages of its event,
+but with a per-process cache (locmem) that purge only reaches the
+worker's own process. A shared cache backend is needed for it to take
+effect everywhere.
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import enqueue
+from .models import Event, EventMedia
+
+logger = logging.getLogger(__name__)
+
+JOB = "images.variants"
+
+# format -> (extension, MIME type)
+FORMATS = {"webp": ("webp", "image/webp"), "jpeg": ("jpg", "image/jpeg")}
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff")
+
+VARIANT_RE = re.compile(r"\.\d+w\.(webp|jpg)$")
+
+# in markup showing an image whose variants are still being built
+PENDING = 'data-variants="pending"'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def widths():
+    return sorted(set(_setting("IMAGE_VARIANT_WIDTHS", (320, 640, 1280))))
+
+
+def is_source(name):
+    """True for an original image (not a variant) worth building variants of."""
+    return bool(name) and name.lower().endswith(IMAGE_EXTENSIONS) and not VARIANT_RE.search(name)
+
+
+def variant_name(name, width, fmt):
+    stem, _ext = os.path.splitext(name)
+    return f"{stem}.{width}w.{FORMATS[fmt][0]}"
+
+
+def targets(original_width):
+    """Variant widths for an image ``original_width`` pixels wide."""
+    return sorted({min(w, original_width) for w in widths()})
+
+
+def _manifest_key(name):
+    return "image_variants:" + hashlib.md5(name.encode(), usedforsecurity=False).hexdigest()
+
+
+def _encode(image, fmt):
+    out = io.BytesIO()
+    quality = _setting("IMAGE_VARIANT_QUALITY", 80)
+    if fmt == "jpeg":
+        if image.mode in ("RGBA", "LA", "P"):
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+        image.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def _open(name):
+    """The image stored as ``name``, upright, or None if it is missing or not an image."""
+    try:
+        with default_storage.open(name, "rb") as fh:
+            image = Image.open(fh)
+            image.load()
+    except FileNotFoundError:
+        return None
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+        logger.warning("Skipping image variants of %s: %s", name, exc)
+        return None
+    return ImageOps.exif_transpose(image)
+
+
+def generate(name, force=False):
+    """
+    Build the missing variants of ``name`` (all of them with ``force``).
+    Returns the manifest, or None if ``name`` is not a readable image.
+    """
+    image = _open(name)
+    if image is None:
+        return None
+    made = []
+    for width in targets(image.width):
+        resized = None
+        for fmt in FORMATS:
+            target = variant_name(name, width, fmt)
+            if default_storage.exists(target):
+                if not force:
+                    continue
+                default_storage.delete(target)
+            if resized is None:
+                height = max(1, round(image.height * width / image.width))
+                resized = image if width == image.width else image.resize(
+                    (width, height), Image.Resampling.LANCZOS, reducing_gap=3.0,
+                )
+            default_storage.save(target, ContentFile(_encode(resized, fmt)))
+            made.append(target)
+    logger.info("Built %d image variant(s) of %s", len(made), name)
+    result = {"width": image.width, "widths": targets(image.width)}
+    cache.set(_manifest_key(name), result, _manifest_ttl(result))
+    return result
+
+
+def _complete(info):
+    return info["widths"] == targets(info["width"])
+
+
+def _manifest_ttl(info):
+    # a pending manifest must not outlive the job: other processes don't see its cache update
+    if _complete(info):
+        return _setting("IMAGE_VARIANT_MANIFEST_TTL", 86400)
+    return _setting("IMAGE_VARIANT_PENDING_TTL", 10)
+
+
+def _scan(name):
+    with default_storage.open(name, "rb") as fh:
+        width = Image.open(fh).width  # header only
+    present = [
+        w for w in targets(width)
+        if all(default_storage.exists(variant_name(name, w, fmt)) for fmt in FORMATS)
+    ]
+    return {"width": width, "widths": present}
+
+
+def manifest(name):
+    """``{'width', 'widths'}`` of the variants of ``name`` that exist, cached; None if there is no image."""
+    if not is_source(name):
+        return None
+    key = _manifest_key(name)
+    result = cache.get(key)
+    if result is None:
+        try:
+            result = _scan(name)
+        except (FileNotFoundError, UnidentifiedImageError, Image.DecompressionBombError, OSError):
+            return None
+        cache.set(key, result, _manifest_ttl(result))
+    return result
+
+
+def pending(name):
+    """True while ``name`` is an image whose variants are not all built yet."""
+    info = manifest(name)
+    return info is not None and not _complete(info)
+
+
+def pending_ttl(ttl):
+    """``ttl`` capped for markup that shows an image with pending variants."""
+    return min(ttl, _setting("IMAGE_VARIANT_PENDING_TTL", 10))
+
+
+def srcsets(name):
+    """``{format: "url 320w, url 640w"}`` for the variants of ``name``, or {} if there are none yet."""
+    info = manifest(name)
+    if not info or not info["widths"]:
+        return {}
+    return {
+        fmt: ", ".join(f"{default_storage.url(variant_name(name, w, fmt))} {w}w" for w in info["widths"])
+        for fmt in FORMATS
+    }
+
+
+def fallback_url(name):
+    """The largest JPEG variant of ``name``, or the original if it has none yet."""
+    info = manifest(name)
+    if info and info["widths"]:
+        return default_storage.url(variant_name(name, info["widths"][-1], "jpeg"))
+    return default_storage.url(name)
+
+
+def sources(root=None):
+    """Every original image under ``root`` (IMAGE_VARIANT_ROOT) in the default storage."""
+    pending = [(root or _setting("IMAGE_VARIANT_ROOT", "events")).rstrip("/")]
+    while pending:
+        path = pending.pop()
+        try:
+            dirs, files = default_storage.listdir(path)
+        except FileNotFoundError:
+            continue
+        pending.extend(f"{path}/{d}" for d in sorted(dirs, reverse=True))
+        for filename in sorted(files):
+            name = f"{path}/{filename}"
+            if is_source(name):
+                yield name
+
+
+# --- queue a job when an image is uploaded or replaced ---
+
+_FIELDS = {Event: "image", EventMedia: "file"}
+
+
+@receiver(pre_save, sender=Event, dispatch_uid="myapp08.image_variants.event_pre_save")
+@receiver(pre_save, sender=EventMedia, dispatch_uid="myapp08.image_variants.media_pre_save")
+def _note_upload(sender, instance, raw=False, **kwargs):
+    field = _FIELDS[sender]
+    name = getattr(instance, field).name
+    instance._image_uploaded = False
+    if raw or not name or not is_source(name):
+        return
+    fieldfile = getattr(instance, field)
+    if not fieldfile._committed:
+        # a new upload; its final name is only known after the save
+        instance._image_uploaded = True
+    elif instance.pk is not None:
+        stored = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+        instance._image_uploaded = stored != name
+
+
+@receiver(post_save, sender=Event, dispatch_uid="myapp08.image_variants.event_saved")
+@receiver(post_save, sender=EventMedia, dispatch_uid="myapp08.image_variants.media_saved")
+def _queue_variants(sender, instance, raw=False, **kwargs):
+    if raw or not getattr(instance, "_image_uploaded", False):
+        return
+    instance._image_uploaded = False
+    name = getattr(instance, _FIELDS[sender]).name
+    event_id = instance.pk if sender is Event else instance.event_id
+    enqueue(JOB, path=name, event_id=event_id)
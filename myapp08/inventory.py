@@ -0,0 +1,386 @@
+# myapp08/inventory.py
+"""
+Seat inventory for ticket tiers.
+
+A reservation is one guarded UPDATE per tier:
+
+    UPDATE ticket_tier SET sold = sold + n WHERE id = ? AND sold <= capacity - n
+
+and the affected-row count says whether it fitted. The check and the
+increment are a single statement, so there is no read-then-write window
+to lock. That holds on SQLite (which ignores ``select_for_update``) as well
+as on Postgres, and costs one round trip per tier.
+
+Paid checkouts first take a ``SeatHold``: the same guarded UPDATE moves the
+seats into ``held`` (which counts against availability) for SEAT_HOLD_TTL
+seconds. Paying converts the hold (``held -= n, sold += n`` in one
+statement); ``sweep_expired_holds`` gives expired holds back in bulk. An
+expired hold counts against availability until it is swept, so
+``run_workers`` sweeps every SEAT_HOLD_SWEEP_INTERVAL seconds.
+
+Sharded tiers (``shard_count > 0``, for flash sales) spread the counter over
+``TicketTierShard`` rows. The tier's free seats are split between the shards
+as per-shard ``capacity``, and each reservation is the same guarded UPDATE
+against one randomly chosen shard, so concurrent buyers rarely contend for a
+row (on Postgres; SQLite serialises all writers anyway). Capacity holds
+because no shard can sell past its own allotment. When every shard is too
+full for a request, the shards are folded back into the tier row and
+re-spread under lock (``consolidate``), which also picks up capacity added
+since. Saving a sharded tier with a new capacity does the same in the
+save's transaction, so shards cut from a larger capacity can't oversell a
+smaller one. Availability is the tier counters plus the sum over its shards.
+"""
+import datetime
+import random
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import SeatHold, TicketTier, TicketTierShard
+
+
+class SoldOut(Exception):
+    """Not enough seats left in ``tier`` for ``requested``; ``available`` is what was left."""
+
+    def __init__(self, tier_id, requested, available):
+        self.tier_id = tier_id
+        self.requested = requested
+        self.available = available
+        super().__init__(f"Tier {tier_id}: requested {requested}, {available} available")
+
+
+def _pk(tier):
+    return tier.pk if isinstance(tier, TicketTier) else int(tier)
+
+
+def _normalise(items):
+    """{tier or pk: qty} (or pairs) -> [(tier, qty)] merged and sorted by pk."""
+    pairs = items.items() if hasattr(items, 'items') else items
+    totals = {}
+    tiers = {}
+    for tier, qty in pairs:
+        qty = int(qty)
+        if qty < 1:
+            raise ValueError("Quantity must be at least 1.")
+        pk = _pk(tier)
+        totals[pk] = totals.get(pk, 0) + qty
+        if isinstance(tier, TicketTier):
+            tiers[pk] = tier
+    # a fixed order keeps two multi-tier buyers from deadlocking on Postgres
+    return [(tiers.get(pk, pk), qty) for pk, qty in sorted(totals.items())]
+
+
+def available(tier):
+    """Seats left right now, read from the database."""
+    pk = _pk(tier)
+    row = TicketTier.objects.filter(pk=pk).values('capacity', 'sold', 'held', 'shard_count').first()
+    if not row:
+        return 0
+    taken = row['sold'] + row['held']
+    if row['shard_count']:
+        totals = TicketTierShard.objects.filter(tier_id=pk).aggregate(sold=Sum('sold'), held=Sum('held'))
+        taken += (totals['sold'] or 0) + (totals['held'] or 0)
+    return max(row['capacity'] - taken, 0)
+
+
+def with_available(queryset):
+    """
+    Annotate ``seats_left`` on a TicketTier queryset, shards included, so
+    ``TicketTier.available`` needs no query per tier on listing pages.
+    """
+    shard_taken = (
+        TicketTierShard.objects.filter(tier=OuterRef('pk'))
+        .values('tier').annotate(taken=Sum(F('sold') + F('held'))).values('taken')
+    )
+    return queryset.annotate(seats_left=Greatest(
+        F('capacity') - F('sold') - F('held')
+        - Coalesce(Subquery(shard_taken, output_field=IntegerField()), 0),
+        0,
+        output_field=IntegerField(),
+    ))
+
+
+def _guard(qty):
+    return {'sold__lte': F('capacity') - F('held') - qty}
+
+
+def _take(tier, qty, field):
+    """
+    Guarded ``field += qty`` on the tier or, for sharded tiers, on one shard.
+    Returns the shard slot used (None for the tier row); raises ``SoldOut``.
+    """
+    pk = _pk(tier)
+    shards = tier.shard_count if isinstance(tier, TicketTier) else None
+    if not shards:
+        # shard_count=0 in the WHERE: a tier switched to sharding meanwhile falls through
+        if TicketTier.objects.filter(pk=pk, shard_count=0, **_guard(qty)).update(**{field: F(field) + qty}):
+            return None
+        shards = TicketTier.objects.filter(pk=pk).values_list('shard_count', flat=True).first()
+        if not shards:
+            raise SoldOut(pk, qty, available(pk))
+    return _take_sharded(pk, shards, qty, field)
+
+
+def _take_from_shard(pk, slot, qty, field):
+    return TicketTierShard.objects.filter(tier_id=pk, slot=slot, **_guard(qty)).update(**{field: F(field) + qty})
+
+
+def _take_sharded(pk, shards, qty, field):
+    # two random picks cover the common case; then aim only at shards with room
+    for slot in random.sample(range(shards), min(shards, 2)):
+        if _take_from_shard(pk, slot, qty, field):
+            return slot
+    roomy = (
+        TicketTierShard.objects.filter(tier_id=pk, **_guard(qty))
+        .order_by('sold').values_list('slot', flat=True)
+    )
+    for slot in roomy:
+        if _take_from_shard(pk, slot, qty, field):
+            return slot
+
+    # every shard is too full for qty. Sold out overall: say so without touching
+    # the counters. Otherwise the free seats are fragmented (or sharding was
+    # switched off meanwhile): fold, take from the tier row, re-spread
+    left = available(pk)
+    if left < qty:
+        raise SoldOut(pk, qty, left)
+    with transaction.atomic():
+        count = _fold(pk)
+        if not TicketTier.objects.filter(pk=pk, **_guard(qty)).update(**{field: F(field) + qty}):
+            raise SoldOut(pk, qty, available(pk))
+        if count:
+            _spread(pk, count)
+    return None
+
+
+def _reserve_one(tier, qty):
+    _take(tier, qty, 'sold')
+
+
+def reserve_many(items):
+    """
+    Reserve seats in several tiers at once: all or nothing.
+    ``items`` maps tiers (or tier ids) to quantities. Raises ``SoldOut`` for
+    the first tier that doesn't fit, after rolling back the others.
+    Run it inside the transaction that writes the tickets, so a failure
+    further on returns the seats too.
+    """
+    items = _normalise(items)
+    if len(items) == 1:
+        # one statement is atomic on its own; no savepoint needed
+        _reserve_one(*items[0])
+        return
+    with transaction.atomic():
+        for tier, qty in items:
+            _reserve_one(tier, qty)
+
+
+def reserve(tier, qty):
+    """Reserve ``qty`` seats in one tier; raises ``SoldOut``."""
+    reserve_many([(tier, qty)])
+
+
+def release(tier, qty):
+    """Give ``qty`` seats back (cancellation). Never drops below zero."""
+    pk = _pk(tier)
+    updated = TicketTier.objects.filter(pk=pk, sold__gte=qty).update(sold=F('sold') - qty)
+    if not updated and TicketTier.objects.filter(pk=pk, shard_count__gt=0).exists():
+        # the seats were sold on shards: fold them into the tier row first
+        with transaction.atomic():
+            count = _fold(pk)
+            updated = TicketTier.objects.filter(pk=pk, sold__gte=qty).update(sold=F('sold') - qty)
+            if count:
+                _spread(pk, count)
+    return updated
+
+
+# -- sharding ------------------------------------------------------------------
+
+def _fold(pk):
+    """
+    Move every shard's sold/held back onto the tier row and drop the shards.
+    Call inside a transaction. Returns the tier's shard_count.
+    """
+    # a no-op write takes the tier's row lock (and SQLite's write lock) before
+    # anything is read, so the reads below can't be invalidated by a racing writer
+    TicketTier.objects.filter(pk=pk).update(shard_count=F('shard_count'))
+    count = TicketTier.objects.filter(pk=pk).values_list('shard_count', flat=True).first() or 0
+    rows = list(TicketTierShard.objects.select_for_update().filter(tier_id=pk).values_list('sold', 'held'))
+    if rows:
+        sold = sum(r[0] for r in rows)
+        held = sum(r[1] for r in rows)
+        TicketTierShard.objects.filter(tier_id=pk).delete()
+        TicketTier.objects.filter(pk=pk).update(sold=F('sold') + sold, held=F('held') + held)
+        SeatHold.objects.filter(tier_id=pk, shard_slot__isnull=False).update(shard_slot=None)
+    return count
+
+
+def _spread(pk, count):
+    """Split the tier's free seats into ``count`` fresh shards. Call after ``_fold``."""
+    tier = TicketTier.objects.get(pk=pk)
+    free = max(tier.capacity - tier.sold - tier.held, 0)
+    share, extra = divmod(free, count)
+    TicketTierShard.objects.bulk_create([
+        TicketTierShard(tier_id=pk, slot=slot, capacity=share + (1 if slot < extra else 0))
+        for slot in range(count)
+    ])
+
+
+def set_sharding(tier, shards):
+    """
+    Switch a tier to ``shards`` counter slots (0 turns sharding off).
+    Safe while sales are running: the switch happens under the tier's lock.
+    """
+    pk = _pk(tier)
+    shards = int(shards)
+    if shards < 0:
+        raise ValueError("Shard count can't be negative.")
+    with transaction.atomic():
+        _fold(pk)
+        TicketTier.objects.filter(pk=pk).update(shard_count=shards)
+        if shards:
+            _spread(pk, shards)
+    if isinstance(tier, TicketTier):
+        tier.refresh_from_db()
+
+
+def consolidate(tier):
+    """
+    Fold a sharded tier's counters into ``sold``/``held`` and re-split the
+    free seats evenly over its shards. Returns the seats that were folded.
+    """
+    pk = _pk(tier)
+    with transaction.atomic():
+        before = TicketTier.objects.filter(pk=pk).values_list('sold', 'held').first()
+        count = _fold(pk)
+        if not count:
+            return 0
+        after = TicketTier.objects.filter(pk=pk).values_list('sold', 'held').first()
+        _spread(pk, count)
+    return sum(after) - sum(before)
+
+
+@receiver(post_save, sender=TicketTier, dispatch_uid="myapp08.inventory.tier_saved")
+def _tier_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # shard allotments were cut from the old capacity; re-split them from the new one
+    if created or raw or (update_fields is not None and "capacity" not in update_fields):
+        return
+    if TicketTier.objects.filter(pk=instance.pk, shard_count__gt=0).exists():
+        consolidate(instance)
+
+
+# -- holds ---------------------------------------------------------------------
+
+def hold_ttl():
+    return datetime.timedelta(seconds=getattr(settings, 'SEAT_HOLD_TTL', 600))
+
+
+def hold(tier, qty, email, user=None, ttl=None):
+    """
+    Set ``qty`` seats aside for a checkout: one guarded UPDATE plus one INSERT.
+    Raises ``SoldOut`` if they don't fit.
+    """
+    qty = int(qty)
+    if qty < 1:
+        raise ValueError("Quantity must be at least 1.")
+    with transaction.atomic():
+        slot = _take(tier, qty, 'held')
+        return SeatHold.objects.create(
+            tier_id=_pk(tier),
+            shard_slot=slot,
+            user=user if user is not None and user.is_authenticated else None,
+            email=email,
+            quantity=qty,
+            expires_at=timezone.now() + (ttl or hold_ttl()),
+        )
+
+
+def _settle(tier_id, slot, qty, to_sold):
+    """Take ``qty`` off a hold counter (and onto ``sold`` when converting)."""
+    fields = {'held': Greatest(F('held') - qty, 0)}
+    if to_sold:
+        fields['sold'] = F('sold') + qty
+    if slot is not None and TicketTierShard.objects.filter(tier_id=tier_id, slot=slot).update(**fields):
+        return
+    # tier row, or the shard was folded away after this hold's slot was read
+    TicketTier.objects.filter(pk=tier_id).update(**fields)
+
+
+def _claim(hold_pk, unexpired_only):
+    """
+    Take an active hold for settling and delete it. Returns its
+    (tier_id, shard_slot, quantity), or None if someone else settled it.
+    Call inside a transaction.
+    """
+    qs = SeatHold.objects.filter(pk=hold_pk, status=SeatHold.STATUS_ACTIVE)
+    if unexpired_only:
+        qs = qs.filter(expires_at__gt=timezone.now())
+    # write first: the row is ours before we read which counter it sits on
+    if not qs.update(status=SeatHold.STATUS_CLAIMED):
+        return None
+    claimed = SeatHold.objects.filter(pk=hold_pk)
+    row = claimed.values_list('tier_id', 'shard_slot', 'quantity').get()
+    claimed.delete()
+    return row
+
+
+def convert(seat_hold):
+    """
+    Turn a hold into sold seats (call inside the transaction that issues the
+    ticket). If the hold already expired, fall back to a normal reservation,
+    which raises ``SoldOut`` when the seats went to someone else meanwhile.
+    """
+    with transaction.atomic():
+        row = _claim(seat_hold.pk, unexpired_only=True)
+        if row:
+            _settle(*row, to_sold=True)
+        else:
+            release_hold(seat_hold)
+            _reserve_one(seat_hold.tier_id, seat_hold.quantity)
+
+
+def release_hold(seat_hold):
+    """Give a hold's seats back now (buyer cancelled or changed their mind)."""
+    with transaction.atomic():
+        row = _claim(seat_hold.pk, unexpired_only=False)
+        if row:
+            _settle(*row, to_sold=False)
+            return True
+    return False
+
+
+def sweep_expired_holds(chunk_size=500, now=None):
+    """
+    Release every hold that expired before ``now``; returns how many.
+    Works in chunks: one UPDATE claims a chunk of holds, then one DELETE and
+    one UPDATE per affected counter settle it, so a sweep of N holds costs
+    O(N / chunk_size) statements and keeps each transaction short. Claiming
+    by status first means a hold converted or released meanwhile is never
+    subtracted twice.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        ids = list(
+            SeatHold.objects.filter(status=SeatHold.STATUS_ACTIVE, expires_at__lte=now)
+            .order_by('expires_at').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return released
+        with transaction.atomic():
+            SeatHold.objects.filter(pk__in=ids, status=SeatHold.STATUS_ACTIVE).update(status=SeatHold.STATUS_CLAIMED)
+            # rows claimed here are deleted before commit, so these are ours alone
+            claimed = SeatHold.objects.filter(pk__in=ids, status=SeatHold.STATUS_CLAIMED)
+            per_counter = Counter()
+            for tier_id, slot, qty in claimed.values_list('tier_id', 'shard_slot', 'quantity'):
+                per_counter[tier_id, slot] += qty
+            count = claimed.delete()[0]
+            for (tier_id, slot), qty in per_counter.items():
+                _settle(tier_id, slot, qty, to_sold=False)
+        released += count
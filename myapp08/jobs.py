@@ -0,0 +1,175 @@
+# myapp08/jobs.py
+"""
+Small DB-backed job queue.
+
+Jobs are rows in the ``Job`` table, so they are written in the same transaction
+as the data they refer to and need no external broker (works on SQLite).
+Workers (see ``manage.py run_workers``) claim jobs with a conditional UPDATE,
+which is atomic on every backend, and hold them for a visibility timeout. A job
+whose worker died is picked up again once its lease expires.
+"""
+import datetime
+import logging
+import random
+import os
+import socket
+import traceback
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+# name -> callable(**payload)
+_registry = {}
+
+
+def task(name):
+    """Register a function as the handler for jobs called ``name``."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def get_handler(name):
+    return _registry.get(name)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def visibility_timeout():
+    return datetime.timedelta(seconds=_setting('JOB_VISIBILITY_TIMEOUT', 300))
+
+
+def backoff_delay(attempts, base=None, cap=None):
+    """Exponential backoff with jitter: base * 2^(attempts-1), capped."""
+    base = base if base is not None else _setting('JOB_RETRY_BASE_DELAY', 5)
+    cap = cap if cap is not None else _setting('JOB_RETRY_MAX_DELAY', 3600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return datetime.timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(name, delay=None, max_attempts=None, **payload):
+    """
+    Add a job to the queue. Call this inside the transaction that creates the
+    rows the job works on, so the job only becomes visible if they commit.
+    """
+    run_after = timezone.now() + (delay or datetime.timedelta(0))
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_after=run_after,
+        max_attempts=max_attempts or _setting('JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def _claimable(now):
+    # queued and due, or running with an expired lease (worker crashed/hung)
+    return (
+        Q(status=Job.STATUS_QUEUED, run_after__lte=now)
+        | Q(status=Job.STATUS_RUNNING, locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+
+def claim(worker, limit=10):
+    """
+    Claim up to ``limit`` due jobs for ``worker``.
+    Each claim is a single guarded UPDATE; losing a race just means another
+    worker got the row first, so we skip it.
+    """
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(_claimable(now))
+        .order_by('run_after', 'id')
+        .values_list('pk', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for pk in candidates:
+        updated = Job.objects.filter(_claimable(now), pk=pk).update(
+            status=Job.STATUS_RUNNING,
+            locked_by=worker,
+            locked_until=now + visibility_timeout(),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if updated:
+            claimed.append(pk)
+            if len(claimed) >= limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed, locked_by=worker).order_by('run_after', 'id'))
+
+
+def _finish(job, worker, **fields):
+    fields['updated_at'] = timezone.now()
+    # guarded by locked_by so a worker whose lease expired can't clobber the
+    # result of the worker that took the job over
+    return Job.objects.filter(pk=job.pk, locked_by=worker).update(**fields)
+
+
+def run_job(job, worker):
+    """Execute one claimed job, then mark it done or schedule a retry."""
+    handler = get_handler(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job '{job.name}'")
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed on attempt %s", job.pk, job.name, job.attempts)
+        if job.attempts >= job.max_attempts:
+            _finish(job, worker, status=Job.STATUS_FAILED, last_error=error, locked_until=None)
+        else:
+            _finish(
+                job, worker,
+                status=Job.STATUS_QUEUED,
+                last_error=error,
+                locked_until=None,
+                run_after=timezone.now() + backoff_delay(job.attempts),
+            )
+        return False
+
+    _finish(job, worker, status=Job.STATUS_DONE, locked_until=None, last_error='')
+    return True
+
+
+def fail_exhausted():
+    """Mark expired leases that have used all attempts as failed."""
+    now = timezone.now()
+    return Job.objects.filter(
+        status=Job.STATUS_RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts')
+    ).update(status=Job.STATUS_FAILED, locked_until=None, updated_at=now)
+
+
+def work_batch(worker=None, limit=10):
+    """Claim and run one batch. Returns the number of jobs processed."""
+    worker = worker or worker_id()
+    fail_exhausted()
+    jobs = claim(worker, limit=limit)
+    for job in jobs:
+        run_job(job, worker)
+    return len(jobs)
+
+
+def drain(limit=10, max_batches=None):
+    """Run jobs in this process until nothing is due (used by tests and --once)."""
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        done = work_batch(limit=limit)
+        if not done:
+            break
+        processed += done
+        batches += 1
+    return processed
+
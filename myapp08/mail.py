@@ -0,0 +1,112 @@
+# myapp08/mail.py
+"""
+Mail dispatch over a reused SMTP connection.
+
+``msg.send()`` opens a new connection (TCP + STARTTLS + LOGIN) for every
+message. ``MailDispatcher`` keeps one connection open and hands messages to
+``connection.send_messages()`` in batches, optionally throttled to a
+per-minute rate so bulk runs stay under the provider's sending limits.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+
+class MailDispatcher:
+    def __init__(self, batch_size=None, rate_per_minute=None, connection=None, idle_timeout=None):
+        self.batch_size = batch_size or getattr(settings, 'MAIL_BATCH_SIZE', 50)
+        self.rate_per_minute = (
+            rate_per_minute if rate_per_minute is not None
+            else getattr(settings, 'MAIL_RATE_PER_MINUTE', 0)
+        )
+        self.idle_timeout = idle_timeout or getattr(settings, 'MAIL_CONNECTION_IDLE_TIMEOUT', 60)
+        self._connection = connection
+        self._own_connection = connection is None
+        self._opened = False
+        self._last_used = 0.0
+        self._next_slot = 0.0
+        self.sent = 0
+        self.failed = 0
+        self.connections_opened = 0
+        self.elapsed = 0.0
+
+    # -- connection handling -------------------------------------------------
+
+    def _open(self):
+        if self._opened and time.monotonic() - self._last_used > self.idle_timeout:
+            # most servers drop idle sessions; reconnect instead of failing a batch
+            self.close()
+        if not self._opened:
+            if self._connection is None:
+                self._connection = get_connection(fail_silently=False)
+            self._connection.open()
+            self._opened = True
+            self.connections_opened += 1
+        return self._connection
+
+    def close(self):
+        if self._opened:
+            try:
+                self._connection.close()
+            except Exception:
+                logger.warning("Error closing SMTP connection", exc_info=True)
+            self._opened = False
+            if self._own_connection:
+                self._connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- sending ---------------------------------------------------------------
+
+    def _throttle(self, count):
+        """Token spacing: ``count`` messages occupy count * 60/rate seconds."""
+        if not self.rate_per_minute:
+            return
+        now = time.monotonic()
+        if self._next_slot > now:
+            time.sleep(self._next_slot - now)
+            now = self._next_slot
+        self._next_slot = max(now, self._next_slot) + count * 60.0 / self.rate_per_minute
+
+    def send(self, messages):
+        """
+        Send ``messages`` in batches over one connection.
+        Returns the list of messages that failed; a failed batch is reported
+        as a whole (the server may have accepted part of it), and the next
+        batch gets a fresh connection.
+        """
+        messages = list(messages)
+        failed = []
+        started = time.perf_counter()
+        for i in range(0, len(messages), self.batch_size):
+            batch = messages[i:i + self.batch_size]
+            self._throttle(len(batch))
+            try:
+                sent = self._open().send_messages(batch) or 0
+                self._last_used = time.monotonic()
+                self.sent += sent
+            except Exception:
+                logger.warning("SMTP batch of %d failed", len(batch), exc_info=True)
+                self.failed += len(batch)
+                failed.extend(batch)
+                self.close()
+        self.elapsed += time.perf_counter() - started
+        return failed
+
+    @property
+    def rate(self):
+        """Messages per second over all ``send`` calls so far."""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return (f"{self.sent} sent, {self.failed} failed in {self.elapsed:.2f}s "
+                f"({self.rate:.1f} msg/s, {self.connections_opened} connection(s))")
+
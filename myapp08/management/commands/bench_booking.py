@@ -0,0 +1,314 @@
+import datetime
+import json
+import math
+import random
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from myapp08 import inventory
+from myapp08.models import Event, EventStats, SeatHold, Ticket, TicketTier, TicketTierShard
+
+# writes to these tables contend for the tier's row (or SQLite's database) lock
+INVENTORY_TABLES = tuple(m._meta.db_table for m in (TicketTier, TicketTierShard, SeatHold))
+STEPS = ('book_get', 'book_post', 'pay_get', 'pay_post')
+# integrity sections that fail the run when non-empty
+FAILURES = ('oversold_tiers', 'counter_mismatches', 'duplicate_tickets', 'rollup_mismatches')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarise(values):
+    ms = [v * 1000 for v in values]
+    return {
+        'count': len(ms),
+        'p50': percentile(ms, 50),
+        'p95': percentile(ms, 95),
+        'p99': percentile(ms, 99),
+        'max': max(ms) if ms else None,
+    }
+
+
+class LockProbe:
+    """``connection.execute_wrapper`` timing the writes to the inventory tables."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        head = sql.lstrip()[:6].upper()
+        if head not in ('UPDATE', 'INSERT', 'DELETE') or not any(t in sql for t in INVENTORY_TABLES):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ('Seed events and tiers, then drive book_event/pay_event with concurrent simulated users '
+            '(threaded test clients). Reports latency percentiles, throughput, lock-wait time and any '
+            'oversold tier or duplicate ticket, and writes the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=300, help='Simulated buyers (each books once).')
+        parser.add_argument('--threads', type=int, default=32, help='Concurrent buyers.')
+        parser.add_argument('--events', type=int, default=2)
+        parser.add_argument('--capacity', type=int, default=None,
+                            help='Seats per tier (default: about half the expected demand, so tiers sell out).')
+        parser.add_argument('--paid-share', type=float, default=0.5,
+                            help='Fraction of buyers going through the paid hold -> pay flow.')
+        parser.add_argument('--max-quantity', type=int, default=2)
+        parser.add_argument('--sharded', action='store_true', help='Put every tier in flash-sale (sharded) mode.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='bench_booking.json', help='Where to write the JSON results.')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Run against the configured database instead of a throwaway test database '
+                                 '(the seeded rows are left behind).')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db() and options['use_current_db']:
+            raise CommandError('An in-memory SQLite database cannot be shared by the buyer threads.')
+
+        old_name = None
+        if not options['use_current_db']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=['*'],
+                STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+            ):
+                results = self.run(options)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        with open(options['output'], 'w') as fh:
+            json.dump(results, fh, indent=2, default=str)
+        self.report(results, options['output'])
+
+        integrity = results['integrity']
+        if any(integrity[k] for k in FAILURES):
+            raise CommandError('Integrity check failed: see the "integrity" section of the results.')
+
+    # -- seeding -----------------------------------------------------------------
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        User = get_user_model()
+        tag = timezone.now().strftime('%Y%m%d%H%M%S')
+        organizer = User.objects.create(username=f'bench-org-{tag}')
+
+        demand = options['users'] * (1 + options['max_quantity']) / 2
+        tiers_total = options['events'] * 2
+        capacity = options['capacity'] or max(1, int(demand / tiers_total / 2))
+
+        events = []
+        for i in range(options['events']):
+            event = Event.objects.create(
+                organizer=organizer,
+                title=f'Bench event {i + 1}',
+                date=timezone.localdate() + datetime.timedelta(days=30),
+                location='Bench Hall',
+            )
+            free = TicketTier.objects.create(event=event, name='General', price=0, capacity=capacity)
+            paid = TicketTier.objects.create(event=event, name='VIP', price=100, capacity=capacity)
+            if options['sharded']:
+                inventory.set_sharding(free, getattr(settings, 'TIER_SHARDS', 8))
+                inventory.set_sharding(paid, getattr(settings, 'TIER_SHARDS', 8))
+            events.append((event, free, paid))
+
+        User.objects.bulk_create(
+            [User(username=f'bench-{tag}-{n}', email=f'bench{n}@example.com', password='!')
+             for n in range(options['users'])],
+            batch_size=500,
+        )
+        users = list(User.objects.filter(username__startswith=f'bench-{tag}-').order_by('pk'))
+
+        plans = []
+        for user in users:
+            event, free, paid = rng.choice(events)
+            tier = paid if rng.random() < options['paid_share'] else free
+            plans.append((user, event, tier, rng.randint(1, options['max_quantity'])))
+        return organizer, events, plans, capacity
+
+    # -- buying ------------------------------------------------------------------
+
+    def buy(self, plan):
+        user, event, tier, qty = plan
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        book_url = reverse('book_event', args=[event.pk])
+        pay_url = reverse('pay_event', args=[event.pk])
+        timings = {}
+        probe = LockProbe()
+
+        def step(name, method, url, data=None):
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data or {})
+            timings[name] = time.perf_counter() - started
+            return response
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(probe):
+                step('book_get', 'get', book_url)
+                response = step('book_post', 'post', book_url,
+                                {'email': user.email, 'tier': tier.pk, 'quantity': qty})
+                if response.status_code == 302 and response.url == pay_url:
+                    step('pay_get', 'get', pay_url)
+                    response = step('pay_post', 'post', pay_url)
+            if response.status_code >= 400:
+                outcome = 'error'
+            elif response.status_code == 302 and response.url == reverse('confirmation_page'):
+                outcome = 'booked'
+            elif response.status_code == 302 and response.url == book_url:
+                outcome = 'sold_out'
+            else:
+                outcome = 'error'
+        finally:
+            connection.close()
+        return {
+            'outcome': outcome,
+            'seconds': time.perf_counter() - started,
+            'steps': timings,
+            'lock_wait': probe.seconds,
+        }
+
+    def run(self, options):
+        organizer, events, plans, capacity = self.seed(options)
+        # every buyer thread opens its own connection
+        connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            sessions = list(pool.map(self.buy, plans))
+        wall = time.perf_counter() - started
+
+        steps = defaultdict(list)
+        for s in sessions:
+            for name, seconds in s['steps'].items():
+                steps[name].append(seconds)
+        outcomes = defaultdict(int)
+        for s in sessions:
+            outcomes[s['outcome']] += 1
+        requests = sum(len(s['steps']) for s in sessions)
+        waits = [s['lock_wait'] for s in sessions]
+
+        return {
+            'meta': {
+                'commit': self.git_revision(),
+                'finished_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'users': options['users'],
+                'threads': options['threads'],
+                'events': options['events'],
+                'capacity_per_tier': capacity,
+                'paid_share': options['paid_share'],
+                'max_quantity': options['max_quantity'],
+                'sharded': options['sharded'],
+                'seed': options['seed'],
+            },
+            'latency_ms': {
+                'session': summarise([s['seconds'] for s in sessions]),
+                **{name: summarise(steps[name]) for name in STEPS if steps[name]},
+            },
+            'throughput': {
+                'wall_seconds': wall,
+                'sessions_per_second': len(sessions) / wall,
+                'requests_per_second': requests / wall,
+                'bookings_per_second': outcomes['booked'] / wall,
+            },
+            'lock_wait': {
+                'total_seconds': sum(waits),
+                'share_of_request_time': sum(waits) / max(sum(s['seconds'] for s in sessions), 1e-9),
+                'per_session_ms': summarise(waits),
+            },
+            'outcomes': dict(outcomes),
+            'integrity': self.audit([tier for _, free, paid in events for tier in (free, paid)], outcomes['booked']),
+        }
+
+    # -- checking ----------------------------------------------------------------
+
+    def audit(self, tiers, booked):
+        """Compare every tier's counters against capacity and the tickets actually issued."""
+        report = {'oversold_tiers': [], 'counter_mismatches': [], 'duplicate_tickets': [], 'rollup_mismatches': [],
+                  'tiers': []}
+        issued = dict(
+            Ticket.objects.filter(tier__in=tiers).values('tier').annotate(q=Sum('quantity')).values_list('tier', 'q')
+        )
+        for tier in TicketTier.objects.filter(pk__in=[t.pk for t in tiers]).order_by('pk'):
+            shards = tier.shards.aggregate(sold=Sum('sold'), held=Sum('held'))
+            sold = tier.sold + (shards['sold'] or 0)
+            held = tier.held + (shards['held'] or 0)
+            row = {'tier': tier.pk, 'capacity': tier.capacity, 'sold': sold, 'held': held,
+                   'issued': issued.get(tier.pk, 0)}
+            report['tiers'].append(row)
+            if sold + held > tier.capacity:
+                report['oversold_tiers'].append(row)
+            if sold != row['issued']:
+                report['counter_mismatches'].append(row)
+
+        # the analytics rollups are bumped in the booking transaction and must agree with the tickets
+        events = {t.event_id for t in tiers}
+        rollups = dict(EventStats.objects.filter(event__in=events).values_list('event', 'attendees'))
+        for row in Ticket.objects.filter(event__in=events).values('event').annotate(q=Sum('quantity')):
+            if rollups.get(row['event'], 0) != row['q']:
+                report['rollup_mismatches'].append(
+                    {'event': row['event'], 'attendees': rollups.get(row['event'], 0), 'issued': row['q']})
+
+        # each simulated buyer books exactly once per run
+        report['duplicate_tickets'] = list(
+            Ticket.objects.filter(tier__in=tiers)
+            .values('user', 'event').annotate(n=Count('id')).filter(n__gt=1).values('user', 'event', 'n')
+        )
+        report['tickets'] = Ticket.objects.filter(tier__in=tiers).count()
+        report['confirmed_sessions'] = booked
+        report['active_holds'] = SeatHold.objects.filter(tier__in=tiers, status=SeatHold.STATUS_ACTIVE).count()
+        return report
+
+    def git_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def report(self, results, path):
+        for name, row in results['latency_ms'].items():
+            self.stdout.write(f"{name:<10} n={row['count']:<5} p50={row['p50']:8.1f} ms  "
+                              f"p95={row['p95']:8.1f} ms  p99={row['p99']:8.1f} ms")
+        t = results['throughput']
+        self.stdout.write(f"throughput {t['sessions_per_second']:.1f} sessions/s, "
+                          f"{t['requests_per_second']:.1f} req/s, {t['bookings_per_second']:.1f} bookings/s "
+                          f"over {t['wall_seconds']:.2f}s")
+        w = results['lock_wait']
+        self.stdout.write(f"lock wait  {w['total_seconds']:.2f}s total ({w['share_of_request_time']:.0%} of request "
+                          f"time), p95 {w['per_session_ms']['p95']:.1f} ms per session")
+        self.stdout.write(f"outcomes   {results['outcomes']}")
+        i = results['integrity']
+        failed = any(i[k] for k in FAILURES)
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f"integrity  {len(i['oversold_tiers'])} oversold tier(s), {len(i['counter_mismatches'])} counter "
+            f"mismatch(es), {len(i['duplicate_tickets'])} duplicate ticket(s), {len(i['rollup_mismatches'])} rollup "
+            f"mismatch(es); results in {path}"
+        ))
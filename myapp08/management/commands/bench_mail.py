@@ -0,0 +1,51 @@
+import time
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+
+from myapp08.mail import MailDispatcher
+from myapp08.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Compare one-connection-per-message sends with batched MailDispatcher sends against a local SMTP sink.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--connect-delay', type=float, default=0.05,
+                            help='Simulated TLS handshake + login cost per connection, in seconds.')
+
+    def _messages(self, n):
+        return [
+            EmailMessage(f'Benchmark {i}', 'Hello from bench_mail.', 'bench@example.com', [f'user{i}@example.com'])
+            for i in range(n)
+        ]
+
+    def handle(self, *args, **options):
+        n = options['messages']
+        sink = SMTPSink(connect_delay=options['connect_delay']).start()
+        conn_kwargs = {
+            'backend': 'django.core.mail.backends.smtp.EmailBackend',
+            'host': '127.0.0.1', 'port': sink.port, 'use_tls': False, 'use_ssl': False,
+            'username': '', 'password': '', 'fail_silently': False,
+        }
+        try:
+            # baseline: what msg.send() does — a fresh connection per message
+            started = time.perf_counter()
+            for msg in self._messages(n):
+                msg.connection = get_connection(**conn_kwargs)
+                msg.send()
+            single = time.perf_counter() - started
+            self.stdout.write(f'per-message connections: {n} in {single:.2f}s ({n / single:.1f} msg/s)')
+
+            with MailDispatcher(batch_size=options['batch_size'], rate_per_minute=0,
+                                connection=get_connection(**conn_kwargs)) as dispatcher:
+                dispatcher.send(self._messages(n))
+            self.stdout.write(f'batched dispatcher:      {dispatcher.report()}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Speed-up x{dispatcher.rate / (n / single):.1f}; sink saw {sink.messages} messages '
+                f'over {sink.connections} connections.'
+            ))
+        finally:
+            sink.stop()
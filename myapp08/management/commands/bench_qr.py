@@ -0,0 +1,65 @@
+import io
+import shutil
+import tempfile
+import time
+import uuid
+
+import qrcode
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from myapp08 import qr
+
+
+class Command(BaseCommand):
+    help = ('Compare the old eager QR path (qrcode.make + PIL PNG, best-fit version) '
+            'with the fixed-version/mask SVG/PNG renderer and its caches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=300)
+
+    def _payloads(self, n):
+        return [
+            f"EVT:{i % 40}|TCK:{uuid.uuid4()}|EMAIL:attendee{i}@example.com|TIER:General|QTY:{1 + i % 4}"
+            for i in range(n)
+        ]
+
+    def _time(self, label, func, payloads):
+        started = time.perf_counter()
+        size = 0
+        for payload in payloads:
+            size += len(func(payload))
+        elapsed = time.perf_counter() - started
+        n = len(payloads)
+        self.stdout.write(f'{label:<28} {n / elapsed:8.0f} img/s  {elapsed / n * 1000:7.3f} ms/img  '
+                          f'{size / n / 1024:6.1f} KB/img')
+        return elapsed
+
+    def handle(self, *args, **options):
+        payloads = self._payloads(options['tickets'])
+
+        def eager_png(payload):
+            buf = io.BytesIO()
+            qrcode.make(payload).save(buf, format='PNG')
+            return buf.getvalue()
+
+        media = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media):
+                baseline = self._time('eager PNG (qrcode.make+PIL)', eager_png, payloads)
+                fast = self._time('fixed-symbol PNG', lambda p: qr.build(p, 'png'), payloads)
+                self._time('fixed-symbol SVG', lambda p: qr.build(p, 'svg'), payloads)
+
+                qr._memory.clear()
+                self._time('cold cache SVG (+disk write)', lambda p: qr.get(p, 'svg'), payloads)
+                qr._memory.clear()
+                self._time('disk cache hit SVG', lambda p: qr.get(p, 'svg'), payloads)
+                warm = self._time('memory cache hit SVG', lambda p: qr.get(p, 'svg'), payloads)
+        finally:
+            qr._memory.clear()
+            shutil.rmtree(media, ignore_errors=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'First render x{baseline / fast:.1f} faster; cached views x{baseline / warm:.0f} faster; '
+            f'bookings no longer render a QR at all.'
+        ))
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp08 import event_pages, fragments, image_variants
+from myapp08.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = ('Build the resized WebP/JPEG variants of every event image already in storage (media/events/ by '
+            'default). Existing variants are kept unless --force is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', default=None,
+                            help='Storage directory to scan (default: IMAGE_VARIANT_ROOT, "events").')
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that already exist.')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue one job per image for the workers instead of building them here.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        built = skipped = 0
+        for name in image_variants.sources(options['root']):
+            if options['enqueue']:
+                enqueue(image_variants.JOB, path=name)
+                built += 1
+                continue
+            if image_variants.generate(name, force=options['force']) is None:
+                skipped += 1
+            else:
+                built += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {name}')
+
+        if options['enqueue']:
+            self.stdout.write(self.style.SUCCESS(f'Queued {built} image(s).'))
+            return
+        # cached cards and pages still point at the originals
+        fragments.invalidate_all()
+        event_pages.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Built variants of {built} image(s), skipped {skipped} unreadable, '
+            f'in {time.perf_counter() - started:.2f}s.'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from myapp08 import caching
+
+
+class Command(BaseCommand):
+    help = ('Print hit/miss counts of the versioned cache namespaces (analytics, calendar feed, event pages, '
+            'template fragments, profile stats). Counts live in the default cache, so a per-process backend such '
+            'as locmem only shows this process.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        for name in caching.NAMESPACES:
+            s = caching.stats(name)
+            rate = f"{s['hit_rate']:.1%}" if s['hit_rate'] is not None else '-'
+            self.stdout.write(f"{name:<12} hits={s['hits']:<8} misses={s['misses']:<8} hit rate {rate}")
+            if options['reset']:
+                caching.reset_stats(name)
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from myapp08 import inventory
+from myapp08.models import TicketTier
+
+
+class Command(BaseCommand):
+    help = ('Fold the counters of sharded (flash-sale) ticket tiers back into sold/held and re-split '
+            'their free seats. With --off, also switch the tiers back to a single counter.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tier', type=int, help='Only this tier id.')
+        parser.add_argument('--off', action='store_true', help='Turn sharding off after folding.')
+        parser.add_argument('--past', action='store_true',
+                            help='Turn sharding off for tiers of events that have already happened.')
+        parser.add_argument('--loop', action='store_true', help='Keep consolidating until stopped.')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between passes (--loop).')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                self._pass(options)
+            except Exception as e:
+                # DB hiccup (e.g. SQLite "database is locked"); try again next pass
+                if not options['loop']:
+                    raise
+                self.stdout.write(self.style.WARNING(f'Consolidation failed: {e}'))
+                connections.close_all()
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def _pass(self, options):
+        tiers = TicketTier.objects.filter(shard_count__gt=0).select_related('event')
+        if options['tier']:
+            tiers = tiers.filter(pk=options['tier'])
+        tiers = list(tiers)
+        folded = switched = 0
+        for tier in tiers:
+            if options['off'] or (options['past'] and tier.event.date < timezone.localdate()):
+                inventory.set_sharding(tier, 0)
+                switched += 1
+            else:
+                folded += inventory.consolidate(tier)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(tiers)} sharded tier(s): {folded} seat(s) folded, {switched} switched to a single counter.'
+        ))
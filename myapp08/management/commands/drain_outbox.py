@@ -0,0 +1,56 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from myapp08 import outbox
+from myapp08.mail import MailDispatcher
+from myapp08.models import OutboxMessage
+
+
+class Command(BaseCommand):
+    help = ('Deliver queued outbox emails in batches over one SMTP connection. '
+            'Failed messages are retried with exponential backoff and dead-lettered after OUTBOX_MAX_ATTEMPTS.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=None,
+                            help='Messages claimed and sent per batch (default: MAIL_BATCH_SIZE).')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new messages until stopped.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when idle (--loop).')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if options['loop']:
+            signal.signal(signal.SIGTERM, lambda *a: stop.set())
+            signal.signal(signal.SIGINT, lambda *a: stop.set())
+
+        total_sent = total_failed = 0
+        with MailDispatcher() as dispatcher:
+            batch = options['batch'] or dispatcher.batch_size
+            worker = outbox.worker_id()
+            while not stop.is_set():
+                try:
+                    sent, failed = outbox.deliver_batch(dispatcher, worker=worker, limit=batch)
+                except Exception as e:
+                    # DB hiccup (e.g. SQLite "database is locked"); claimed rows come back after the lease
+                    if not options['loop']:
+                        raise
+                    self.stdout.write(self.style.WARNING(f'Drain failed: {e}'))
+                    connections.close_all()
+                    sent = failed = 0
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'  batch: {sent} sent, {failed} failed')
+                    continue
+                if not options['loop']:
+                    break
+                stop.wait(options['poll_interval'])
+
+        dead = OutboxMessage.objects.filter(status=OutboxMessage.STATUS_DEAD).count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Outbox drained — {total_sent} sent, {total_failed} failed ({dispatcher.report()}).'
+        ))
+        if dead:
+            self.stdout.write(self.style.WARNING(f'{dead} message(s) in the dead-letter state; resend them from the admin.'))
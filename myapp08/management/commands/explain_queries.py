@@ -0,0 +1,243 @@
+import datetime
+import random
+import re
+import statistics
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from myapp08 import analytics
+from myapp08.models import RSVP, Event, EventCategory, Ticket, TicketTier
+
+# (model, index name) added for the hot lookup paths; --compare drops and re-adds them
+HOT_INDEXES = (
+    (Event, 'event_organizer_date_idx'),
+    (Ticket, 'ticket_email_created_idx'),
+    (Ticket, 'ticket_user_created_idx'),
+    (Ticket, 'ticket_event_created_idx'),
+    (Ticket, 'ticket_created_sums_idx'),
+)
+
+# SQLite: "SCAN t" without an index; Postgres: "Seq Scan on t"
+FULL_SCAN = {
+    'sqlite': re.compile(r'^SCAN (\w+)$'),
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Seed events/tickets, render the main views and run EXPLAIN on every SELECT they issue, '
+            'flagging full-table scans. --compare times each query without and with the hot-path indexes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=20000)
+        parser.add_argument('--events', type=int, default=500)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--compare', action='store_true',
+                            help='Time every query with the hot-path indexes dropped, then with them back.')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per query (best is kept).')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Explain against the data already in the configured database instead of seeding '
+                                 'a throwaway test database (needs a superuser and an event; no --compare).')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in FULL_SCAN:
+            raise CommandError(f'EXPLAIN parsing is not implemented for {connection.vendor}.')
+        if options['compare'] and options['use_current_db']:
+            # dropping indexes on a live database would slow it down for everyone meanwhile
+            raise CommandError('--compare drops indexes, so it only runs in the throwaway test database; '
+                               'leave out --use-current-db.')
+        old_name = None
+        if not options['use_current_db']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=['*'],
+                STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+            ):
+                self.run(options)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    # -- seeding -----------------------------------------------------------------
+
+    def seed(self, options):
+        rng = random.Random(0)
+        User = get_user_model()
+        started = time.perf_counter()
+        tag = timezone.now().strftime('%Y%m%d%H%M%S')
+        viewer = User.objects.create(username=f'explain-{tag}', email=f'explain-{tag}@example.com',
+                                     is_staff=True, is_superuser=True)
+        viewer.profile.role = 'ORGANIZER'
+        viewer.profile.save()
+        User.objects.bulk_create(
+            [User(username=f'explain-{tag}-{n}', email=f'attendee{n}@example.com', password='!')
+             for n in range(options['users'])],
+            batch_size=1000,
+        )
+        users = list(User.objects.filter(username__startswith=f'explain-{tag}-').values_list('pk', 'email'))
+        users.append((viewer.pk, viewer.email))
+
+        category = EventCategory.objects.get_or_create(name='Explain')[0]
+        today = timezone.localdate()
+        organizers = [viewer.pk] + [pk for pk, _ in users[:20]]
+        events = Event.objects.bulk_create([
+            Event(organizer_id=organizers[i % len(organizers)], title=f'Explain event {i}', location='Hall',
+                  date=today + datetime.timedelta(days=i % 400 - 200), category=category,
+                  starts_at=Event.compute_starts_at(today + datetime.timedelta(days=i % 400 - 200), None))
+            for i in range(options['events'])
+        ], batch_size=1000)
+        events = list(Event.objects.filter(category=category).values_list('pk', flat=True))
+        TicketTier.objects.bulk_create(
+            [TicketTier(event_id=pk, name='General', price=10, capacity=10 ** 6) for pk in events], batch_size=1000,
+        )
+        tiers = dict(TicketTier.objects.filter(event_id__in=events).values_list('event_id', 'pk'))
+
+        # spread created_at over a year, as the analytics charts would see it
+        now = timezone.now()
+        created_at = Ticket._meta.get_field('created_at')
+        with mock.patch.object(created_at, 'auto_now_add', False):
+            batch = []
+            for n in range(options['tickets']):
+                user_pk, email = users[-1] if n % 500 == 0 else rng.choice(users)
+                event_pk = rng.choice(events)
+                batch.append(Ticket(
+                    event_id=event_pk, tier_id=tiers[event_pk], user_id=user_pk if n % 3 else None, email=email,
+                    quantity=1 + n % 3, total_amount=10 * (1 + n % 3),
+                    created_at=now - datetime.timedelta(minutes=rng.randrange(365 * 24 * 60)),
+                ))
+                if len(batch) >= 5000:
+                    Ticket.objects.bulk_create(batch)
+                    batch = []
+            Ticket.objects.bulk_create(batch)
+        # bulk inserts skip the rollup receivers
+        analytics.rebuild()
+        rsvp_users = [viewer.pk] + [pk for pk, _ in users[:5000]]
+        RSVP.objects.bulk_create(
+            [RSVP(user_id=user_pk, event_id=rng.choice(events), status='going')
+             for user_pk in rsvp_users for _ in range(5)],
+            batch_size=5000, ignore_conflicts=True,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f'Seeded {options["tickets"]} tickets, {len(events)} events, {len(users)} users '
+                          f'in {time.perf_counter() - started:.1f}s')
+        return viewer, events[0]
+
+    def existing(self):
+        """A superuser to browse as and an event to open, from the data already there."""
+        viewer = get_user_model().objects.filter(is_superuser=True).order_by('pk').first()
+        event_pk = Event.objects.order_by('pk').values_list('pk', flat=True).first()
+        if viewer is None or event_pk is None:
+            raise CommandError('--use-current-db needs a superuser and at least one event in the database.')
+        return viewer, event_pk
+
+    # -- capturing ---------------------------------------------------------------
+
+    def capture(self, viewer, event_pk):
+        """``[(view, sql, params, times_run)]`` for every distinct SELECT the main views run."""
+        pages = [
+            ('home', reverse('home')),
+            ('event_list', reverse('event_list')),
+            ('event_detail', reverse('event_detail', args=[event_pk])),
+            ('calendar', reverse('calendar')),
+            ('organizer_dashboard', reverse('organizer_dashboard')),
+            ('attendee_dashboard', reverse('attendee_dashboard')),
+            ('profile', reverse('profile')),
+            ('admin_analytics', reverse('admin_analytics')),
+            ('analytics_json', reverse('analytics_json')),
+        ]
+        client = Client()
+        client.force_login(viewer)
+        queries = []
+        for name, url in pages:
+            def record(execute, sql, params, many, context, name=name):
+                if sql.lstrip().upper().startswith('SELECT'):
+                    queries.append((name, sql, params))
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(record):
+                response = client.get(url)
+            if response.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'{name}: HTTP {response.status_code}'))
+        # the session/auth lookups are by primary key on every page; keep the app's own queries,
+        # once per distinct statement (an N+1 shows up as a repeat count)
+        distinct = {}
+        for name, sql, params in queries:
+            if 'django_session' in sql or 'FROM "auth_user"' in sql:
+                continue
+            entry = distinct.setdefault((name, sql), [name, sql, params, 0])
+            entry[3] += 1
+        return [tuple(entry) for entry in distinct.values()]
+
+    def explain(self, sql, params):
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            return [row[-1] for row in rows]
+        return [row[0] for row in rows]
+
+    def timed(self, sql, params, repeat):
+        best = None
+        with connection.cursor() as cursor:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                cursor.fetchall()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def set_hot_indexes(self, present):
+        with connection.schema_editor() as editor:
+            for model, name in HOT_INDEXES:
+                index = next(i for i in model._meta.indexes if i.name == name)
+                if present:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    # -- reporting ---------------------------------------------------------------
+
+    def run(self, options):
+        # only the throwaway test database gets seeded
+        viewer, event_pk = self.existing() if options['use_current_db'] else self.seed(options)
+        queries = self.capture(viewer, event_pk)
+        pattern = FULL_SCAN[connection.vendor]
+
+        flagged = 0
+        for name, sql, params, count in queries:
+            plan = self.explain(sql, params)
+            scans = sorted({m.group(1) for line in plan for m in [pattern.search(line.strip())] if m})
+            flagged += bool(scans)
+            label = self.style.ERROR(f'FULL SCAN {", ".join(scans)}') if scans else self.style.SUCCESS('indexed')
+            repeats = self.style.WARNING(f' (run {count}x: N+1?)') if count > 1 else ''
+            self.stdout.write(f'[{name}] {label}{repeats}\n    {sql[:160]}')
+            for line in plan:
+                self.stdout.write(f'      {line}')
+
+        if options['compare']:
+            self.stdout.write('\nTimings (best of %d), without -> with the hot-path indexes:' % options['repeat'])
+            self.set_hot_indexes(False)
+            before = [self.timed(sql, params, options['repeat']) for _, sql, params, _ in queries]
+            self.set_hot_indexes(True)
+            after = [self.timed(sql, params, options['repeat']) for _, sql, params, _ in queries]
+            for (name, sql, _, _), b, a in zip(queries, before, after):
+                self.stdout.write(f'  {name:<20} {b * 1000:9.2f} ms -> {a * 1000:9.2f} ms  x{b / max(a, 1e-9):7.1f}  '
+                                  f'{sql[:70]}')
+            self.stdout.write(f'  median speed-up x{statistics.median(b / max(a, 1e-9) for b, a in zip(before, after)):.1f}; '
+                              f'total {sum(before) * 1000:.0f} ms -> {sum(after) * 1000:.0f} ms')
+
+        summary = f'{len(queries)} queries explained, {flagged} with a full-table scan.'
+        self.stdout.write(self.style.WARNING(summary) if flagged else self.style.SUCCESS(summary))
@@ -1,23 +1,153 @@
+import datetime
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
 from django.utils import timezone
-from myapp08.models import Ticket
-from myapp08.utils_certificates import generate_certificate_pdf, _send_certificate_email
+
+from myapp08 import outbox
+from myapp08.fulfillment import certificate_filename, claim_certificates
+from myapp08.models import BatchCheckpoint, Ticket
+from myapp08.utils_certificates import (
+    DEFAULT_TEMPLATE,
+    certificate_fields,
+    default_issuer,
+    init_pool_worker,
+    render_item,
+)
+
 
 class Command(BaseCommand):
-    help = 'Generate certificates for tickets for events that have completed and have no certificate yet.'
+    help = ('Generate certificates for tickets of events that have completed and have no certificate yet. '
+            'Renders in a process pool, writes in chunks and resumes from the last checkpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', type=int, help='Only tickets for this event id.')
+        parser.add_argument('--since', type=datetime.date.fromisoformat,
+                            help='Only events on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Render processes (default: number of CPU cores).')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Tickets per chunk / checkpoint.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be generated.')
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate certificates that already exist, unless claimed within the job lease.')
+        parser.add_argument('--no-email', action='store_true', help='Write files but do not queue certificate emails.')
+        parser.add_argument('--restart', action='store_true', help='Ignore the saved checkpoint and start over.')
+
+    def _queryset(self, options):
+        qs = Ticket.objects.filter(event__date__lt=timezone.localdate())
+        if options['event']:
+            qs = qs.filter(event_id=options['event'])
+        if options['since']:
+            qs = qs.filter(event__date__gte=options['since'])
+        if not options['force']:
+            qs = qs.filter(Q(certificate_file='') | Q(certificate_file__isnull=True))
+        return qs.select_related('event', 'user').order_by('pk')
+
+    def _checkpoint_name(self, options):
+        parts = ['generate_certificates', f"event={options['event'] or '*'}", f"since={options['since'] or '*'}"]
+        if options['force']:
+            parts.append('force')
+        return ':'.join(parts)
 
     def handle(self, *args, **options):
-        today = timezone.localdate()
-      
-        tickets_qs = Ticket.objects.filter(event__date__lt=today).exclude(certificate__isnull=False)
-        count = 0
-        for ticket in tickets_qs:
-            try:
-                cert, _ = generate_certificate_pdf(ticket)
-                _send_certificate_email(ticket, cert)
-                count += 1
-                self.stdout.write(self.style.SUCCESS(f'Generated+emailed cert for ticket {ticket.id}'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'Failed for ticket {ticket.id}: {e}'))
-        self.stdout.write(self.style.SUCCESS(f'Done — {count} certificates generated.'))
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive.')
+
+        qs = self._queryset(options)
+        checkpoint, _ = BatchCheckpoint.objects.get_or_create(name=self._checkpoint_name(options))
+        if options['restart']:
+            checkpoint.position = 0
+            checkpoint.processed = 0
+            checkpoint.save()
+        elif checkpoint.position:
+            self.stdout.write(f'Resuming after ticket id {checkpoint.position} '
+                              f'({checkpoint.processed} done in earlier runs).')
+
+        remaining = qs.filter(pk__gt=checkpoint.position)
+        if options['dry_run']:
+            total = remaining.count()
+            self.stdout.write(self.style.SUCCESS(f'Dry run — {total} certificate(s) would be generated.'))
+            return
+
+        issuer = default_issuer()
+        base_url = getattr(settings, 'SITE_URL', 'http://127.0.0.1:8000/')
+        workers = options['workers']
+        chunk_size = options['chunk_size']
+
+        pool = None
+        if workers > 1:
+            # pool processes never touch the DB, but don't hand them our open connection
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker)
+
+        count = failed = queued = 0
+        started = time.perf_counter()
+        try:
+            while True:
+                chunk = list(remaining.filter(pk__gt=checkpoint.position)[:chunk_size])
+                if not chunk:
+                    break
+                chunk_started = time.perf_counter()
+                # the same claim as fulfillment: a ticket another run is rendering
+                # (or has stored since the SELECT) is left to it
+                tickets = claim_certificates(chunk, force=options['force'])
+
+                items = [
+                    (t.pk, certificate_fields(t), t.event.certificate_template or DEFAULT_TEMPLATE, issuer)
+                    for t in tickets
+                ]
+                if pool:
+                    rendered = dict(pool.map(render_item, items, chunksize=max(1, len(items) // (workers * 4))))
+                else:
+                    rendered = dict(map(render_item, items))
+
+                written = []
+                for ticket in tickets:
+                    try:
+                        if ticket.certificate_file:
+                            ticket.certificate_file.delete(save=False)
+                        ticket.certificate_file.save(
+                            certificate_filename(ticket), ContentFile(rendered[ticket.pk]), save=False,
+                        )
+                        written.append(ticket)
+                    except Exception as e:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(f'Failed for ticket {ticket.id}: {e}'))
+                # files, emails and checkpoint commit together: a crash mid-chunk loses
+                # no emails and sends none twice; its claims lapse after the job lease
+                # and the next run renders those tickets again
+                with transaction.atomic():
+                    Ticket.objects.bulk_update(written, ['certificate_file'])
+                    if not options['no_email']:
+                        queued += len(outbox.add_many(outbox.KIND_CERTIFICATE, written, base_url=base_url))
+                    checkpoint.position = chunk[-1].pk
+                    checkpoint.processed += len(written)
+                    checkpoint.save(update_fields=['position', 'processed', 'updated_at'])
+                count += len(written)
+
+                elapsed = time.perf_counter() - chunk_started
+                self.stdout.write(
+                    f'  chunk up to ticket {checkpoint.position}: {len(written)} in {elapsed:.2f}s '
+                    f'({len(written) / elapsed if elapsed else 0:.0f}/s)'
+                )
+        finally:
+            if pool:
+                pool.shutdown()
+
+        # finished cleanly: the next run starts from the beginning of the (new) backlog
+        checkpoint.delete()
+
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Done — {count} certificates generated in {elapsed:.2f}s ({rate:.0f} certificates/s, '
+            f'{workers} worker(s)); {failed} failed.'
+        ))
+        if not options['no_email']:
+            self.stdout.write(f'{queued} certificate email(s) queued; run `manage.py drain_outbox` to deliver them.')
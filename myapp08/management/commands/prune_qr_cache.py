@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp08 import qr
+
+
+class Command(BaseCommand):
+    help = ('Trim the on-disk QR code cache (media/qr_cache/ by default) to a size limit, deleting the '
+            'oldest files first. Deleted codes are rendered again on their next request.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-mb', type=float, default=getattr(settings, 'QR_CACHE_MAX_MB', 256),
+                            help='Size to keep the cache under, in MB (default: QR_CACHE_MAX_MB, 256).')
+
+    def handle(self, *args, **options):
+        if options['max_mb'] < 0:
+            raise CommandError("--max-mb can't be negative.")
+        started = time.perf_counter()
+        deleted, freed = qr.prune(int(options['max_mb'] * 1024 * 1024))
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} cached QR code(s), {freed / 1024 / 1024:.1f} MB, '
+            f'in {time.perf_counter() - started:.2f}s.'
+        ))
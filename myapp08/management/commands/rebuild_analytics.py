@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp08 import analytics
+
+
+class Command(BaseCommand):
+    help = ('Recompute the analytics rollups (EventStats / EventDailyStats) from the Ticket table, '
+            'streaming tickets in primary-key chunks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(count):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {count} ticket(s) read')
+
+        count = analytics.rebuild(chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rolled up {count} ticket(s) in {time.perf_counter() - started:.2f}s.'
+        ))
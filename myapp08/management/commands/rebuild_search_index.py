@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp08 import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text event search index from the Event table (SQLite FTS5).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        kind = search.backend()
+        if kind != 'fts5':
+            self.stdout.write(f'Search backend is "{kind}"; it reads the Event table directly, nothing to rebuild.')
+            return
+        started = time.perf_counter()
+        count = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {count} event(s) in {time.perf_counter() - started:.2f}s.'
+        ))
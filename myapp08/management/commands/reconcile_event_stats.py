@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp08 import analytics
+
+
+class Command(BaseCommand):
+    help = ('Recount every event\'s sales and RSVP counters (EventStats) from its tickets and RSVPs, '
+            'a chunk of events at a time, and repair any drift.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Events recounted per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(last_event, drifted):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  up to event {last_event}: {drifted} drifted so far')
+
+        drifted = analytics.reconcile(
+            chunk_size=options['chunk_size'], repair=not options['dry_run'], progress=progress,
+        )
+        for event_id, diff in drifted[:50]:
+            changes = ', '.join(f'{name} {stored} -> {actual}' for name, (stored, actual) in diff.items())
+            self.stdout.write(f'event {event_id}: {changes}')
+        if len(drifted) > 50:
+            self.stdout.write(f'... and {len(drifted) - 50} more')
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        style = self.style.WARNING if drifted and options['dry_run'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f'{verb} {len(drifted)} drifted event(s) in {time.perf_counter() - started:.2f}s.'
+        ))
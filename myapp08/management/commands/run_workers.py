@@ -0,0 +1,102 @@
+import multiprocessing
+import signal
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _worker_loop(batch, poll_interval, stop_event):
+    # a spawned child (macOS, Windows) starts with an empty app registry; a forked one already has it
+    django.setup()
+    from myapp08 import jobs
+
+    # each process needs its own DB connection; never reuse the parent's socket
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = jobs.worker_id()
+    while not stop_event.is_set():
+        try:
+            processed = jobs.work_batch(worker, limit=batch)
+        except Exception:
+            # DB hiccup (e.g. SQLite "database is locked"); back off and retry
+            connections.close_all()
+            processed = 0
+        if not processed:
+            stop_event.wait(poll_interval)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers (ticket fulfillment, emails, ...) from the DB-backed queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker processes.')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed per poll.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when idle.')
+        parser.add_argument('--once', action='store_true', help='Process all due jobs in this process and exit.')
+        parser.add_argument('--sweep-interval', type=float, default=getattr(settings, 'SEAT_HOLD_SWEEP_INTERVAL', 15),
+                            help='Seconds between releases of expired seat holds (0 to leave them to sweep_holds).')
+
+    def _sweep_holds(self):
+        # expired holds keep counting against availability until they are swept
+        from myapp08 import inventory
+
+        try:
+            released = inventory.sweep_expired_holds()
+        except Exception as e:
+            # DB hiccup (e.g. SQLite "database is locked"); the next sweep picks the holds up
+            self.stdout.write(self.style.WARNING(f'Hold sweep failed: {e}'))
+            connections.close_all()
+            return
+        if released:
+            self.stdout.write(f'Released {released} expired seat hold(s).')
+
+    def handle(self, *args, **options):
+        from myapp08 import jobs
+
+        sweep_interval = options['sweep_interval']
+        if options['once']:
+            count = jobs.drain(limit=options['batch'])
+            if sweep_interval > 0:
+                self._sweep_holds()
+            self.stdout.write(self.style.SUCCESS(f'Processed {count} job(s).'))
+            return
+
+        n = max(1, options['workers'])
+        stop_event = multiprocessing.Event()
+        worker_args = (options['batch'], options['poll_interval'], stop_event)
+
+        def spawn():
+            # a forked child must not inherit the parent's open DB connections
+            connections.close_all()
+            p = multiprocessing.Process(target=_worker_loop, args=worker_args, daemon=True)
+            p.start()
+            return p
+
+        def shutdown(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        procs = [spawn() for _ in range(n)]
+        self.stdout.write(self.style.SUCCESS(f'Started {n} worker process(es). Ctrl+C to stop.'))
+
+        next_sweep = time.monotonic()
+        while not stop_event.is_set():
+            if sweep_interval > 0 and time.monotonic() >= next_sweep:
+                self._sweep_holds()
+                next_sweep = time.monotonic() + sweep_interval
+            # replace any worker that died; its claimed jobs come back after the visibility timeout
+            for i, p in enumerate(procs):
+                if not p.is_alive():
+                    self.stdout.write(self.style.WARNING(f'Worker pid {p.pid} exited ({p.exitcode}); restarting.'))
+                    procs[i] = spawn()
+            time.sleep(1)
+
+        for p in procs:
+            p.join(timeout=30)
+        self.stdout.write(self.style.SUCCESS('Workers stopped.'))
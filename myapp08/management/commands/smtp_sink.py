@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from myapp08.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Run a local SMTP server that accepts and discards mail (for benchmarks and local testing).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--connect-delay', type=float, default=0.0,
+                            help='Seconds to stall each new connection (simulates TLS + login).')
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['host'], options['port'], options['connect_delay'])
+        self.stdout.write(self.style.SUCCESS(
+            f"SMTP sink listening on {options['host']}:{sink.port}. Point EMAIL_HOST/EMAIL_PORT here "
+            f"with EMAIL_USE_TLS=False. Ctrl+C to stop."
+        ))
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.server_close()
+            self.stdout.write(f'{sink.messages} message(s) over {sink.connections} connection(s).')
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from myapp08 import inventory
+
+
+class Command(BaseCommand):
+    help = 'Release expired checkout seat holds back to their ticket tiers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Holds released per transaction.')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping until stopped.')
+        parser.add_argument('--interval', type=float, default=15.0, help='Seconds between sweeps (--loop).')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            try:
+                released = inventory.sweep_expired_holds(chunk_size=options['chunk_size'])
+            except Exception as e:
+                # DB hiccup (e.g. SQLite "database is locked"); the next sweep picks the holds up
+                if not options['loop']:
+                    raise
+                self.stdout.write(self.style.WARNING(f'Sweep failed: {e}'))
+                connections.close_all()
+                released = 0
+            if released or not options['loop']:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(self.style.SUCCESS(f'Released {released} expired hold(s) in {elapsed:.2f}s.'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0007_alter_rsvp_status_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='certificate_generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='email_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='qr_generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
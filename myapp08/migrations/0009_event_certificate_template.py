@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0008_ticket_fulfillment_markers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='certificate_template',
+            field=models.CharField(choices=[('classic', 'Classic (Participation)'), ('attendance', 'Attendance (bordered)')], default='classic', max_length=30),
+        ),
+    ]
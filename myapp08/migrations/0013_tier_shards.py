@@ -0,0 +1,44 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0012_seathold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seathold',
+            name='shard_slot',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tickettier',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='seathold',
+            name='status',
+            field=models.CharField(choices=[('active', 'Active'), ('claimed', 'Claimed')], default='active', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='TicketTierShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveIntegerField(default=0)),
+                ('sold', models.PositiveIntegerField(default=0)),
+                ('held', models.PositiveIntegerField(default=0)),
+                ('tier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='myapp08.tickettier')),
+            ],
+            options={
+                'ordering': ['tier', 'slot'],
+                'unique_together': {('tier', 'slot')},
+            },
+        ),
+    ]
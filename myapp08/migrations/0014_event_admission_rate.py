@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0013_tier_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='admission_rate',
+            field=models.PositiveIntegerField(default=0, help_text='Users let into booking per minute through the waiting room during an on-sale (0 = no waiting room).'),
+        ),
+    ]
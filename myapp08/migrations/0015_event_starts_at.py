@@ -0,0 +1,45 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_starts_at(apps, schema_editor):
+    # same rule as Event.compute_starts_at (historical models have no methods)
+    Event = apps.get_model('myapp08', 'Event')
+    batch = []
+    for event in Event.objects.only('date', 'time').iterator(chunk_size=1000):
+        value = datetime.datetime.combine(event.date, event.time or datetime.time.max)
+        event.starts_at = timezone.make_aware(value) if settings.USE_TZ else value
+        batch.append(event)
+        if len(batch) >= 1000:
+            Event.objects.bulk_update(batch, ['starts_at'])
+            batch = []
+    if batch:
+        Event.objects.bulk_update(batch, ['starts_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0014_event_admission_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='starts_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_starts_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='event',
+            name='starts_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['starts_at', 'id'], name='event_starts_at_id_idx'),
+        ),
+    ]
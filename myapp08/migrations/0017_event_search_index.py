@@ -0,0 +1,43 @@
+from django.db import OperationalError, migrations, transaction
+
+
+TABLE = 'myapp08_event_fts'
+
+
+def create_fts_index(apps, schema_editor):
+    # SQLite only: Postgres searches with its built-in full-text functions (see myapp08/search.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Event = apps.get_model('myapp08', 'Event')
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                    "title, location, description, tokenize = 'unicode61 remove_diacritics 2')"
+                )
+        except OperationalError:
+            # SQLite built without FTS5: no table, and search.py falls back to icontains
+            return
+        rows = Event.objects.values_list('pk', 'title', 'location', 'description').iterator(chunk_size=1000)
+        cursor.executemany(
+            f"INSERT INTO {TABLE} (rowid, title, location, description) VALUES (%s, %s, %s, %s)",
+            [[pk, title or '', location or '', description or ''] for pk, title, location, description in rows],
+        )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0016_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
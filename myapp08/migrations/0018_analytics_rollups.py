@@ -0,0 +1,63 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:47
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_rollups(apps, schema_editor):
+    # one grouped pass per table; later drift is repaired by `manage.py rebuild_analytics`
+    Ticket = apps.get_model('myapp08', 'Ticket')
+    EventStats = apps.get_model('myapp08', 'EventStats')
+    EventDailyStats = apps.get_model('myapp08', 'EventDailyStats')
+    totals = dict(tickets=Count('id'), attendees=Sum('quantity'), revenue=Sum('total_amount'))
+    EventStats.objects.bulk_create(
+        [EventStats(event_id=row.pop('event'), **row)
+         for row in Ticket.objects.order_by().values('event').annotate(**totals).iterator()],
+        batch_size=1000,
+    )
+    EventDailyStats.objects.bulk_create(
+        [EventDailyStats(event_id=row.pop('event'), **row)
+         for row in Ticket.objects.order_by().annotate(day=TruncDate('created_at'))
+         .values('event', 'day').annotate(**totals).iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0017_event_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventStats',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='myapp08.event')),
+                ('tickets', models.IntegerField(default=0)),
+                ('attendees', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-attendees'], name='eventstats_attendees_idx'), models.Index(fields=['-revenue'], name='eventstats_revenue_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EventDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('tickets', models.IntegerField(default=0)),
+                ('attendees', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='myapp08.event')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'event'], name='eventdailystats_day_idx')],
+                'unique_together': {('event', 'day')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
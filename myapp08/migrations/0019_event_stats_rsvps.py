@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-17 03:52
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rsvps(apps, schema_editor):
+    RSVP = apps.get_model('myapp08', 'RSVP')
+    EventStats = apps.get_model('myapp08', 'EventStats')
+    # bookings used to mark the buyer's RSVP with an out-of-choices "A"; it meant going
+    RSVP.objects.filter(status='A').update(status='going')
+    going = dict(
+        RSVP.objects.filter(status='going').order_by().values('event').annotate(n=Count('id')).values_list('event', 'n')
+    )
+    existing = list(EventStats.objects.filter(event__in=going))
+    for stats in existing:
+        stats.rsvps_going = going.pop(stats.event_id)
+    EventStats.objects.bulk_update(existing, ['rsvps_going'], batch_size=1000)
+    EventStats.objects.bulk_create(
+        [EventStats(event_id=event_id, rsvps_going=n) for event_id, n in going.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0018_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventstats',
+            name='rsvps_going',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='rsvp',
+            name='status',
+            field=models.CharField(choices=[('going', 'Going'), ('not_going', 'Not Going')], default='going', max_length=20),
+        ),
+        migrations.RunPython(backfill_rsvps, migrations.RunPython.noop),
+    ]
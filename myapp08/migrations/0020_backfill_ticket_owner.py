@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, F, OuterRef, Q, Subquery
+
+
+def backfill_ticket_owner(apps, schema_editor):
+    # same rule as ownership.reclaim, for every account at once: a ticket goes to the single
+    # account registered under its email unless that account already holds it
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Ticket = apps.get_model('myapp08', 'Ticket')
+    unique_emails = (
+        User.objects.exclude(email='').order_by().values('email')
+        .annotate(accounts=Count('pk')).filter(accounts=1).values('email')
+    )
+    account = User.objects.filter(email=OuterRef('email')).values('pk')[:1]
+    (
+        Ticket.objects.filter(email__in=unique_emails)
+        .filter(Q(user__isnull=True) | ~Q(user__email=F('email')))
+        .update(user=Subquery(account))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('myapp08', '0019_event_stats_rsvps'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ticket_owner, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def _config():
+    return getattr(settings, 'SEARCH_POSTGRES_CONFIG', 'english')
+
+
+def add_search_document(apps, schema_editor):
+    # Postgres only: a stored, GIN-indexed tsvector so searches don't run to_tsvector over
+    # every row (SQLite uses the FTS5 table of migration 0017)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    config = _config()
+    schema_editor.execute(
+        "ALTER TABLE myapp08_event ADD COLUMN IF NOT EXISTS search_document tsvector GENERATED ALWAYS AS ("
+        f"setweight(to_tsvector('{config}', coalesce(title, '')), 'A')"
+        f" || setweight(to_tsvector('{config}', coalesce(location, '')), 'B')"
+        f" || setweight(to_tsvector('{config}', coalesce(description, '')), 'D')"
+        ") STORED"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS event_search_document_idx ON myapp08_event USING GIN (search_document)"
+    )
+
+
+def drop_search_document(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS event_search_document_idx")
+        schema_editor.execute("ALTER TABLE myapp08_event DROP COLUMN IF EXISTS search_document")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp08', '0020_backfill_ticket_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_document, drop_search_document),
+    ]
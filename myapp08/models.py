@@ -5,17 +5,14 @@ import uuid
 import datetime
 
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 
-import qrcode
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import landscape, A4
-from reportlab.lib.units import cm
+from .utils_certificates import DEFAULT_TEMPLATE, TEMPLATE_CHOICES
 
 
 def event_media_upload_path(instance, filename):
@@ -51,6 +48,21 @@ class Event(models.Model):
     location   = models.CharField(max_length=255)
     image      = models.ImageField(upload_to="events/cover/", null=True, blank=True)
     category   = models.ForeignKey(EventCategory, on_delete=models.SET_NULL, null=True, blank=True)
+    certificate_template = models.CharField(max_length=30, choices=TEMPLATE_CHOICES, default=DEFAULT_TEMPLATE)
+    admission_rate = models.PositiveIntegerField(
+        default=0,
+        help_text="Users let into booking per minute through the waiting room during an on-sale (0 = no waiting room).",
+    )
+    # date + time as one indexed column, kept in sync by save(), so "upcoming"
+    # is a single range predicate and listings can seek on (starts_at, id)
+    starts_at = models.DateTimeField(editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["starts_at", "id"], name="event_starts_at_id_idx"),
+            # organizer dashboard: my events, newest first
+            models.Index(fields=["organizer", "date"], name="event_organizer_date_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -58,6 +70,19 @@ class Event(models.Model):
     def get_absolute_url(self):
         return reverse("event_detail", args=[self.pk])
 
+    @staticmethod
+    def compute_starts_at(date, time):
+        """Events without a time count as running to the end of their day."""
+        value = datetime.datetime.combine(date, time or datetime.time.max)
+        return timezone.make_aware(value) if settings.USE_TZ else value
+
+    def save(self, *args, **kwargs):
+        self.starts_at = self.compute_starts_at(self.date, self.time)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"date", "time"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "starts_at"}
+        super().save(*args, **kwargs)
+
 
 
 
@@ -102,14 +127,43 @@ class TicketTier(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     capacity = models.PositiveIntegerField(default=0)
     sold     = models.PositiveIntegerField(default=0)
+    # seats in unexpired SeatHolds (checkout in progress); see inventory.py
+    held     = models.PositiveIntegerField(default=0)
+    # >0: reservations are spread over this many TicketTierShard counters
+    shard_count = models.PositiveSmallIntegerField(default=0)
+
+    # moved only by inventory.py's guarded UPDATEs
+    COUNTERS = ("sold", "held", "shard_count")
 
     class Meta:
         unique_together = ("event", "name")
         ordering = ["price"]
 
+    def save(self, *args, **kwargs):
+        # an edit (admin, tier formset) must not write back counters it read
+        # before the sales that happened since
+        if not self._state.adding and not kwargs.get("force_insert") and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields if not f.primary_key and f.name not in self.COUNTERS
+            ]
+        # one transaction with the shard re-split a capacity change triggers (inventory.py)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     @property
     def available(self):
-        return max(self.capacity - self.sold, 0)
+        if 'seats_left' in self.__dict__:
+            # annotated by inventory.with_available()
+            return self.seats_left
+        taken = self.sold + self.held
+        if self.shard_count:
+            cache = getattr(self, '_prefetched_objects_cache', {})
+            if 'shards' in cache:
+                taken += sum(s.sold + s.held for s in cache['shards'])
+            else:
+                totals = self.shards.aggregate(sold=models.Sum('sold'), held=models.Sum('held'))
+                taken += (totals['sold'] or 0) + (totals['held'] or 0)
+        return max(self.capacity - taken, 0)
 
     def __str__(self):
         return f"{self.event.title} - {self.name}"
@@ -117,6 +171,67 @@ class TicketTier(models.Model):
 
 
 
+class TicketTierShard(models.Model):
+    """
+    One slot of a sharded tier's seat counter (see inventory.py). Each shard
+    owns ``capacity`` seats carved out of the tier, so reservations on
+    different shards never touch the same row.
+    """
+    tier = models.ForeignKey(TicketTier, on_delete=models.CASCADE, related_name="shards")
+    slot = models.PositiveSmallIntegerField()
+    capacity = models.PositiveIntegerField(default=0)
+    sold = models.PositiveIntegerField(default=0)
+    held = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("tier", "slot")
+        ordering = ["tier", "slot"]
+
+    def __str__(self):
+        return f"{self.tier} #{self.slot} ({self.sold + self.held}/{self.capacity})"
+
+
+
+
+class SeatHold(models.Model):
+    """
+    Seats set aside for a buyer between choosing a paid tier and paying.
+    Counted in ``TicketTier.held`` until converted into a Ticket or released
+    (expired holds are released by `manage.py run_workers` or `sweep_holds`).
+    """
+    STATUS_ACTIVE = "active"
+    # transient: set and deleted in the same transaction by whoever settles the hold
+    STATUS_CLAIMED = "claimed"
+    STATUS_CHOICES = (
+        (STATUS_ACTIVE, "Active"),
+        (STATUS_CLAIMED, "Claimed"),
+    )
+
+    tier = models.ForeignKey(TicketTier, on_delete=models.CASCADE, related_name="holds")
+    # shard whose ``held`` counts this hold; None = the tier row itself
+    shard_slot = models.PositiveSmallIntegerField(null=True, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
+    email = models.EmailField()
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "expires_at"], name="seathold_status_expires_idx"),
+        ]
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
+
+    def __str__(self):
+        return f"{self.quantity} x {self.tier} until {self.expires_at:%H:%M:%S}"
+
+
+
+
 class RSVP(models.Model):
     STATUS_CHOICES = (
         ("going", "Going"),
@@ -124,7 +239,7 @@ class RSVP(models.Model):
     )
     user  = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
-    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="A")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="going")
 
     class Meta:
         unique_together = ("user", "event")
@@ -151,10 +266,24 @@ class Ticket(models.Model):
     qr_image = models.ImageField(upload_to=ticket_qr_upload_path, null=True, blank=True)
     certificate_file = models.FileField(upload_to=ticket_certificate_upload_path, null=True, blank=True)
 
+    # fulfillment stage markers (see myapp08/fulfillment.py)
+    qr_generated_at = models.DateTimeField(null=True, blank=True)
+    certificate_generated_at = models.DateTimeField(null=True, blank=True)
+    email_sent_at = models.DateTimeField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # attendee dashboard / profile / certificate download: tickets by email or user, newest first
+            models.Index(fields=["email", "created_at"], name="ticket_email_created_idx"),
+            models.Index(fields=["user", "created_at"], name="ticket_user_created_idx"),
+            # per-event sales and analytics
+            models.Index(fields=["event", "created_at"], name="ticket_event_created_idx"),
+            # covers the per-day sums, so they read the index instead of the table
+            models.Index(fields=["created_at", "quantity", "total_amount"], name="ticket_created_sums_idx"),
+        ]
 
     def __str__(self):
         return f"{self.event.title} - {self.email}"
@@ -182,64 +311,141 @@ def ensure_profile(sender, instance, created, **kwargs):
 
 
 
-def _qr_bytes(payload):
-    img = qrcode.make(payload)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return buf.read()
 
-def _certificate_bytes(ticket):
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=landscape(A4))
-    width, height = landscape(A4)
+class Job(models.Model):
+    """Background job row; see myapp08/jobs.py for the queue API."""
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="job_status_run_after_idx"),
+            models.Index(fields=["status", "locked_until"], name="job_status_locked_until_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+
+
+
+class OutboxMessage(models.Model):
+    """
+    Email waiting to be delivered. Rows are written in the same transaction as
+    the data they announce and delivered by `manage.py drain_outbox`
+    (see myapp08/outbox.py).
+    """
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_DEAD = "dead"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENDING, "Sending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_DEAD, "Dead letter"),
+    )
+
+    kind = models.CharField(max_length=50)
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, null=True, blank=True, related_name="outbox_messages")
+    to_email = models.EmailField()
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} to {self.to_email} ({self.status})"
+
 
-    c.setFillColorRGB(0.97, 0.97, 1)
-    c.rect(20, 20, width-40, height-40, fill=1)
 
-    c.setFont("Helvetica-Bold", 36)
-    c.drawCentredString(width/2, height-100, "Certificate of Participation")
 
-    name = ticket.user.get_full_name() if ticket.user and ticket.user.get_full_name() else ticket.email
-    c.setFont("Helvetica-Bold", 26)
-    c.drawCentredString(width/2, height-180, name)
+class BatchCheckpoint(models.Model):
+    """Resume point for long-running batch commands (last processed primary key)."""
+    name = models.CharField(max_length=200, unique=True)
+    position = models.BigIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
 
-    c.setFont("Helvetica", 18)
-    date_str = ticket.event.date.strftime("%B %d, %Y")
-    c.drawCentredString(width/2, height-240, f"For participating in “{ticket.event.title}” on {date_str}")
 
-    c.showPage()
-    c.save()
 
-    buf.seek(0)
-    return buf.read()
 
+class EventStats(models.Model):
+    """
+    Running ticket and RSVP totals of one event (see analytics.py), bumped
+    in the transaction that creates each ticket or changes an RSVP;
+    `manage.py reconcile_event_stats` finds and repairs drift and
+    `manage.py rebuild_analytics` recomputes the ticket totals from scratch.
+    """
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    tickets = models.IntegerField(default=0)
+    attendees = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rsvps_going = models.IntegerField(default=0)
 
-@receiver(post_save, sender=Ticket)
-def post_ticket_created(sender, instance, created, **kwargs):
-    if not created:
-        return
+    class Meta:
+        indexes = [
+            models.Index(fields=["-attendees"], name="eventstats_attendees_idx"),
+            models.Index(fields=["-revenue"], name="eventstats_revenue_idx"),
+        ]
 
-    ticket = instance
+    def __str__(self):
+        return f"{self.event_id}: {self.attendees} attendees, {self.revenue}"
 
 
-    payload = f"EVT:{ticket.event.id}|TCK:{ticket.code}|EMAIL:{ticket.email}"
-    qr_data = _qr_bytes(payload)
-    ticket.qr_image.save(f"qr_{ticket.code}.png", ContentFile(qr_data), save=False)
 
-    cert_data = _certificate_bytes(ticket)
-    ticket.certificate_file.save(f"certificate_{ticket.code}.pdf", ContentFile(cert_data), save=False)
 
-    ticket.save()
+class EventDailyStats(models.Model):
+    """Ticket totals of one event on one (local) day of ticket creation; see EventStats."""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="daily_stats")
+    day = models.DateField()
+    tickets = models.IntegerField(default=0)
+    attendees = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
 
-    from django.core.mail import EmailMultiAlternatives
-    subject = f"Your Ticket & Certificate - {ticket.event.title}"
-    body = f"Thank you for registering for {ticket.event.title}. Your ticket and certificate are attached."
+    class Meta:
+        unique_together = ("event", "day")
+        indexes = [
+            models.Index(fields=["day", "event"], name="eventdailystats_day_idx"),
+        ]
 
-    msg = EmailMultiAlternatives(subject, body, settings.DEFAULT_FROM_EMAIL, [ticket.email])
-    msg.attach(f"certificate_{ticket.code}.pdf", cert_data, "application/pdf")
-    msg.attach(f"qr_{ticket.code}.png", qr_data, "image/png")
-    try:
-        msg.send(fail_silently=False)
-    except Exception as e:
-        print("EMAIL SENDING ERROR:", e)
+    def __str__(self):
+        return f"{self.event_id} {self.day}: {self.attendees} attendees, {self.revenue}"
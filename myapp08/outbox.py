@@ -0,0 +1,226 @@
+# myapp08/outbox.py
+"""
+Transactional email outbox.
+
+Code that wants an email sent writes an ``OutboxMessage`` row inside the same
+transaction as the data the email is about, so a committed booking always has
+its confirmation queued and a rolled-back one never does. Nothing talks to SMTP
+on the request path.
+
+``manage.py drain_outbox`` claims due rows with a guarded UPDATE (like the job
+queue), builds the messages, sends them in batches over one connection and
+records the result per row: sent, retried later with exponential backoff, or
+dead-lettered after ``OUTBOX_MAX_ATTEMPTS``. Delivery is at-least-once: a
+drainer that dies after the server accepted a batch but before the rows were
+marked sent will resend that batch once its lease expires.
+"""
+import datetime
+import logging
+import traceback
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import fulfillment
+from .jobs import backoff_delay, worker_id
+from .mail import MailDispatcher
+from .models import OutboxMessage, Ticket
+
+logger = logging.getLogger(__name__)
+
+KIND_CONFIRMATION = "ticket.confirmation"
+KIND_CERTIFICATE = "ticket.certificate"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def max_attempts():
+    return _setting('OUTBOX_MAX_ATTEMPTS', 8)
+
+
+def lease():
+    return datetime.timedelta(seconds=_setting('OUTBOX_LEASE', 300))
+
+
+def retry_delay(attempts):
+    return backoff_delay(
+        attempts,
+        base=_setting('OUTBOX_RETRY_BASE_DELAY', 30),
+        cap=_setting('OUTBOX_RETRY_MAX_DELAY', 6 * 3600),
+    )
+
+
+# -- building messages ---------------------------------------------------------
+
+def _ticket(message):
+    return Ticket.objects.select_related('event', 'tier', 'user').get(pk=message.ticket_id)
+
+
+def _build_confirmation(message):
+    ticket = _ticket(message)
+    qr_data = fulfillment.ensure_qr(ticket)
+    cert_data = fulfillment.ensure_certificate(ticket)
+    return fulfillment.build_confirmation_email(ticket, message.payload['base_url'], qr_data, cert_data)
+
+
+def _build_certificate(message):
+    ticket = _ticket(message)
+    cert_data = fulfillment.ensure_certificate(ticket)
+    return fulfillment.build_certificate_email(ticket, message.payload['base_url'], cert_data)
+
+
+# kind -> callable(OutboxMessage) -> EmailMessage
+BUILDERS = {
+    KIND_CONFIRMATION: _build_confirmation,
+    KIND_CERTIFICATE: _build_certificate,
+}
+
+
+def build(message):
+    builder = BUILDERS.get(message.kind)
+    if builder is None:
+        raise LookupError(f"No builder for outbox message kind '{message.kind}'")
+    email = builder(message)
+    email.to = [message.to_email]
+    return email
+
+
+# -- writing -------------------------------------------------------------------
+
+def add(kind, to_email, ticket=None, **payload):
+    """
+    Queue an email. Call inside the transaction that writes ``ticket`` so the
+    message commits (or rolls back) together with it.
+    """
+    return OutboxMessage.objects.create(kind=kind, ticket=ticket, to_email=to_email, payload=payload)
+
+
+def add_many(kind, tickets, **payload):
+    """Bulk variant of ``add`` for batch jobs: one message per ticket."""
+    return OutboxMessage.objects.bulk_create(
+        [OutboxMessage(kind=kind, ticket=t, to_email=t.email, payload=payload) for t in tickets]
+    )
+
+
+def requeue(queryset):
+    """Make messages (sent or dead ones included) deliverable again right away."""
+    return queryset.exclude(status=OutboxMessage.STATUS_SENDING).update(
+        status=OutboxMessage.STATUS_PENDING,
+        attempts=0,
+        next_attempt_at=timezone.now(),
+        locked_by='',
+        locked_until=None,
+        last_error='',
+    )
+
+
+# -- draining ------------------------------------------------------------------
+
+def _claimable(now):
+    # due, or claimed by a drainer whose lease ran out
+    return (
+        Q(status=OutboxMessage.STATUS_PENDING, next_attempt_at__lte=now)
+        | Q(status=OutboxMessage.STATUS_SENDING, locked_until__lt=now)
+    )
+
+
+def claim(worker, limit=50, queryset=None):
+    """Claim up to ``limit`` due messages for ``worker`` (one guarded UPDATE each)."""
+    now = timezone.now()
+    qs = queryset if queryset is not None else OutboxMessage.objects.all()
+    candidates = list(
+        qs.filter(_claimable(now)).order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for pk in candidates:
+        updated = OutboxMessage.objects.filter(_claimable(now), pk=pk).update(
+            status=OutboxMessage.STATUS_SENDING, locked_by=worker, locked_until=now + lease(),
+        )
+        if updated:
+            claimed.append(pk)
+            if len(claimed) >= limit:
+                break
+    return list(OutboxMessage.objects.filter(pk__in=claimed, locked_by=worker).order_by('next_attempt_at', 'id'))
+
+
+def _failed(message, worker, error):
+    attempts = message.attempts + 1
+    fields = {'attempts': attempts, 'last_error': error, 'locked_by': '', 'locked_until': None}
+    if attempts >= max_attempts():
+        fields['status'] = OutboxMessage.STATUS_DEAD
+        logger.error("Outbox message %s (%s to %s) dead-lettered after %d attempts",
+                     message.pk, message.kind, message.to_email, attempts)
+    else:
+        fields['status'] = OutboxMessage.STATUS_PENDING
+        fields['next_attempt_at'] = timezone.now() + retry_delay(attempts)
+        logger.warning("Outbox message %s (%s to %s) failed on attempt %d",
+                       message.pk, message.kind, message.to_email, attempts)
+    # guarded by locked_by: a drainer that lost its lease must not overwrite the new owner's result
+    OutboxMessage.objects.filter(pk=message.pk, locked_by=worker).update(**fields)
+
+
+def _sent(messages, worker):
+    now = timezone.now()
+    OutboxMessage.objects.filter(pk__in=[m.pk for m in messages], locked_by=worker).update(
+        status=OutboxMessage.STATUS_SENT, sent_at=now, last_error='', locked_by='', locked_until=None,
+    )
+    confirmed = [m.ticket_id for m in messages if m.kind == KIND_CONFIRMATION and m.ticket_id]
+    if confirmed:
+        Ticket.objects.filter(pk__in=confirmed, email_sent_at__isnull=True).update(email_sent_at=now)
+
+
+def deliver_batch(dispatcher, worker=None, limit=50, queryset=None):
+    """
+    Claim, build and send one batch. Returns ``(sent, failed)`` counts.
+    A message that can't be built (ticket deleted, render error) fails on its
+    own; an SMTP failure fails the whole batch it was sent in.
+    """
+    worker = worker or worker_id()
+    claimed = claim(worker, limit=limit, queryset=queryset)
+    if not claimed:
+        return 0, 0
+
+    built = {}
+    failed = 0
+    for message in claimed:
+        try:
+            built[message.pk] = build(message)
+        except Exception:
+            failed += 1
+            _failed(message, worker, traceback.format_exc())
+
+    pending = [m for m in claimed if m.pk in built]
+    undelivered = {id(e) for e in dispatcher.send(built[m.pk] for m in pending)}
+    delivered = []
+    for message in pending:
+        if id(built[message.pk]) in undelivered:
+            failed += 1
+            _failed(message, worker, "SMTP batch failed (see drainer log)")
+        else:
+            delivered.append(message)
+    if delivered:
+        _sent(delivered, worker)
+    return len(delivered), failed
+
+
+def drain(dispatcher=None, limit=50, max_batches=None, queryset=None):
+    """Deliver due messages until none are left. Returns ``(sent, failed)``."""
+    own = dispatcher is None
+    dispatcher = dispatcher or MailDispatcher()
+    worker = worker_id()
+    sent = failed = batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            s, f = deliver_batch(dispatcher, worker=worker, limit=limit, queryset=queryset)
+            if not s and not f:
+                break
+            sent += s
+            failed += f
+            batches += 1
+    finally:
+        if own:
+            dispatcher.close()
+    return sent, failed
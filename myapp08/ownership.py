@@ -0,0 +1,65 @@
+# myapp08/ownership.py
+"""
+Who a ticket belongs to.
+
+A ticket belongs to the account registered under the email it was issued
+to. Until that account exists, the buyer holds it (legacy rows may have no
+holder at all). ``Ticket.user`` stores that owner, so "my tickets" is one
+equality lookup on the ``(user, created_at)`` index instead of
+``user = me OR email = my email``, which no index can serve.
+
+The owner is resolved when the ticket is booked (``owner_for``). When an
+account signs up, every ticket issued to its email that is still held by
+nobody or by a buyer with a different email moves to it in one UPDATE
+(``reclaim``). Migration 0020 did the same for the existing tickets.
+Matching is exact, as the old ``email =`` lookups were. An email shared
+by several accounts matches none of them.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import profile_stats
+from .models import Ticket
+
+
+def _account(email):
+    """The single account registered with ``email``, or None."""
+    if not email:
+        return None
+    accounts = list(get_user_model().objects.filter(email=email).order_by()[:2])
+    return accounts[0] if len(accounts) == 1 else None
+
+
+def owner_for(email, buyer=None):
+    """The account a ticket issued to ``email`` by ``buyer`` belongs to (None if nobody)."""
+    if buyer is not None and not buyer.is_authenticated:
+        buyer = None
+    if buyer is not None and buyer.email == email:
+        return buyer
+    return _account(email) or buyer
+
+
+def held_for_others(email):
+    """Tickets issued to ``email`` that its account doesn't hold yet."""
+    return Ticket.objects.filter(email=email).filter(Q(user__isnull=True) | ~Q(user__email=email))
+
+
+def reclaim(user):
+    """Move the tickets issued to ``user.email`` to ``user``. Returns how many moved."""
+    if not user.email or _account(user.email) != user:
+        return 0
+    tickets = held_for_others(user.email)
+    holders = set(tickets.values_list("user_id", flat=True).distinct())
+    moved = tickets.update(user=user)
+    if moved:
+        transaction.on_commit(lambda: profile_stats.invalidate(user.pk, *holders))
+    return moved
+
+
+@receiver(post_save, sender=get_user_model(), dispatch_uid="myapp08.ownership.reclaim_on_signup")
+def _account_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        reclaim(instance)
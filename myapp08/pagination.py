@@ -0,0 +1,81 @@
+# myapp08/pagination.py
+"""
+Keyset (seek) pagination for event listings, ordered by ``(starts_at, id)``.
+
+OFFSET pagination makes the database read and throw away every row before
+the page, and needs a COUNT for the page total, so deep pages get slower as
+the table grows. Here a page is "the next N rows after the last one shown":
+
+    WHERE starts_at >= :ts AND NOT (starts_at = :ts AND id <= :id)
+    ORDER BY starts_at, id LIMIT N + 1
+
+which is a range scan on the ``(starts_at, id)`` index, so page 500 costs
+the same as page one. The extra row tells whether there is a next page.
+Cursors (``?after=`` / ``?before=``) are ``<microseconds since epoch>.<id>``
+of the boundary row.
+"""
+import datetime
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode(event):
+    micros = (event.starts_at - EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{micros}.{event.pk}"
+
+
+def decode(cursor):
+    """``(starts_at, id)`` from a cursor, or None if it is missing or malformed."""
+    try:
+        micros, pk = cursor.split(".")
+        return EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbours (``None`` at either end)."""
+
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        return encode(self.object_list[-1]) if self.has_next and self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return encode(self.object_list[0]) if self.has_previous and self.object_list else None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+def paginate(request, queryset, per_page):
+    """The page of ``queryset`` selected by the request's ``after``/``before`` cursor."""
+    before = decode(request.GET.get("before"))
+    if before:
+        starts_at, pk = before
+        rows = list(
+            queryset.filter(starts_at__lte=starts_at).exclude(starts_at=starts_at, pk__gte=pk)
+            .order_by("-starts_at", "-pk")[:per_page + 1]
+        )
+        return KeysetPage(rows[:per_page][::-1], has_next=True, has_previous=len(rows) > per_page)
+
+    after = decode(request.GET.get("after"))
+    if after:
+        starts_at, pk = after
+        queryset = queryset.filter(starts_at__gte=starts_at).exclude(starts_at=starts_at, pk__lte=pk)
+    rows = list(queryset.order_by("starts_at", "pk")[:per_page + 1])
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=after is not None)
@@ -0,0 +1,101 @@
+# myapp08/profile_stats.py
+"""
+Per-user booking statistics for the profile page.
+
+``get(user)`` returns bookings, tickets, spend and distinct events, each
+split into upcoming and past, from one query over the user's tickets
+(the owner index, see ownership.py) grouped on "event still to come".
+It also counts the user's going RSVPs. The result is cached per user
+under the ``"profile"`` namespace (caching.py), with a version per user:
+
+- a ticket saved or deleted for the user bumps it;
+- an RSVP change bumps it;
+- a ticket reclaimed on signup bumps it (ownership.py).
+
+Every event moves from upcoming to past at its start, so an entry never
+outlives the next start among the user's upcoming events.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, Min, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics, caching
+from .models import RSVP, Ticket
+
+NAMESPACE = "profile"
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _user_namespace(user_id):
+    return f"{NAMESPACE}:{user_id}"
+
+
+def invalidate(*user_ids):
+    for user_id in user_ids:
+        if user_id:
+            caching.bump(_user_namespace(user_id))
+
+
+def compute(user_id):
+    now = timezone.now()
+    rows = (
+        Ticket.objects.filter(user_id=user_id).order_by()
+        .values(upcoming=ExpressionWrapper(Q(event__starts_at__gte=now), output_field=BooleanField()))
+        .annotate(
+            bookings=Count("pk"),
+            tickets=Sum("quantity"),
+            spent=Sum("total_amount"),
+            events=Count("event", distinct=True),
+            next_start=Min("event__starts_at"),
+        )
+    )
+    stats = {
+        "bookings": 0, "tickets": 0, "spent": Decimal("0"), "events": 0,
+        "upcoming_bookings": 0, "past_bookings": 0, "upcoming_events": 0, "past_events": 0,
+        "next_start": None,
+    }
+    for row in rows:
+        # an event is either upcoming or past, so the per-group distinct counts add up
+        for name in ("bookings", "tickets", "spent", "events"):
+            stats[name] += row[name] or 0
+        prefix = "upcoming" if row["upcoming"] else "past"
+        stats[f"{prefix}_bookings"] = row["bookings"]
+        stats[f"{prefix}_events"] = row["events"]
+        if row["upcoming"]:
+            stats["next_start"] = row["next_start"]
+    stats["rsvps_going"] = RSVP.objects.filter(user_id=user_id, status=analytics.RSVP_GOING).count()
+    return stats
+
+
+def _timeout(stats):
+    ttl = _setting("PROFILE_STATS_TTL", 600)
+    if stats["next_start"] is not None:
+        ttl = min(ttl, max(1, int((stats["next_start"] - timezone.now()).total_seconds()) + 1))
+    return ttl
+
+
+def get(user):
+    """Cached booking statistics of ``user`` (see module docstring for the keys)."""
+    stats, _hit = caching.get_or_set(
+        NAMESPACE, (user.pk, "stats"), lambda: compute(user.pk),
+        timeout=_timeout, namespace_version=caching.version(_user_namespace(user.pk)),
+    )
+    return stats
+
+
+@receiver(post_save, sender=Ticket, dispatch_uid="myapp08.profile_stats.ticket_saved")
+@receiver(post_delete, sender=Ticket, dispatch_uid="myapp08.profile_stats.ticket_deleted")
+@receiver(post_save, sender=RSVP, dispatch_uid="myapp08.profile_stats.rsvp_saved")
+@receiver(post_delete, sender=RSVP, dispatch_uid="myapp08.profile_stats.rsvp_deleted")
+def _changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # after commit: a reader must not cache the pre-commit state under the new version
+        transaction.on_commit(lambda: invalidate(instance.user_id))
@@ -0,0 +1,234 @@
+# myapp08/qr.py
+"""
+Lazy, cached e-ticket QR codes.
+
+QR images are rendered on first request (ticket page, door scanner, the
+confirmation email) rather than on every booking. The symbol uses a fixed
+version, error-correction level and mask pattern, so ``qrcode`` skips its
+best-fit search and the scoring of all eight masks (most of its run time),
+and the module matrix is serialised directly:
+
+* SVG: one stroked ``<path>`` of horizontal runs (~4 KB for a ticket).
+* PNG: 1-bit greyscale written with ``zlib``, no PIL image involved.
+
+Output is a pure function of (payload, settings), so it is cached under a
+content key: in-process in an LRU, and on the default storage so other
+workers and restarts reuse it. The same key is the strong ETag. The disk
+tier only grows; ``manage.py prune_qr_cache`` trims it to QR_CACHE_MAX_MB,
+oldest files first (they are rendered again on demand).
+"""
+import hashlib
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from qrcode import constants
+from qrcode.exceptions import DataOverflowError
+
+
+FORMATS = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+
+_ERROR_CORRECTION = {
+    "L": constants.ERROR_CORRECT_L,
+    "M": constants.ERROR_CORRECT_M,
+    "Q": constants.ERROR_CORRECT_Q,
+    "H": constants.ERROR_CORRECT_H,
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _params():
+    return (
+        _setting('QR_VERSION', 8),
+        _setting('QR_ERROR_CORRECTION', 'M'),
+        _setting('QR_BOX_SIZE', 8),
+        _setting('QR_BORDER', 4),
+        _setting('QR_MASK_PATTERN', 2),
+    )
+
+
+# -- rendering -----------------------------------------------------------------
+
+def matrix(payload):
+    """Module matrix (border included) as a list of rows of bools."""
+    version, level, _, border, mask = _params()
+    options = {'error_correction': _ERROR_CORRECTION[level], 'border': border, 'mask_pattern': mask}
+    code = qrcode.QRCode(version=version, **options)
+    code.add_data(payload)
+    try:
+        code.make(fit=False)
+    except DataOverflowError:
+        # unusually long payload (e.g. a very long email): grow instead of failing
+        code = qrcode.QRCode(version=None, **options)
+        code.add_data(payload)
+        code.make(fit=True)
+    return code.get_matrix()
+
+
+def to_svg(rows):
+    """
+    One stroked path of horizontal runs; within a row each run is a relative
+    move from the end of the previous one, which keeps the markup small.
+    """
+    size = len(rows)
+    parts = []
+    for y, row in enumerate(rows):
+        pen = None
+        run_start = None
+        for i, dark in enumerate(list(row) + [False]):
+            if dark and run_start is None:
+                run_start = i
+            elif not dark and run_start is not None:
+                if pen is None:
+                    parts.append(f"M{run_start} {y}.5h{i - run_start}")
+                else:
+                    parts.append(f"m{run_start - pen} 0h{i - run_start}")
+                pen = i
+                run_start = None
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path stroke="#000" d="{"".join(parts)}"/></svg>'
+    ).encode("ascii")
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def to_png(rows, scale):
+    """1-bit greyscale PNG, each module ``scale`` pixels square."""
+    size = len(rows) * scale
+    pad = -size % 8
+    raw = bytearray()
+    for row in rows:
+        # greyscale bit depth 1: 0 is black, 1 is white
+        bits = "".join(("0" if dark else "1") * scale for dark in row) + "1" * pad
+        line = b"\x00" + int(bits, 2).to_bytes((size + pad) // 8, "big")
+        raw += line * scale
+    header = struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", header),
+        _png_chunk(b"IDAT", zlib.compress(bytes(raw), 6)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+
+def build(payload, fmt):
+    """Render without any caching."""
+    rows = matrix(payload)
+    if fmt == "svg":
+        return to_svg(rows)
+    return to_png(rows, _params()[2])
+
+
+# -- caching -------------------------------------------------------------------
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_memory = _LRU(_setting('QR_MEMORY_CACHE_SIZE', 512))
+
+
+def cache_key(payload, fmt):
+    raw = "|".join(str(p) for p in _params()) + f"|{fmt}|{payload}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def etag(key):
+    return f'"{key[:32]}"'
+
+
+def _path(key, fmt):
+    return f"{_setting('QR_CACHE_DIR', 'qr_cache')}/{key[:2]}/{key}.{fmt}"
+
+
+def get(payload, fmt="png"):
+    """QR image bytes for ``payload``: memory, then disk, then render."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported QR format '{fmt}'")
+    key = cache_key(payload, fmt)
+    data = _memory.get(key)
+    if data is not None:
+        return data
+
+    path = _path(key, fmt)
+    try:
+        with default_storage.open(path, "rb") as fh:
+            data = fh.read()
+    except FileNotFoundError:
+        data = build(payload, fmt)
+        try:
+            stored = default_storage.save(path, ContentFile(data))
+            if stored != path:
+                # a concurrent request stored it first and the storage picked a new
+                # name for ours: the same bytes, which nothing would ever read
+                default_storage.delete(stored)
+        except OSError:
+            # the memory copy is enough
+            pass
+    _memory.put(key, data)
+    return data
+
+
+def prune(max_bytes):
+    """
+    Delete the oldest files of the disk tier until it holds at most
+    ``max_bytes``. Returns ``(files deleted, bytes freed)``.
+    """
+    root = _setting('QR_CACHE_DIR', 'qr_cache')
+    try:
+        dirs, _ = default_storage.listdir(root)
+    except FileNotFoundError:
+        return 0, 0
+    files = []
+    for directory in dirs:
+        for filename in default_storage.listdir(f"{root}/{directory}")[1]:
+            name = f"{root}/{directory}/{filename}"
+            files.append((default_storage.get_modified_time(name), default_storage.size(name), name))
+    excess = sum(size for _, size, _ in files) - max_bytes
+    deleted = freed = 0
+    for _, size, name in sorted(files):
+        if freed >= excess:
+            break
+        default_storage.delete(name)
+        deleted += 1
+        freed += size
+    return deleted, freed
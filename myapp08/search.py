@@ -0,0 +1,220 @@
+# myapp08/search.py
+"""
+Full-text event search.
+
+On SQLite the index is an FTS5 virtual table (``myapp08_event_fts``, rowid =
+event id, created by migration 0017). It is kept in sync incrementally from
+Event's ``post_save``/``post_delete`` signals, inside the transaction that
+wrote the event, and can be rebuilt with ``manage.py rebuild_search_index``.
+Queries are ranked with bm25 (title > location > description), every term
+is a prefix match, and matches come back highlighted.
+
+On Postgres the same API runs on the built-in full-text search: a stored
+``search_document`` tsvector column with a GIN index (migration 0021,
+weighted like bm25 above, built with SEARCH_POSTGRES_CONFIG at migration
+time), prefix tsquery, ``ts_rank`` and ``ts_headline``. Elsewhere, or if
+SQLite was built without FTS5 (migration 0017 then skips the table), it
+degrades to ``icontains`` filters.
+
+Highlighted fragments are HTML-escaped before the ``<mark>`` tags are put
+in, so they are safe to render.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+TABLE = "myapp08_event_fts"
+COLUMNS = ("title", "location", "description")
+# bm25 column weights, in COLUMNS order
+WEIGHTS = (10.0, 4.0, 1.0)
+
+# highlight markers that can't occur in event text; swapped for <mark> after escaping
+_OPEN, _CLOSE = "\x02", "\x03"
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+_fts_tables = {}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def backend():
+    """``'fts5'``, ``'postgres'`` or ``'like'`` for the default database."""
+    if connection.vendor == "postgresql":
+        return "postgres"
+    if connection.vendor == "sqlite":
+        name = str(connection.settings_dict["NAME"])
+        if name not in _fts_tables:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+                _fts_tables[name] = cursor.fetchone() is not None
+        if _fts_tables[name]:
+            return "fts5"
+    return "like"
+
+
+def terms(query):
+    """Words of a user query (punctuation and FTS operators are dropped)."""
+    return _TERM.findall(query or "")[:_setting("SEARCH_MAX_TERMS", 8)]
+
+
+def _highlight(text):
+    return mark_safe(escape(text).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+
+# -- index maintenance (FTS5) -------------------------------------------------
+
+def _row(event):
+    return [event.pk] + [getattr(event, column) or "" for column in COLUMNS]
+
+
+def index_events(events):
+    """(Re)index ``events``; a no-op unless the FTS5 backend is active."""
+    if backend() != "fts5":
+        return
+    rows = [_row(e) for e in events]
+    if rows:
+        unindex([r[0] for r in rows])
+        _insert(rows)
+
+
+def _insert(rows):
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {TABLE} (rowid, {', '.join(COLUMNS)}) VALUES (%s, %s, %s, %s)", rows)
+
+
+def unindex(event_ids):
+    if backend() != "fts5" or not event_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [[pk] for pk in event_ids])
+
+
+def rebuild(chunk_size=1000):
+    """Re-index every event from scratch. Returns the number indexed."""
+    if backend() != "fts5":
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    count = 0
+    batch = []
+    for event in Event.objects.only(*COLUMNS).order_by("pk").iterator(chunk_size=chunk_size):
+        batch.append(_row(event))
+        if len(batch) >= chunk_size:
+            _insert(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        _insert(batch)
+        count += len(batch)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return count
+
+
+@receiver(post_save, sender=Event, dispatch_uid="myapp08.search.index_event")
+def _event_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_events([instance])
+
+
+@receiver(post_delete, sender=Event, dispatch_uid="myapp08.search.unindex_event")
+def _event_deleted(sender, instance, **kwargs):
+    unindex([instance.pk])
+
+
+# -- querying -----------------------------------------------------------------
+
+def _fts5(words, limit):
+    match = " ".join(f'"{w}"*' for w in words)
+    weights = ", ".join(str(w) for w in WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, highlight({TABLE}, 0, %s, %s), snippet({TABLE}, 2, %s, %s, '…', 16),"
+            f" bm25({TABLE}, {weights}) AS score"
+            f" FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY score LIMIT %s",
+            [_OPEN, _CLOSE, _OPEN, _CLOSE, match, limit],
+        )
+        rows = cursor.fetchall()
+    # bm25 is "lower is better"; expose a positive relevance
+    return [(pk, title, snippet, -score) for pk, title, snippet, score in rows]
+
+
+def _postgres(words, limit):
+    from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVectorField
+    from django.db.models.expressions import RawSQL
+
+    config = _setting("SEARCH_POSTGRES_CONFIG", "english")
+    query = SearchQuery(" & ".join(f"{w}:*" for w in words), search_type="raw", config=config)
+    # generated column (migration 0021), not a model field; the GIN index serves the @@ match
+    vector = RawSQL(f"{Event._meta.db_table}.search_document", [], output_field=SearchVectorField())
+    options = {"start_sel": _OPEN, "stop_sel": _CLOSE, "config": config}
+    rows = (
+        Event.objects.alias(document=vector)
+        .filter(document=query)
+        .annotate(
+            score=SearchRank(vector, query),
+            title_hl=SearchHeadline("title", query, highlight_all=True, **options),
+            snippet_hl=SearchHeadline("description", query, max_words=24, min_words=8, **options),
+        )
+        .order_by("-score", "pk")
+        .values_list("pk", "title_hl", "snippet_hl", "score")[:limit]
+    )
+    return list(rows)
+
+
+def _like(words, limit):
+    condition = Q()
+    for w in words:
+        condition &= Q(title__icontains=w) | Q(location__icontains=w) | Q(description__icontains=w)
+    rows = Event.objects.filter(condition).order_by("starts_at", "pk").values_list("pk", "title", "description")
+    return [(pk, title, (description or "")[:160], 0.0) for pk, title, description in rows[:limit]]
+
+
+def search_ids(query, limit=None):
+    """``[(event_id, title_html, snippet_html, score)]`` best first; raw fragments, not yet escaped."""
+    words = terms(query)
+    if not words:
+        return []
+    limit = limit or _setting("SEARCH_RESULTS_LIMIT", 50)
+    kind = backend()
+    if kind == "fts5":
+        try:
+            return _fts5(words, limit)
+        except OperationalError:
+            logger.exception("FTS5 query failed for %r; falling back to LIKE", query)
+    elif kind == "postgres":
+        return _postgres(words, limit)
+    return _like(words, limit)
+
+
+def search(query, limit=None):
+    """
+    Events matching ``query`` in rank order, each with ``search_title`` and
+    ``search_snippet`` (safe HTML with ``<mark>`` around matches) and
+    ``search_score``.
+    """
+    hits = search_ids(query, limit)
+    events = Event.objects.select_related("category").in_bulk([pk for pk, *_ in hits])
+    results = []
+    for pk, title, snippet, score in hits:
+        event = events.get(pk)
+        if event is None:
+            continue
+        event.search_title = _highlight(title or event.title)
+        event.search_snippet = _highlight(snippet or "")
+        event.search_score = score
+        results.append(event)
+    return results
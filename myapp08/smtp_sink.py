@@ -0,0 +1,77 @@
+# myapp08/smtp_sink.py
+"""
+Minimal local SMTP server that accepts and discards mail.
+
+Used to benchmark mail delivery without a real provider. ``connect_delay``
+simulates the TCP + STARTTLS + AUTH cost a real server charges for every new
+connection, which is what batching over one connection saves.
+"""
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        if server.connect_delay:
+            time.sleep(server.connect_delay)
+        with server.lock:
+            server.connections += 1
+        self._reply("220 localhost smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.strip().split(b" ", 1)[0].upper()
+            if command == b"EHLO":
+                self._reply("250-localhost")
+                self._reply("250-8BITMIME")
+                self._reply("250 SIZE 52428800")
+            elif command == b"HELO":
+                self._reply("250 localhost")
+            elif command in (b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                self._reply("250 OK")
+            elif command == b"DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b".\r\n":
+                        break
+                with server.lock:
+                    server.messages += 1
+                self._reply("250 OK queued")
+            elif command == b"QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, connect_delay=0.0):
+        super().__init__((host, port), _SMTPHandler)
+        self.connect_delay = connect_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """Serve in a background thread; returns self for chaining."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,21 @@
+# myapp08/tasks.py
+"""Job handlers run by `manage.py run_workers` (registered on app ready)."""
+from . import event_pages, fragments, fulfillment, image_variants
+from .jobs import task
+from .models import Event
+
+
+@task("ticket.fulfill")
+def fulfill_ticket(ticket_id):
+    fulfillment.fulfill(ticket_id)
+
+
+@task(image_variants.JOB)
+def build_image_variants(path, event_id=None):
+    if image_variants.generate(path) is None or event_id is None:
+        return
+    # the cached markup of the event still points at the original
+    event = Event.objects.filter(pk=event_id).first()
+    if event is not None:
+        fragments.invalidate(event)
+        event_pages.invalidate(event.pk)
@@ -0,0 +1,44 @@
+"""
+``{% fragment name objects [vary ...] %} ... {% endfragment %}``
+
+Caches the enclosed template output under the versions of ``objects`` (a
+model instance or a list of them); see myapp08/fragments.py. Extra
+``vary`` values go into the key as they are, for output that depends on
+something besides the objects.
+"""
+from django import template
+
+from myapp08 import fragments
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, objects, vary):
+        self.nodelist = nodelist
+        self.name = name
+        self.objects = objects
+        self.vary = vary
+
+    def render(self, context):
+        return fragments.get_or_render(
+            self.name.resolve(context),
+            self.objects.resolve(context),
+            lambda: self.nodelist.render(context),
+            vary=[v.resolve(context) for v in self.vary],
+        )
+
+
+@register.tag("fragment")
+def do_fragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a name and the object(s) it shows.")
+    nodelist = parser.parse(("endfragment",))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(b) for b in bits[3:]],
+    )
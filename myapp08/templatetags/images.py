@@ -0,0 +1,36 @@
+"""
+``{% picture image sizes="..." alt="..." class="..." style="..." %}``
+
+Renders an uploaded image (a FieldFile or a storage name) as a
+``<picture>`` with a WebP ``srcset`` and a JPEG fallback built from its
+variants (see myapp08/image_variants.py). Until the variants exist it is
+a plain ``<img>`` of the original, marked ``image_variants.PENDING``.
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from myapp08 import image_variants
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, sizes="100vw", alt="", loading="lazy", **attrs):
+    name = getattr(image, "name", image)
+    if not name:
+        return ""
+    extra = format_html_join("", ' {}="{}"', sorted(attrs.items()))
+    if image_variants.pending(name):
+        extra = format_html("{} {}", extra, mark_safe(image_variants.PENDING))
+    srcsets = image_variants.srcsets(name)
+    if not srcsets:
+        return format_html(
+            '<img src="{}" alt="{}" loading="{}"{}>', image_variants.fallback_url(name), alt, loading, extra,
+        )
+    return format_html(
+        '<picture><source type="{}" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="{}"{}></picture>',
+        image_variants.FORMATS["webp"][1], srcsets["webp"], sizes,
+        image_variants.fallback_url(name), srcsets["jpeg"], sizes, alt, loading, extra,
+    )
@@ -1,3 +1,1467 @@
-from django.test import TestCase
+import datetime
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics, caching, calendar_feed, event_pages, fragments, fulfillment, image_variants, inventory, jobs, outbox,
+    ownership, profile_stats, qr, search, utils_certificates, waiting_room,
+)
+from .mail import MailDispatcher
+from .management.commands.explain_queries import Command as ExplainQueriesCommand
+from .models import (
+    RSVP, BatchCheckpoint, Event, EventCategory, EventDailyStats, EventMedia, EventSchedule, EventStats, Job,
+    OutboxMessage, SeatHold, Ticket, TicketTier,
+)
+
+
+class TempMediaMixin:
+    """Write uploaded/generated files to a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        super().setUp()
+        self._media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self._media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self._media_root, True)
+
+
+def make_event(organizer, days=7, **kwargs):
+    defaults = {
+        'title': 'Test Event',
+        'date': timezone.localdate() + datetime.timedelta(days=days),
+        'location': 'Hall A',
+    }
+    defaults.update(kwargs)
+    return Event.objects.create(organizer=organizer, **defaults)
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        @jobs.task("test.record")
+        def record(value):
+            self.calls.append(value)
+
+        @jobs.task("test.explode")
+        def explode():
+            raise RuntimeError("boom")
+
+    def test_enqueued_job_runs_once(self):
+        job = jobs.enqueue("test.record", value=42)
+        self.assertEqual(jobs.drain(), 1)
+        self.assertEqual(self.calls, [42])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_DONE)
+        self.assertEqual(jobs.drain(), 0)
+
+    def test_failure_backs_off_then_fails(self):
+        job = jobs.enqueue("test.explode", max_attempts=2)
+        jobs.drain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_QUEUED)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("boom", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        jobs.drain()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.STATUS_FAILED)
+
+    def test_expired_lease_is_reclaimed(self):
+        job = jobs.enqueue("test.record", value=1)
+        self.assertEqual(len(jobs.claim("dead-worker")), 1)
+        # lease still valid: nobody else can take it
+        self.assertEqual(jobs.claim("other"), [])
+
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        reclaimed = jobs.claim("other")
+        self.assertEqual([j.pk for j in reclaimed], [job.pk])
+        self.assertEqual(reclaimed[0].attempts, 2)
+
+    def test_worker_starts_under_spawn(self):
+        # macOS and Windows start workers with spawn: a fresh interpreter without Django set up
+        from .management.commands.run_workers import _worker_loop
+        ctx = multiprocessing.get_context('spawn')
+        stop_event = ctx.Event()
+        stop_event.set()
+        worker = ctx.Process(target=_worker_loop, args=(1, 0.1, stop_event))
+        worker.start()
+        worker.join(timeout=60)
+        self.assertEqual(worker.exitcode, 0)
+
+
+class BookingEnqueuesTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.event = make_event(self.user)
+        self.tier = TicketTier.objects.create(event=self.event, name='Free', price=0, capacity=10)
+        self.client.force_login(self.user)
+
+    def test_free_booking_only_enqueues(self):
+        resp = self.client.post(reverse('book_event', args=[self.event.pk]), {
+            'email': 'buyer@example.com', 'tier': self.tier.pk, 'quantity': 2,
+        })
+        self.assertRedirects(resp, reverse('confirmation_page'), fetch_redirect_response=False)
+        ticket = Ticket.objects.get()
+        self.assertFalse(ticket.qr_image)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(Job.objects.filter(name="ticket.fulfill", payload__ticket_id=ticket.pk).exists())
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.kind, message.ticket, message.status),
+                         (outbox.KIND_CONFIRMATION, ticket, OutboxMessage.STATUS_PENDING))
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.sold, 2)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class WaitingRoomTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.other = User.objects.create_user('late', 'late@example.com', 'pw-123456')
+        # 6 a minute, burst of 1: one straight in, then one every 10 seconds
+        self.event = make_event(self.user, admission_rate=6)
+        TicketTier.objects.create(event=self.event, name='Free', price=0, capacity=10)
+        caches['waiting_room'].clear()
+        self.addCleanup(caches['waiting_room'].clear)
+        clock = mock.patch('myapp08.waiting_room.time')
+        self.clock = clock.start()
+        self.clock.time.return_value = 1000.0
+        self.addCleanup(clock.stop)
+
+    def test_queue_meters_admissions(self):
+        pk = self.event.pk
+        self.assertEqual(waiting_room.join(pk), 1)
+        self.assertTrue(waiting_room.status(pk, 1, 6)['admitted'])
+        self.assertEqual(waiting_room.join(pk), 2)
+        self.assertEqual(waiting_room.status(pk, 2, 6), {'admitted': False, 'position': 1, 'eta': 10})
+        self.assertTrue(waiting_room.status(pk, 2, 6, now=1010.0)['admitted'])
+        # an idle hour only banks one burst
+        self.assertEqual(waiting_room.head(pk, 6, now=4600.0), 3)
+
+    def test_gate_and_status_endpoint(self):
+        book = reverse('book_event', args=[self.event.pk])
+        status_url = reverse('waiting_room_status', args=[self.event.pk])
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(book).status_code, 200)
+        self.assertIn(waiting_room.cookie_name(self.event.pk), self.client.cookies)
+
+        late = self.client_class()
+        late.force_login(self.other)
+        self.assertRedirects(late.get(book), reverse('waiting_room', args=[self.event.pk]),
+                             fetch_redirect_response=False)
+        with self.assertNumQueries(0):
+            data = late.get(status_url).json()
+        self.assertEqual((data['admitted'], data['position']), (False, 1))
+
+        self.clock.time.return_value = 1010.0
+        self.assertEqual(late.get(status_url).json(), {'admitted': True, 'position': 0, 'eta': 0, 'next': book})
+        self.assertEqual(late.get(book).status_code, 200)
+
+        late.cookies[waiting_room.cookie_name(self.event.pk)] = '1:forged'
+        self.assertEqual(late.get(status_url).status_code, 400)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage',
+                   EVENTS_PER_PAGE=20, HOME_EVENTS_PER_PAGE=9)
+class EventListingQueryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        category = EventCategory.objects.create(name='Music')
+        for i in range(30):
+            event = make_event(self.user, days=i + 1, title=f'Event {i}', category=category)
+            TicketTier.objects.create(event=event, name='Free', price=0, capacity=5, sold=i % 6)
+            TicketTier.objects.create(event=event, name='VIP', price=10, capacity=3)
+        self.flash = TicketTier.objects.get(event__title='Event 0', name='VIP')
+        inventory.set_sharding(self.flash, 2)
+        inventory.reserve(self.flash, 2)
+
+    def test_event_list_query_count_is_constant(self):
+        # page of events (+ category), tiers (+ availability); no COUNT, no OFFSET
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('event_list'))
+        page = resp.context['page_obj']
+        self.assertEqual((len(page), page.has_next), (20, True))
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('event_list'), {'after': page.next_cursor})
+        self.assertEqual(len(resp.context['events']), 10)
+        self.assertFalse(resp.context['page_obj'].has_next)
+
+    def test_event_list_availability_matches_model(self):
+        resp = self.client.get(reverse('event_list'))
+        first = resp.context['events'][0]
+        self.assertEqual([t.available for t in first.tiers.all()], [5, 1])
+        self.assertEqual(first.tiers.all()[1].available, inventory.available(self.flash))
+        self.assertEqual(resp.context['events'][5].tiers.all()[0].available, 0)
+
+    def test_home_is_paginated(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('home'))
+        self.assertEqual(len(resp.context['events']), 9)
+        self.assertTrue(resp.context['page_obj'].has_next)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class EventSearchTests(TestCase):
+    def setUp(self):
+        if search.backend() != 'fts5':
+            self.skipTest("SQLite FTS5 index not available")
+        self.user = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.jazz = make_event(self.user, title='Jazz Night', location='Blue Hall',
+                               description='Live <b>jazz</b> quartet and a late jam session.')
+        self.rock = make_event(self.user, title='Rock Festival', location='Jazzberry Park',
+                               description='Three stages of guitars.')
+        make_event(self.user, title='Pottery Workshop', description='Clay for beginners.')
+
+    def test_ranked_prefix_matches_with_safe_highlights(self):
+        results = search.search('jaz')
+        self.assertEqual([e.pk for e in results], [self.jazz.pk, self.rock.pk])
+        self.assertEqual(results[0].search_title, '<mark>Jazz</mark> Night')
+        self.assertIn('&lt;b&gt;<mark>jazz</mark>&lt;/b&gt;', results[0].search_snippet)
+        # FTS syntax in user input is dropped, not passed to MATCH
+        self.assertEqual(search.search('jam*"(:'), search.search('jam'))
+
+    def test_index_follows_save_and_delete(self):
+        self.rock.title = 'Metal Festival'
+        self.rock.save()
+        self.assertEqual([e.title for e in search.search('metal')], ['Metal Festival'])
+        self.assertEqual(search.search('rock'), [])
+        self.jazz.delete()
+        self.assertEqual([e.pk for e in search.search('jazz')], [self.rock.pk])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.TABLE}")
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(len(search.search('festival workshop')), 0)
+        self.assertEqual(len(search.search('festival')), 1)
+
+    def test_views(self):
+        resp = self.client.get(reverse('event_search'), {'q': 'jazz'})
+        self.assertContains(resp, '<mark>Jazz</mark> Night', html=False)
+        data = self.client.get(reverse('event_search_json'), {'q': 'pot'}).json()
+        self.assertEqual([r['title'] for r in data['results']], ['Pottery Workshop'])
+        self.assertEqual(self.client.get(reverse('event_search_json')).json()['results'], [])
+
+    def test_migration_skips_the_index_without_fts5(self):
+        migration = importlib.import_module('myapp08.migrations.0017_event_search_index')
+        execute = CursorWrapper.execute
+
+        def no_fts5(cursor, sql, params=None):
+            if 'USING fts5' in sql:
+                raise OperationalError('no such module: fts5')
+            return execute(cursor, sql, params)
+
+        with mock.patch.object(CursorWrapper, 'execute', no_fts5), \
+                mock.patch.object(CursorWrapper, 'executemany') as insert:
+            migration.create_fts_index(django_apps, mock.Mock(connection=connection))
+        insert.assert_not_called()
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.oct_untimed = make_event(self.user, date=datetime.date(2030, 10, 31), title='Halloween')
+        self.nov_timed = make_event(self.user, date=datetime.date(2030, 11, 2), time=datetime.time(19, 30),
+                                    title='Concert')
+        make_event(self.user, date=datetime.date(2030, 12, 20), title='Outside window')
+        self.url = reverse('calendar_events_json')
+        # a month view of November 2030 as FullCalendar requests it
+        self.window = {'start': '2030-10-27T00:00:00+00:00', 'end': '2030-12-08T00:00:00+00:00'}
+
+    def test_window_is_served_from_cached_months(self):
+        with self.assertNumQueries(3):  # October, November, December
+            resp = self.client.get(self.url, self.window)
+        self.assertEqual(resp.json(), [
+            {'id': self.oct_untimed.pk, 'title': 'Halloween', 'start': '2030-10-31',
+             'url': reverse('event_detail', args=[self.oct_untimed.pk])},
+            {'id': self.nov_timed.pk, 'title': 'Concert', 'start': '2030-11-02T19:30:00',
+             'url': reverse('event_detail', args=[self.nov_timed.pk])},
+        ])
+        self.assertIn('max-age=300', resp['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.client.get(self.url, {'start': '2030-11-01', 'end': '2030-12-01'})
+
+    def test_event_changes_invalidate(self):
+        self.client.get(self.url, self.window)
+        version = calendar_feed.version()
+        self.nov_timed.title = 'Concert (moved)'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nov_timed.save()
+            # before commit the version is unchanged, so nothing read now is cached under the new one
+            self.assertEqual(calendar_feed.version(), version)
+        titles = [e['title'] for e in self.client.get(self.url, self.window).json()]
+        self.assertEqual(titles, ['Halloween', 'Concert (moved)'])
+
+    def test_rejects_bad_ranges(self):
+        self.assertEqual(self.client.get(self.url, {'start': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '2030-01-01', 'end': '2031-01-01'}).status_code, 400)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'pw-123456', is_staff=True)
+        self.event = make_event(self.user, title='Gala')
+        self.tier = TicketTier.objects.create(event=self.event, name='Free', price=0, capacity=10)
+
+    def ticket(self, event, quantity, amount, days_ago=0):
+        ticket = Ticket.objects.create(event=event, email='buyer@example.com', quantity=quantity, total_amount=amount)
+        if days_ago:
+            # move it to an earlier day the way a rebuild would see it
+            Ticket.objects.filter(pk=ticket.pk).update(created_at=ticket.created_at - datetime.timedelta(days=days_ago))
+        return ticket
+
+    def test_booking_bumps_rollups(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('book_event', args=[self.event.pk]), {
+            'email': 'buyer@example.com', 'tier': self.tier.pk, 'quantity': 3,
+        })
+        stats = EventStats.objects.get(event=self.event)
+        self.assertEqual((stats.tickets, stats.attendees), (1, 3))
+        daily = EventDailyStats.objects.get(event=self.event)
+        self.assertEqual((daily.day, daily.attendees), (timezone.localdate(), 3))
+
+        Ticket.objects.get().delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.tickets, stats.attendees), (0, 0))
+
+    def test_dashboards_read_only_rollups(self):
+        other = make_event(self.user, title='Fair')
+        self.ticket(self.event, 2, 20)
+        self.ticket(other, 5, 100)
+        self.client.force_login(self.staff)
+        with self.assertNumQueries(3):  # session, user, one grouped rollup query
+            data = self.client.get(reverse('analytics_json')).json()
+        self.assertEqual(data['revenue_by_event'], {'labels': ['Fair', 'Gala'], 'values': [100.0, 20.0]})
+        self.assertEqual(data['attendees_by_date']['labels'][-1], timezone.localdate().isoformat())
+        self.assertEqual(sum(data['attendees_by_date']['values']), 7)
+
+        with mock.patch.object(Ticket.objects, 'aggregate', side_effect=AssertionError('reads Ticket')):
+            resp = self.client.get(reverse('admin_analytics'))
+        self.assertEqual((resp.context['total_attendees'], resp.context['most_popular_title']), (7, 'Fair'))
+
+    def test_rebuild_recomputes_from_tickets(self):
+        self.ticket(self.event, 2, 20, days_ago=3)
+        self.ticket(self.event, 1, 10)
+        EventStats.objects.update(attendees=99)
+        call_command('rebuild_analytics', chunk_size=1, stdout=io.StringIO())
+
+        stats = EventStats.objects.get(event=self.event)
+        self.assertEqual((stats.tickets, stats.attendees, stats.revenue), (2, 3, 30))
+        today = timezone.localdate()
+        self.assertEqual(
+            list(EventDailyStats.objects.order_by('day').values_list('day', 'attendees')),
+            [(today - datetime.timedelta(days=3), 2), (today, 1)],
+        )
+        payload, _hit = analytics.report(today - datetime.timedelta(days=3), today)
+        self.assertEqual(payload['attendees_by_date']['values'], [2, 0, 0, 1])
+
+    def test_rsvp_counter_and_organizer_dashboard(self):
+        self.user.profile.role = 'ORGANIZER'
+        self.user.profile.save()
+        self.client.force_login(self.user)
+        url = reverse('rsvp_event', args=[self.event.pk])
+        self.client.post(url, {'status': 'going'})
+        self.client.post(url, {'status': 'going'})
+        self.assertEqual(EventStats.objects.get(event=self.event).rsvps_going, 1)
+        self.client.post(url, {'status': 'not_going'})
+        self.assertEqual(EventStats.objects.get(event=self.event).rsvps_going, 0)
+
+        # booking marks the buyer going again
+        self.client.post(reverse('book_event', args=[self.event.pk]), {
+            'email': 'buyer@example.com', 'tier': self.tier.pk, 'quantity': 2,
+        })
+        with mock.patch.object(Ticket.objects, 'filter', side_effect=AssertionError('reads Ticket')):
+            page = self.client.get(reverse('organizer_dashboard'))
+        self.assertEqual(list(page.context['stats']), [{
+            'event__id': self.event.pk, 'event__title': 'Gala', 'revenue': 0, 'rsvps_going': 1, 'total_sold': 2,
+        }])
+
+    def test_reconcile_repairs_drift(self):
+        other = make_event(self.user, title='Fair')
+        self.ticket(self.event, 2, 20)
+        RSVP.objects.create(user=self.user, event=other, status='going')  # bypasses the counter
+        EventStats.objects.filter(event=self.event).update(attendees=7, revenue=5)
+
+        out = io.StringIO()
+        call_command('reconcile_event_stats', dry_run=True, stdout=out)
+        self.assertIn(f'event {self.event.pk}: attendees 7 -> 2, revenue 5.00 -> 20', out.getvalue())
+        self.assertEqual(EventStats.objects.get(event=self.event).attendees, 7)
+
+        call_command('reconcile_event_stats', chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(EventStats.objects.get(event=self.event).attendees, 2)
+        self.assertEqual(EventStats.objects.get(event=other).rsvps_going, 1)
+        self.assertEqual(analytics.reconcile(), [])
+
+
+class AnalyticsApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        User = get_user_model()
+        self.org = User.objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.rival = User.objects.create_user('rival', 'rival@example.com', 'pw-123456')
+        self.client.force_login(User.objects.create_user('staff', 'staff@example.com', 'pw-123456', is_staff=True))
+        self.gala = make_event(self.org, title='Gala')
+        self.fair = make_event(self.rival, title='Fair')
+        # Monday 2030-01-07 .. Friday 2030-02-01
+        for event, day, qty, amount in ((self.gala, 7, 1, 10), (self.gala, 9, 2, 20), (self.fair, 9, 4, 0),
+                                        (self.gala, 32, 3, 30)):
+            EventDailyStats.objects.create(event=event, day=datetime.date(2030, 1, 1) + datetime.timedelta(days=day - 1),
+                                           tickets=1, attendees=qty, revenue=amount)
+        self.url = reverse('analytics_json')
+
+    def test_buckets_and_filters(self):
+        data = self.client.get(self.url, {'from': '2030-01-07', 'to': '2030-02-01', 'bucket': 'week'}).json()
+        self.assertEqual(data['attendees_by_date']['labels'],
+                         ['2030-01-07', '2030-01-14', '2030-01-21', '2030-01-28'])
+        self.assertEqual(data['attendees_by_date']['values'], [7, 0, 0, 3])
+        self.assertEqual(data['totals'], {'tickets': 4, 'attendees': 10, 'revenue': 60.0})
+
+        data = self.client.get(self.url, {'from': '2030-01-01', 'to': '2030-02-28', 'bucket': 'month',
+                                          'organizer': self.org.pk}).json()
+        self.assertEqual(data['revenue_by_date'], {'labels': ['2030-01-01', '2030-02-01'], 'values': [30.0, 30.0]})
+        self.assertEqual(data['revenue_by_event']['labels'], ['Gala'])
+
+        data = self.client.get(self.url, {'from': '2030-01-09', 'to': '2030-01-09', 'event': self.fair.pk}).json()
+        self.assertEqual(data['attendees_by_date']['values'], [4])
+
+    def test_cached_until_a_ticket_is_booked(self):
+        params = {'from': '2030-01-01', 'to': '2030-01-31'}
+        self.assertEqual(self.client.get(self.url, params)['X-Cache'], 'MISS')
+        with self.assertNumQueries(2):  # session and user only
+            resp = self.client.get(self.url, params)
+        self.assertEqual(resp['X-Cache'], 'HIT')
+        self.assertEqual(resp.json()['cache'], {'hit': True, 'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(event=self.gala, email='buyer@example.com', quantity=1, total_amount=10)
+        self.assertEqual(self.client.get(self.url, params)['X-Cache'], 'MISS')
+        self.assertEqual(caching.stats(analytics.NAMESPACE)['misses'], 2)
+
+    def test_rejects_bad_filters(self):
+        for params in ({'from': 'last week'}, {'from': '2030-02-01', 'to': '2030-01-01'}, {'bucket': 'year'},
+                       {'event': 'gala'}, {'from': '2000-01-01', 'to': '2030-01-01'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class TicketOwnershipTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.friend = User.objects.create_user('friend', 'friend@example.com', 'pw-123456')
+        self.event = make_event(self.buyer)
+        self.tier = TicketTier.objects.create(event=self.event, name='Free', price=0, capacity=10)
+        self.client.force_login(self.buyer)
+
+    def book(self, email):
+        self.client.post(reverse('book_event', args=[self.event.pk]), {
+            'email': email, 'tier': self.tier.pk, 'quantity': 1,
+        })
+        return Ticket.objects.latest('pk')
+
+    def test_owner_resolved_at_booking(self):
+        self.assertEqual(self.book('buyer@example.com').user, self.buyer)
+        self.assertEqual(self.book('friend@example.com').user, self.friend)
+        self.assertEqual(self.book('nobody@example.com').user, self.buyer)
+
+        self.client.force_login(self.friend)
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(reverse('attendee_dashboard'))
+        self.assertEqual([t.email for t in page.context['tickets']], ['friend@example.com'])
+        ticket_sql = [q['sql'] for q in queries.captured_queries if 'FROM "myapp08_ticket"' in q['sql']]
+        self.assertEqual(len(ticket_sql), 1)
+        self.assertNotIn('"email"', ticket_sql[0].split('WHERE')[1])
+
+    def test_signup_reclaims_tickets_issued_to_its_email(self):
+        gift = self.book('newcomer@example.com')
+        legacy = Ticket.objects.create(event=self.event, email='newcomer@example.com')
+        own = self.book('buyer@example.com')
+        self.client.logout()
+        self.client.post(reverse('signup'), {
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'first_name': 'New', 'last_name': 'Comer',
+            'password1': 'pw-Secret-987', 'password2': 'pw-Secret-987', 'role': 'ATTENDEE',
+        })
+        newcomer = get_user_model().objects.get(username='newcomer')
+        self.assertEqual(set(Ticket.objects.filter(user=newcomer)), {gift, legacy})
+        self.assertEqual(list(Ticket.objects.filter(user=self.buyer)), [own])
+
+    def test_shared_email_is_not_claimed(self):
+        get_user_model().objects.create_user('twin', 'friend@example.com', 'pw-123456')
+        ticket = self.book('friend@example.com')
+        self.assertEqual(ticket.user, self.buyer)
+        self.assertEqual(ownership.reclaim(self.friend), 0)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ProfileStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.soon = make_event(self.user, days=3, title='Soon')
+        self.later = make_event(self.user, days=30, title='Later')
+        self.gone = make_event(self.user, days=-3, title='Gone')
+        for event, qty, amount in ((self.soon, 2, 20), (self.soon, 1, 10), (self.later, 1, 50), (self.gone, 4, 40)):
+            Ticket.objects.create(event=event, user=self.user, email='buyer@example.com', quantity=qty,
+                                  total_amount=amount)
+        RSVP.objects.create(user=self.user, event=self.soon, status='going')
+        self.client.force_login(self.user)
+
+    def test_stats_in_one_grouped_query(self):
+        with self.assertNumQueries(2):  # grouped tickets, going RSVPs
+            stats = profile_stats.compute(self.user.pk)
+        self.assertEqual(
+            {k: stats[k] for k in ('bookings', 'tickets', 'spent', 'events', 'upcoming_bookings', 'past_bookings',
+                                   'upcoming_events', 'past_events', 'rsvps_going')},
+            {'bookings': 4, 'tickets': 8, 'spent': 120, 'events': 3, 'upcoming_bookings': 3, 'past_bookings': 1,
+             'upcoming_events': 2, 'past_events': 1, 'rsvps_going': 1},
+        )
+        self.assertEqual(stats['next_start'], self.soon.starts_at)
+
+    def test_profile_page_is_cached_until_bookings_change(self):
+        # session, user, stats (2), upcoming, past, profile, RSVPs
+        with self.assertNumQueries(8):
+            page = self.client.get(reverse('profile'))
+        self.assertEqual((page.context['booked_events_count'], page.context['total_tickets']), (3, 8))
+        self.assertEqual([t.event.title for t in page.context['past_tickets']], ['Gone'])
+        with self.assertNumQueries(6):
+            self.client.get(reverse('profile'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(event=self.gone, user=self.user, email='buyer@example.com', quantity=1)
+        self.assertEqual(self.client.get(reverse('profile')).context['total_tickets'], 9)
+        with self.captureOnCommitCallbacks(execute=True):
+            analytics.set_rsvp(self.user, self.soon, 'not_going')
+        self.assertEqual(profile_stats.get(self.user)['rsvps_going'], 0)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.organizer = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.category = EventCategory.objects.create(name='Music')
+        self.first = make_event(self.organizer, days=3, title='First', category=self.category)
+        self.second = make_event(self.organizer, days=5, title='Second')
+        TicketTier.objects.create(event=self.first, name='GA', price=10, capacity=5)
+
+    def render_count(self, url):
+        before = caching.stats(fragments.NAMESPACE)['misses']
+        page = self.client.get(url).content.decode()
+        return page, caching.stats(fragments.NAMESPACE)['misses'] - before
+
+    def test_second_render_is_served_from_cache(self):
+        for url in (reverse('home'), reverse('event_list')):
+            _, rendered = self.render_count(url)
+            self.assertGreater(rendered, 0)
+            page, rendered = self.render_count(url)
+            self.assertEqual(rendered, 0)
+            self.assertIn('First', page)
+
+    def test_editing_an_event_rerenders_only_its_card(self):
+        self.render_count(reverse('event_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Event.objects.filter(pk=self.first.pk).update(title='Renamed')
+            self.first.refresh_from_db()
+            self.first.save()
+        page, rendered = self.render_count(reverse('event_list'))
+        self.assertEqual(rendered, 1)
+        self.assertIn('Renamed', page)
+
+    def test_tier_change_and_category_rename_invalidate(self):
+        self.render_count(reverse('event_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            TicketTier.objects.create(event=self.second, name='VIP', price=50, capacity=2)
+        self.assertEqual(self.render_count(reverse('event_list'))[1], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Concerts'
+            self.category.save()
+        page, rendered = self.render_count(reverse('event_list'))
+        self.assertEqual(rendered, 2)
+        self.assertIn('Concerts', page)
+
+    def test_works_on_the_file_based_cache(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with override_settings(CACHES={'default': backend}):
+            self.render_count(reverse('home'))
+            self.assertEqual(self.render_count(reverse('home'))[1], 0)
+            self.assertGreater(caching.stats(fragments.NAMESPACE)['hits'], 0)
+
+    def test_cache_stats_command(self):
+        self.render_count(reverse('home'))
+        self.render_count(reverse('home'))
+        out = io.StringIO()
+        call_command('cache_stats', '--reset', stdout=out)
+        self.assertRegex(out.getvalue(), r'fragments\s+hits=1\s+misses=3')
+        self.assertEqual(caching.stats(fragments.NAMESPACE)['misses'], 0)
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class EventPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.organizer = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.event = make_event(self.organizer, days=3, title='Gala')
+        self.tier = TicketTier.objects.create(event=self.event, name='GA', price=10, capacity=2)
+        self.url = reverse('event_detail', args=[self.event.pk])
+
+    def test_anonymous_page_is_cached_without_seats_left(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertNotContains(first, '2 left')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+        # selling out does not touch the cached page; the availability endpoint is live
+        inventory.reserve(self.tier, 2)
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        data = self.client.get(reverse('event_availability_json', args=[self.event.pk])).json()
+        self.assertEqual(data['tiers'], [{'id': self.tier.pk, 'available': 0, 'sold_out': True}])
+
+    def test_signed_in_visitors_get_a_live_page(self):
+        self.client.force_login(self.organizer)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('X-Cache'))
+        self.assertContains(response, '2 left')
+
+    def test_changes_to_the_event_purge_its_page(self):
+        other = make_event(self.organizer, days=4, title='Other')
+        other_url = reverse('event_detail', args=[other.pk])
+        self.client.get(self.url)
+        self.client.get(other_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            EventSchedule.objects.create(event=self.event, title='Doors open', start_time=datetime.time(18))
+        page = self.client.get(self.url)
+        self.assertEqual(page['X-Cache'], 'MISS')
+        self.assertContains(page, 'Doors open')
+        self.assertEqual(self.client.get(other_url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tier.price = 15
+            self.tier.save()
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+
+    def test_unknown_event(self):
+        self.assertEqual(self.client.get(reverse('event_detail', args=[999999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('event_availability_json', args=[999999])).status_code, 404)
+
+
+def make_image(width, height, fmt='JPEG'):
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(out, fmt)
+    return out.getvalue()
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ImageVariantTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.organizer = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+
+    def test_upload_queues_variants_and_home_serves_srcset(self):
+        event = make_event(self.organizer, image=SimpleUploadedFile('stage.jpg', make_image(2000, 1000)))
+        job = Job.objects.get(name=image_variants.JOB)
+        self.assertEqual(job.payload, {'path': event.image.name, 'event_id': event.pk})
+        self.assertIn('<img src="%s"' % event.image.url, self.client.get(reverse('home')).content.decode())
+
+        jobs.drain()
+        for width in (320, 640, 1280):
+            for fmt in image_variants.FORMATS:
+                self.assertTrue(default_storage.exists(image_variants.variant_name(event.image.name, width, fmt)))
+        from PIL import Image
+        with default_storage.open(image_variants.variant_name(event.image.name, 640, 'webp')) as fh:
+            variant = Image.open(fh)
+            self.assertEqual((variant.format, variant.size), ('WEBP', (640, 320)))
+
+        # the job purged the cached card
+        page = self.client.get(reverse('home')).content.decode()
+        self.assertIn('<source type="image/webp"', page)
+        self.assertIn('.640w.webp 640w', page)
+        self.assertNotIn(f'src="{event.image.url}"', page)
+
+        # saving without a new upload queues nothing
+        event.title = 'Renamed'
+        event.save()
+        self.assertEqual(Job.objects.filter(name=image_variants.JOB).count(), 1)
+
+    def test_other_processes_pick_up_variants_without_the_purge(self):
+        event = make_event(self.organizer, image=SimpleUploadedFile('stage.jpg', make_image(800, 400)))
+        self.assertIn(image_variants.PENDING, self.client.get(reverse('home')).content.decode())
+        self.assertEqual(self.client.get(reverse('event_detail', args=[event.pk]))['X-Cache'], 'MISS')
+
+        # built by a worker whose cache writes this process never sees
+        with mock.patch.object(image_variants.cache, 'set'):
+            self.assertIsNotNone(image_variants.generate(event.image.name))
+        self.assertNotIn('.640w.webp', self.client.get(reverse('home')).content.decode())
+
+        later = time.time() + 11
+        with mock.patch('time.time', return_value=later):
+            page = self.client.get(reverse('home')).content.decode()
+            detail = self.client.get(reverse('event_detail', args=[event.pk]))
+        self.assertIn('.640w.webp 640w', page)
+        self.assertNotIn(image_variants.PENDING, page)
+        self.assertEqual(detail['X-Cache'], 'MISS')
+        self.assertContains(detail, '.640w.webp 640w')
+
+    def test_small_images_are_not_upscaled(self):
+        event = make_event(self.organizer)
+        media = EventMedia.objects.create(event=event, file=SimpleUploadedFile('tiny.png', make_image(200, 100, 'PNG')))
+        jobs.drain()
+        self.assertEqual(image_variants.manifest(media.file.name), {'width': 200, 'widths': [200]})
+
+    def test_backfill_command(self):
+        photo = default_storage.save('events/cover/old.jpg', ContentFile(make_image(900, 600)))
+        default_storage.save('events/3/media/flyer.pdf', ContentFile(b'%PDF-1.4'))
+        default_storage.save('events/3/media/broken.png', ContentFile(b'not an image'))
+
+        out = io.StringIO()
+        with self.assertLogs('myapp08.image_variants', 'WARNING'):
+            call_command('build_image_variants', stdout=out)
+        self.assertIn('Built variants of 1 image(s), skipped 1 unreadable', out.getvalue())
+        self.assertEqual(image_variants.manifest(photo), {'width': 900, 'widths': [320, 640, 900]})
+        self.assertEqual(sorted(image_variants.srcsets(photo)), ['jpeg', 'webp'])
+
+        # variants are not sources themselves, and existing ones are kept
+        with mock.patch.object(default_storage, 'save', wraps=default_storage.save) as save, \
+                self.assertLogs('myapp08.image_variants', 'WARNING'):
+            call_command('build_image_variants', stdout=io.StringIO())
+        self.assertEqual(save.call_count, 0)
+
+
+class ExplainQueriesCommandTests(TestCase):
+    def test_explains_view_queries(self):
+        # --use-current-db seeds nothing; the test database is the current one here
+        ExplainQueriesCommand(stdout=io.StringIO()).seed({'tickets': 300, 'events': 20, 'users': 30})
+        tickets = Ticket.objects.count()
+        out = io.StringIO()
+        call_command('explain_queries', use_current_db=True, stdout=out)
+        self.assertEqual(Ticket.objects.count(), tickets)
+        output = out.getvalue()
+        self.assertIn('[attendee_dashboard] indexed', output)
+        self.assertIn('ticket_user_created_idx', output)
+        self.assertRegex(output, r'\d+ queries explained, \d+ with a full-table scan')
+
+    def test_compare_refuses_the_current_database(self):
+        with self.assertRaisesMessage(CommandError, '--compare'):
+            call_command('explain_queries', compare=True, use_current_db=True, stdout=io.StringIO())
+
+
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class StartsAtKeysetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+
+    def test_starts_at_follows_date_and_time(self):
+        event = make_event(self.user, time=datetime.time(18, 30))
+        self.assertEqual(timezone.localtime(event.starts_at).time(), datetime.time(18, 30))
+        event.date += datetime.timedelta(days=1)
+        event.time = None
+        event.save(update_fields=['date', 'time'])
+        event.refresh_from_db()
+        self.assertEqual(event.starts_at, Event.compute_starts_at(event.date, None))
+
+    def test_upcoming_is_a_starts_at_range(self):
+        now = timezone.localtime()
+        earlier = make_event(self.user, days=0, time=(now - datetime.timedelta(minutes=5)).time())
+        untimed_today = make_event(self.user, days=0)
+        make_event(self.user, days=-1)
+        resp = self.client.get(reverse('event_list'))
+        shown = [e.pk for e in resp.context['events']]
+        if earlier.date == timezone.localdate():  # not right after midnight
+            self.assertNotIn(earlier.pk, shown)
+        self.assertEqual(shown, [untimed_today.pk])
+
+    @override_settings(EVENTS_PER_PAGE=4)
+    def test_keyset_walks_forward_and_back_without_gaps(self):
+        # ties on starts_at are broken by id
+        events = [make_event(self.user, days=1 + i // 3, time=datetime.time(9)) for i in range(10)]
+        seen, cursor, pages = [], None, []
+        while True:
+            resp = self.client.get(reverse('event_list'), {'after': cursor} if cursor else {})
+            page = resp.context['page_obj']
+            pages.append(page)
+            seen += [e.pk for e in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, [e.pk for e in events])
+        self.assertEqual([len(p) for p in pages], [4, 4, 2])
+
+        resp = self.client.get(reverse('event_list'), {'before': pages[2].previous_cursor})
+        self.assertEqual([e.pk for e in resp.context['events']], [e.pk for e in pages[1]])
+        self.assertEqual(self.client.get(reverse('event_list'), {'after': 'junk'}).status_code, 200)
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.event = make_event(self.user)
+        self.early = TicketTier.objects.create(event=self.event, name='Early', price=0, capacity=3)
+        self.vip = TicketTier.objects.create(event=self.event, name='VIP', price=50, capacity=2)
+
+    def test_reserve_up_to_capacity(self):
+        with self.assertNumQueries(1):
+            inventory.reserve(self.early, 2)
+        with self.assertRaises(inventory.SoldOut) as cm:
+            inventory.reserve(self.early, 2)
+        self.assertEqual(cm.exception.available, 1)
+        inventory.reserve(self.early.pk, 1)
+        self.early.refresh_from_db()
+        self.assertEqual((self.early.sold, self.early.available), (3, 0))
+
+    def test_multi_tier_is_all_or_nothing(self):
+        with self.assertRaises(inventory.SoldOut) as cm:
+            inventory.reserve_many({self.early: 1, self.vip: 3})
+        self.assertEqual(cm.exception.tier_id, self.vip.pk)
+        self.assertEqual(list(TicketTier.objects.order_by('pk').values_list('sold', flat=True)), [0, 0])
+
+        inventory.reserve_many({self.early: 1, self.vip: 2})
+        self.assertEqual(list(TicketTier.objects.order_by('pk').values_list('sold', flat=True)), [1, 2])
+
+    def test_release_never_goes_negative(self):
+        inventory.reserve(self.early, 1)
+        self.assertEqual(inventory.release(self.early, 2), 0)
+        self.assertEqual(inventory.release(self.early, 1), 1)
+        self.early.refresh_from_db()
+        self.assertEqual(self.early.sold, 0)
+
+    def test_sold_out_booking_issues_nothing(self):
+        TicketTier.objects.filter(pk=self.early.pk).update(sold=3)
+        self.client.force_login(self.user)
+        resp = self.client.post(reverse('book_event', args=[self.event.pk]), {
+            'email': 'org@example.com', 'tier': self.early.pk, 'quantity': 1,
+        })
+        self.assertRedirects(resp, reverse('book_event', args=[self.event.pk]), fetch_redirect_response=False)
+        self.assertFalse(Ticket.objects.exists())
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class SeatHoldTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.event = make_event(self.user)
+        self.tier = TicketTier.objects.create(event=self.event, name='VIP', price=50, capacity=4)
+
+    def expire(self, *holds):
+        SeatHold.objects.filter(pk__in=[h.pk for h in holds]).update(
+            expires_at=timezone.now() - datetime.timedelta(seconds=1))
+
+    def test_hold_counts_against_availability(self):
+        first = inventory.hold(self.tier, 3, 'a@example.com')
+        with self.assertRaises(inventory.SoldOut):
+            inventory.reserve(self.tier, 2)
+        with self.assertRaises(inventory.SoldOut):
+            inventory.hold(self.tier, 2, 'b@example.com')
+        inventory.convert(first)
+        self.tier.refresh_from_db()
+        self.assertEqual((self.tier.sold, self.tier.held, self.tier.available), (3, 0, 1))
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_expired_hold_converts_only_if_seats_remain(self):
+        mine = inventory.hold(self.tier, 2, 'a@example.com')
+        self.expire(mine)
+        inventory.convert(mine)  # seats still free: falls back to a plain reservation
+        self.tier.refresh_from_db()
+        self.assertEqual((self.tier.sold, self.tier.held), (2, 0))
+
+        late = inventory.hold(self.tier, 2, 'b@example.com')
+        self.expire(late)
+        inventory.sweep_expired_holds()
+        inventory.reserve(self.tier, 2)
+        with self.assertRaises(inventory.SoldOut):
+            inventory.convert(late)
+
+    def test_sweep_releases_in_chunks(self):
+        holds = SeatHold.objects.bulk_create([
+            SeatHold(tier=self.tier, email=f'{i}@example.com', quantity=1,
+                     expires_at=timezone.now() - datetime.timedelta(seconds=1))
+            for i in range(2500)
+        ])
+        TicketTier.objects.filter(pk=self.tier.pk).update(capacity=3000, held=len(holds) + 1)
+        live = inventory.hold(self.tier, 1, 'live@example.com')
+        TicketTier.objects.filter(pk=self.tier.pk).update(held=len(holds) + 1)
+
+        # per chunk: select ids, savepoint, claim, read quantities, delete, update tier, release;
+        # plus the final empty select — independent of how many holds a chunk carries
+        with self.assertNumQueries(5 * 7 + 1):
+            released = inventory.sweep_expired_holds(chunk_size=500)
+        self.assertEqual(released, 2500)
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.held, 1)
+        self.assertEqual(list(SeatHold.objects.values_list('pk', flat=True)), [live.pk])
+
+    def test_run_workers_sweeps_expired_holds(self):
+        lapsed = inventory.hold(self.tier, 3, 'a@example.com')
+        self.expire(lapsed)
+        call_command('run_workers', '--once', '--sweep-interval', '0', stdout=io.StringIO())
+        self.assertEqual(inventory.available(self.tier), 1)
+        call_command('run_workers', '--once', stdout=io.StringIO())
+        self.assertEqual(inventory.available(self.tier), 4)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def test_converted_hold_is_not_swept_twice(self):
+        seat_hold = inventory.hold(self.tier, 2, 'a@example.com')
+        self.expire(seat_hold)
+        inventory.release_hold(seat_hold)
+        self.assertEqual(inventory.sweep_expired_holds(), 0)
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.held, 0)
+
+    def test_paid_checkout_holds_then_converts(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse('book_event', args=[self.event.pk]), {
+            'email': 'buyer@example.com', 'tier': self.tier.pk, 'quantity': 3,
+        })
+        self.tier.refresh_from_db()
+        self.assertEqual((self.tier.held, self.tier.sold), (3, 0))
+
+        with self.settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            page = self.client.get(reverse('pay_event', args=[self.event.pk]))
+        self.assertContains(page, 'Your seats are held until')
+
+        self.client.post(reverse('pay_event', args=[self.event.pk]))
+        self.tier.refresh_from_db()
+        self.assertEqual((self.tier.held, self.tier.sold), (0, 3))
+        self.assertEqual(Ticket.objects.get().quantity, 3)
+
+
+class InventoryConcurrencyTests(TransactionTestCase):
+    buyers = 300
+    threads = 48
+    capacity = 120
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a file-backed test database shared by threads")
+        user = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.event = make_event(user)
+        self.tier = TicketTier.objects.create(event=self.event, name='Flash', price=0, capacity=self.capacity)
+
+    def run_buyers(self):
+        def buy(i):
+            try:
+                with transaction.atomic():
+                    inventory.reserve(self.tier.pk, 1 + i % 2)
+                    Ticket.objects.create(event=self.event, tier=self.tier, email=f'b{i}@example.com',
+                                          quantity=1 + i % 2)
+                return True
+            except inventory.SoldOut:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return sum(pool.map(buy, range(self.buyers)))
+
+    def assertNoOversell(self, successes):
+        self.tier.refresh_from_db()
+        issued = sum(Ticket.objects.values_list('quantity', flat=True))
+        self.assertEqual(self.tier.sold, issued)
+        self.assertLessEqual(self.tier.sold, self.capacity)
+        self.assertEqual(Ticket.objects.count(), successes)
+        # demand (~450 seats) far exceeds capacity: the tier must end (nearly) full
+        self.assertGreaterEqual(self.tier.sold, self.capacity - 1)
+
+    def test_parallel_buyers_never_oversell(self):
+        self.assertNoOversell(self.run_buyers())
+
+    def test_parallel_buyers_on_sharded_tier_never_oversell(self):
+        inventory.set_sharding(self.tier, 8)
+        successes = self.run_buyers()
+        self.assertLessEqual(inventory.available(self.tier), 1)
+        inventory.set_sharding(self.tier, 0)
+        self.assertNoOversell(successes)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchBookingCommandTests(TransactionTestCase):
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a file-backed test database shared by threads")
+        self.output = tempfile.mktemp(suffix='.json')
+        self.addCleanup(lambda: os.path.exists(self.output) and os.remove(self.output))
+
+    def test_reports_latency_and_integrity(self):
+        call_command('bench_booking', users=40, threads=8, capacity=15, use_current_db=True,
+                     output=self.output, stdout=io.StringIO())
+        with open(self.output) as fh:
+            results = json.load(fh)
+        self.assertEqual(results['meta']['users'], 40)
+        self.assertEqual(sum(results['outcomes'].values()), 40)
+        self.assertLessEqual(results['latency_ms']['book_post']['p50'], results['latency_ms']['book_post']['p99'])
+        integrity = results['integrity']
+        self.assertEqual((integrity['oversold_tiers'], integrity['duplicate_tickets']), ([], []))
+        self.assertEqual(integrity['tickets'], results['outcomes']['booked'])
+        # 4 tiers of 15 seats, ~60 seats demanded with up to 2 per buyer
+        self.assertTrue(all(t['sold'] <= t['capacity'] for t in integrity['tiers']))
+
+
+class ShardedTierTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.event = make_event(self.user)
+        self.tier = TicketTier.objects.create(event=self.event, name='GA', price=0, capacity=10, sold=2)
+
+    def test_free_seats_are_split_across_shards(self):
+        inventory.set_sharding(self.tier, 3)
+        self.assertEqual(list(self.tier.shards.values_list('capacity', flat=True)), [3, 3, 2])
+        self.assertEqual(self.tier.available, 8)
+        inventory.reserve(self.tier, 1)
+        self.assertEqual(TicketTier.objects.prefetch_related('shards').get().available, 7)
+        self.assertEqual(inventory.available(self.tier), 7)
+
+    def test_request_larger_than_any_shard_folds_and_respreads(self):
+        inventory.set_sharding(self.tier, 4)
+        inventory.reserve(self.tier, 5)
+        self.assertEqual(inventory.available(self.tier), 3)
+        self.assertEqual(self.tier.shards.count(), 4)
+        with self.assertRaises(inventory.SoldOut) as cm:
+            inventory.reserve(self.tier, 4)
+        self.assertEqual(cm.exception.available, 3)
+        inventory.reserve(self.tier, 3)
+        self.assertEqual(inventory.available(self.tier), 0)
+
+    def test_holds_on_shards_convert_and_sweep(self):
+        inventory.set_sharding(self.tier, 2)
+        kept = inventory.hold(self.tier, 2, 'a@example.com')
+        lapsed = inventory.hold(self.tier, 2, 'b@example.com')
+        self.assertIsNotNone(kept.shard_slot)
+        SeatHold.objects.filter(pk=lapsed.pk).update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        inventory.convert(kept)
+        self.assertEqual(inventory.sweep_expired_holds(), 1)
+
+        self.assertEqual(inventory.consolidate(self.tier), 2)
+        self.tier.refresh_from_db()
+        self.assertEqual((self.tier.sold, self.tier.held, self.tier.available), (4, 0, 6))
+
+    def test_lowering_capacity_respreads_shards(self):
+        inventory.set_sharding(self.tier, 2)
+        self.tier.capacity = 5
+        self.tier.save()
+        self.assertEqual(sum(self.tier.shards.values_list('capacity', flat=True)), 3)
+        inventory.reserve(self.tier, 3)
+        with self.assertRaises(inventory.SoldOut):
+            inventory.reserve(self.tier, 1)
+        self.assertEqual(inventory.available(self.tier), 0)
+
+    def test_edits_do_not_write_back_stale_counters(self):
+        stale = TicketTier.objects.get(pk=self.tier.pk)
+        inventory.reserve(self.tier, 3)
+        stale.name = 'General'
+        stale.save()
+        self.tier.refresh_from_db()
+        self.assertEqual((self.tier.name, self.tier.sold), ('General', 5))
+
+    def test_switching_off_folds_into_sold(self):
+        inventory.set_sharding(self.tier, 4)
+        for _ in range(3):
+            inventory.reserve(self.tier, 1)
+        live = inventory.hold(self.tier, 1, 'a@example.com')
+        inventory.set_sharding(self.tier, 0)
+        self.assertFalse(self.tier.shards.exists())
+        self.assertEqual((self.tier.sold, self.tier.held, self.tier.shard_count), (5, 1, 0))
+        # a hold taken on a shard settles against the tier row after the fold
+        inventory.convert(live)
+        self.tier.refresh_from_db()
+        self.assertEqual((self.tier.sold, self.tier.held), (6, 0))
+
+    def test_organizer_switches_flash_sale_mode(self):
+        self.user.profile.role = 'ORGANIZER'
+        self.user.profile.save()
+        self.client.force_login(self.user)
+        url = reverse('tier_sharding', args=[self.tier.pk])
+        with self.settings(TIER_SHARDS=4):
+            self.client.post(url, {'mode': 'sharded'})
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.shard_count, 4)
+        with self.settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            page = self.client.get(reverse('organizer_dashboard'))
+        self.assertContains(page, 'Flash-sale mode (4 counters)')
+        self.assertContains(page, '8 of 10 left')
+        self.client.post(url, {'mode': 'single'})
+        self.tier.refresh_from_db()
+        self.assertEqual(self.tier.shard_count, 0)
+
+
+class FulfillmentPipelineTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.event = make_event(self.user)
+        self.tier = TicketTier.objects.create(event=self.event, name='Free', price=0, capacity=10)
+        self.client.force_login(self.user)
+
+    def test_one_booking_renders_and_sends_once(self):
+        with mock.patch.object(qr, 'build', wraps=qr.build) as qr_build, \
+                mock.patch.object(fulfillment, 'render_certificate_pdf', wraps=fulfillment.render_certificate_pdf) as cert:
+            self.client.post(reverse('book_event', args=[self.event.pk]), {
+                'email': 'buyer@example.com', 'tier': self.tier.pk, 'quantity': 1,
+            })
+            jobs.drain()
+            outbox.drain()
+            ticket = Ticket.objects.get()
+            # a retried / duplicated job or drain must not redo any stage
+            fulfillment.fulfill(ticket.pk)
+            jobs.enqueue("ticket.fulfill", ticket_id=ticket.pk)
+            jobs.drain()
+            outbox.drain()
+
+        self.assertEqual(qr_build.call_count, 1)
+        self.assertEqual(cert.call_count, 1)
+        self.assertEqual(len(mail.outbox), 1)
+        attachments = [name for name, _, _ in mail.outbox[0].attachments]
+        self.assertEqual(attachments, ['e-ticket-qr.png', f'certificate_{ticket.code}.pdf'])
+
+        ticket.refresh_from_db()
+        self.assertIsNotNone(ticket.qr_generated_at)
+        self.assertIsNotNone(ticket.certificate_generated_at)
+        self.assertIsNotNone(ticket.email_sent_at)
+
+    def test_outbox_renders_missing_artifacts(self):
+        # the drainer may run before the fulfillment job; it renders what it needs once
+        self.client.post(reverse('book_event', args=[self.event.pk]), {
+            'email': 'buyer@example.com', 'tier': self.tier.pk, 'quantity': 1,
+        })
+        self.assertEqual(outbox.drain(), (1, 0))
+        with mock.patch.object(fulfillment, 'render_certificate_pdf') as cert:
+            jobs.drain()
+        cert.assert_not_called()
+
+    def test_certificate_is_stored_only_by_the_claimant(self):
+        ticket = Ticket.objects.create(event=self.event, user=self.user, email='buyer@example.com', quantity=1)
+        # the job claimed the stage and is still rendering
+        Ticket.objects.filter(pk=ticket.pk).update(certificate_generated_at=timezone.now())
+        with mock.patch.object(fulfillment, 'render_certificate_pdf', return_value=b'%PDF-copy'):
+            self.assertEqual(fulfillment.ensure_certificate(Ticket.objects.get(pk=ticket.pk)), b'%PDF-copy')
+        self.assertFalse(Ticket.objects.get(pk=ticket.pk).certificate_file)
+        self.assertFalse(os.path.exists(os.path.join(self._media_root, 'tickets')))
+
+        # a claim older than a job lease is from a dead run and is taken over
+        Ticket.objects.filter(pk=ticket.pk).update(certificate_generated_at=timezone.now() - datetime.timedelta(days=1))
+        fulfillment.fulfill(ticket.pk)
+        ticket.refresh_from_db()
+        self.assertTrue(ticket.certificate_file)
+        with mock.patch.object(fulfillment, 'render_certificate_pdf') as cert:
+            fulfillment.ensure_certificate(Ticket.objects.get(pk=ticket.pk))
+        cert.assert_not_called()
+
+
+class OutboxTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.event = make_event(self.user)
+        self.ticket = Ticket.objects.create(event=self.event, user=self.user, email='buyer@example.com', quantity=1)
+        self.message = outbox.add(outbox.KIND_CONFIRMATION, 'buyer@example.com', ticket=self.ticket,
+                                  base_url='http://testserver/')
+
+    def smtp_down(self):
+        return mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                          side_effect=OSError('smtp down'))
+
+    def test_failed_send_backs_off_then_dead_letters(self):
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2), self.smtp_down():
+            self.assertEqual(outbox.drain(), (0, 1))
+            self.message.refresh_from_db()
+            self.assertEqual(self.message.status, OutboxMessage.STATUS_PENDING)
+            self.assertGreater(self.message.next_attempt_at, timezone.now())
+            # not due yet
+            self.assertEqual(outbox.drain(), (0, 0))
+
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            outbox.drain()
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), (OutboxMessage.STATUS_DEAD, 2))
+        self.assertEqual(len(mail.outbox), 0)
+
+        outbox.requeue(OutboxMessage.objects.all())
+        with mock.patch.object(fulfillment, 'render_certificate_pdf') as cert:
+            self.assertEqual(outbox.drain(), (1, 0))
+        cert.assert_not_called()
+        self.ticket.refresh_from_db()
+        self.assertIsNotNone(self.ticket.email_sent_at)
+        self.assertEqual(mail.outbox[0].to, ['buyer@example.com'])
+
+    def test_claimed_message_is_invisible_until_lease_expires(self):
+        self.assertEqual(len(outbox.claim('drainer-1')), 1)
+        self.assertEqual(outbox.claim('drainer-2'), [])
+        OutboxMessage.objects.update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual([m.pk for m in outbox.claim('drainer-2')], [self.message.pk])
+
+    def test_rolled_back_booking_leaves_no_message(self):
+        from django.db import transaction
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            outbox.add(outbox.KIND_CONFIRMATION, 'x@example.com', base_url='http://testserver/')
+            raise RuntimeError
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+
+class TicketQRTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        qr._memory.clear()
+        self.addCleanup(qr._memory.clear)
+        User = get_user_model()
+        self.user = User.objects.create_user('buyer', 'buyer@example.com', 'pw-123456')
+        self.ticket = Ticket.objects.create(event=make_event(self.user), email='buyer@example.com')
+
+    def url(self, fmt):
+        return reverse('ticket_qr', args=[self.ticket.code, fmt])
+
+    def test_rendered_once_then_served_from_cache(self):
+        with mock.patch.object(qr, 'build', wraps=qr.build) as build:
+            first = self.client.get(self.url('svg'))
+            second = self.client.get(self.url('svg'))
+            qr._memory.clear()
+            from_disk = self.client.get(self.url('svg'))
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(first['Content-Type'], 'image/svg+xml')
+        self.assertTrue(first.content.startswith(b'<svg'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first.content, from_disk.content)
+
+    def test_strong_etag_revalidates(self):
+        response = self.client.get(self.url('png'))
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertTrue(response.content.startswith(b'\x89PNG'))
+        with mock.patch.object(qr, 'get') as get:
+            cached = self.client.get(self.url('png'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        get.assert_not_called()
+        self.assertNotEqual(self.client.get(self.url('svg'))['ETag'], etag)
+
+    def test_png_matches_matrix(self):
+        from PIL import Image
+        payload = fulfillment.qr_payload(self.ticket)
+        rows = qr.matrix(payload)
+        image = Image.open(io.BytesIO(qr.build(payload, 'png')))
+        scale = image.width // len(rows)
+        for y in (0, 4, 10, len(rows) // 2):
+            for x in range(len(rows)):
+                self.assertEqual(image.getpixel((x * scale, y * scale)) == 0, rows[y][x])
+
+    def test_unknown_format_or_code_is_404(self):
+        self.assertEqual(self.client.get(self.url('gif')).status_code, 404)
+        self.assertEqual(self.client.get(reverse('ticket_qr', args=['nope', 'svg'])).status_code, 404)
+
+    def test_concurrent_render_stores_one_file(self):
+        payload = fulfillment.qr_payload(self.ticket)
+        path = qr._path(qr.cache_key(payload, 'svg'), 'svg')
+        qr.get(payload, 'svg')
+        qr._memory.clear()
+        # another request stored the file between this one's miss and its save
+        with mock.patch.object(default_storage, 'open', side_effect=FileNotFoundError):
+            qr.get(payload, 'svg')
+        self.assertEqual(default_storage.listdir(os.path.dirname(path))[1], [os.path.basename(path)])
+
+    def test_prune_deletes_oldest_first(self):
+        paths = []
+        for n in range(3):
+            payload = f'{fulfillment.qr_payload(self.ticket)}|{n}'
+            qr.get(payload, 'png')
+            paths.append(qr._path(qr.cache_key(payload, 'png'), 'png'))
+            stamp = time.time() - 3600 * (3 - n)
+            os.utime(default_storage.path(paths[-1]), (stamp, stamp))
+        oldest = default_storage.size(paths[0])
+        self.assertEqual(qr.prune(sum(default_storage.size(p) for p in paths[1:])), (1, oldest))
+        self.assertEqual([default_storage.exists(p) for p in paths], [False, True, True])
+
+        call_command('prune_qr_cache', '--max-mb', '0', stdout=io.StringIO())
+        self.assertFalse(any(default_storage.exists(p) for p in paths))
+        qr._memory.clear()
+        self.assertEqual(qr.get(fulfillment.qr_payload(self.ticket) + '|2', 'png')[:4], b'\x89PNG')
+
+
+class CertificateEngineTests(TestCase):
+    fields = {
+        'name': 'Ada (Lovelace)', 'event_title': 'Analytical Engines', 'event_date': 'May 01, 2026',
+        'issued_on': 'May 02, 2026', 'quantity': 2,
+    }
+
+    def assertValidXref(self, pdf):
+        startxref = int(pdf.rsplit(b'startxref', 1)[1].split()[0])
+        self.assertTrue(pdf[startxref:].startswith(b'xref'))
+        rows = pdf[startxref:].split(b'trailer')[0].split(b'\n')[2:]
+        for number, row in enumerate(r for r in rows if r.strip()):
+            offset, _, kind = row.split()
+            if kind == b'n':
+                self.assertTrue(pdf[int(offset):].startswith(b'%d 0 obj' % number))
+
+    def test_compiled_render_is_a_consistent_pdf(self):
+        for key in utils_certificates.TEMPLATES:
+            pdf = utils_certificates.render_certificate(self.fields, key)
+            self.assertTrue(pdf.startswith(b'%PDF'))
+            self.assertIn(b'Ada \\(Lovelace\\)', pdf)
+            self.assertValidXref(pdf)
+
+    def test_static_part_is_compiled_once(self):
+        utils_certificates._compiled.clear()
+        with mock.patch.object(utils_certificates.ClassicTemplate, 'draw_static',
+                               wraps=utils_certificates.TEMPLATES['classic'].draw_static) as static:
+            for i in range(5):
+                utils_certificates.render_certificate(dict(self.fields, name=f'Guest {i}'), 'classic')
+        self.assertEqual(static.call_count, 1)
+
+    def test_unencodable_names_fall_back_to_canvas(self):
+        pdf = utils_certificates.render_certificate(dict(self.fields, name='山田 太郎'), 'attendance')
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+
+class GenerateCertificatesCommandTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.user = User.objects.create_user('org', 'org@example.com', 'pw-123456')
+        self.past = make_event(self.user, days=-3, title='Past')
+        self.future = make_event(self.user, days=3, title='Future')
+        for i in range(5):
+            Ticket.objects.create(event=self.past, email=f'a{i}@example.com')
+        Ticket.objects.create(event=self.future, email='later@example.com')
+
+    def run_command(self, *args):
+        call_command('generate_certificates', '--workers', '1', '--chunk-size', '2', *args, stdout=io.StringIO())
+
+    def test_generates_past_tickets_and_queues_emails(self):
+        self.run_command()
+        done = Ticket.objects.filter(certificate_generated_at__isnull=False)
+        self.assertEqual(set(done.values_list('event_id', flat=True)), {self.past.pk})
+        self.assertEqual(done.count(), 5)
+        self.assertEqual(OutboxMessage.objects.filter(kind=outbox.KIND_CERTIFICATE).count(), 5)
+        self.assertFalse(BatchCheckpoint.objects.exists())
+        # nothing left on a second run
+        self.run_command()
+        self.assertEqual(OutboxMessage.objects.count(), 5)
+        self.assertEqual(outbox.drain(), (5, 0))
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_resumes_from_checkpoint(self):
+        tickets = list(Ticket.objects.filter(event=self.past).order_by('pk'))
+        BatchCheckpoint.objects.create(
+            name='generate_certificates:event=*:since=*', position=tickets[2].pk, processed=3,
+        )
+        self.run_command('--no-email')
+        done = set(Ticket.objects.filter(certificate_generated_at__isnull=False).values_list('pk', flat=True))
+        self.assertEqual(done, {t.pk for t in tickets[3:]})
+
+    def test_leaves_tickets_claimed_elsewhere(self):
+        tickets = list(Ticket.objects.filter(event=self.past).order_by('pk'))
+        # a fulfillment run is rendering the first one; the second was stored since
+        Ticket.objects.filter(pk=tickets[0].pk).update(certificate_generated_at=timezone.now())
+        fulfillment.ensure_certificate(tickets[1])
+        stored = Ticket.objects.get(pk=tickets[1].pk).certificate_file.name
+        self.run_command()
+        self.assertEqual(Ticket.objects.get(pk=tickets[0].pk).certificate_file, '')
+        self.assertEqual(Ticket.objects.get(pk=tickets[1].pk).certificate_file.name, stored)
+        self.assertEqual(
+            set(OutboxMessage.objects.filter(kind=outbox.KIND_CERTIFICATE).values_list('ticket_id', flat=True)),
+            {t.pk for t in tickets[2:]},
+        )
+
+    def test_force_regenerates_stored_certificates(self):
+        self.run_command('--no-email')
+        Ticket.objects.update(certificate_generated_at=timezone.now() - datetime.timedelta(hours=1))
+        self.run_command('--no-email', '--force')
+        recent = timezone.now() - datetime.timedelta(minutes=1)
+        self.assertEqual(Ticket.objects.filter(event=self.past, certificate_generated_at__gte=recent).count(), 5)
+
+    def test_dry_run_writes_nothing(self):
+        self.run_command('--dry-run')
+        self.assertFalse(Ticket.objects.filter(certificate_generated_at__isnull=False).exists())
+
+    def test_pool_renders_under_spawn(self):
+        # the default start method on macOS and Windows
+        ticket = Ticket.objects.filter(event=self.past).first()
+        item = (ticket.pk, utils_certificates.certificate_fields(ticket), utils_certificates.DEFAULT_TEMPLATE,
+                utils_certificates.default_issuer())
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=utils_certificates.init_pool_worker) as pool:
+            pk, pdf = pool.submit(utils_certificates.render_item, item).result(timeout=60)
+        self.assertEqual(pk, ticket.pk)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+
+
+class MailDispatcherTests(TestCase):
+    def _messages(self, n):
+        return [mail.EmailMessage(f'm{i}', 'body', 'from@example.com', [f'u{i}@example.com']) for i in range(n)]
+
+    def test_batches_over_one_connection(self):
+        connection = mail.get_connection()
+        with mock.patch.object(connection, 'send_messages', wraps=connection.send_messages) as send, \
+                mock.patch.object(connection, 'open', wraps=connection.open) as opened:
+            with MailDispatcher(batch_size=2, rate_per_minute=0, connection=connection) as dispatcher:
+                self.assertEqual(dispatcher.send(self._messages(5)), [])
+        self.assertEqual([len(c.args[0]) for c in send.call_args_list], [2, 2, 1])
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(dispatcher.sent, 5)
+
+    def test_rate_limit_spaces_batches(self):
+        clock = [100.0]
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        with mock.patch('myapp08.mail.time.sleep', side_effect=fake_sleep), \
+                mock.patch('myapp08.mail.time.monotonic', side_effect=lambda: clock[0]):
+            dispatcher = MailDispatcher(batch_size=1, rate_per_minute=60, connection=mail.get_connection())
+            dispatcher.send(self._messages(3))
+        # 60/min -> one message per second; the first goes out immediately
+        self.assertEqual(sleeps, [1.0, 1.0])
+
+    def test_failed_batch_is_returned(self):
+        connection = mail.get_connection()
+        with mock.patch.object(connection, 'send_messages', side_effect=[OSError('down'), 1]):
+            dispatcher = MailDispatcher(batch_size=1, rate_per_minute=0, connection=connection)
+            messages = self._messages(2)
+            self.assertEqual(dispatcher.send(messages), [messages[0]])
+        self.assertEqual((dispatcher.sent, dispatcher.failed), (1, 1))
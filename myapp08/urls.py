@@ -6,13 +6,19 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('events/', views.event_list, name='event_list'),
+    path('events/search/', views.event_search, name='event_search'),
+    path('events/search.json', views.event_search_json, name='event_search_json'),
     path('event/<int:pk>/', views.event_detail, name='event_detail'),
+    path('event/<int:pk>/availability.json', views.event_availability_json, name='event_availability_json'),
     path('calendar/', views.calendar_view, name='calendar'),
+    path('calendar/events.json', views.calendar_events_json, name='calendar_events_json'),
     path('confirmation/', views.confirmation_page, name='confirmation_page'),
 
    
     path('event/create/', views.event_create, name='event_create'),
     path('event/<int:pk>/book/', views.book_event, name='book_event'),
+    path('event/<int:pk>/queue/', views.waiting_room_view, name='waiting_room'),
+    path('event/<int:pk>/queue/status/', views.waiting_room_status, name='waiting_room_status'),
     path('event/<int:pk>/pay/', views.pay_event, name='pay_event'),
     path('event/<int:pk>/rsvp/', views.rsvp_event, name='rsvp_event'),
     path('event/<int:pk>/pay/', views.pay_event, name='pay_event'),
@@ -24,6 +30,7 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('dashboard/organizer/', views.organizer_dashboard, name='organizer_dashboard'),
     path('dashboard/attendee/', views.attendee_dashboard, name='attendee_dashboard'),
+    path('dashboard/organizer/tier/<int:pk>/sharding/', views.tier_sharding, name='tier_sharding'),
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.profile_edit, name='profile_edit'),
 
@@ -40,6 +47,7 @@ urlpatterns = [
 
 
     path('certificate/download/<int:ticket_id>/', views.download_certificate, name='download_certificate'),
+    path('ticket/<str:code>/qr.<str:fmt>', views.ticket_qr, name='ticket_qr'),
 
 ]
 
@@ -1,122 +1,337 @@
 # myapp08/utils_certificates.py
+"""
+Certificate engine.
+
+Each design is a ``CertificateTemplate`` split in two parts:
+
+* ``draw_static`` — background, border, headings, signature line. This is
+  drawn once per process into a form XObject inside a compiled PDF
+  (``CompiledTemplate``), which is reused for every certificate.
+* ``draw_fields`` — the per-ticket text (name, event title, dates), written
+  straight into the compiled document's page stream.
+
+Templates are looked up by key (``Event.certificate_template``), so new
+layouts only need a subclass added to ``TEMPLATES``. Rendering takes a plain
+dict of fields, which keeps it free of ORM access and safe to run in a
+process pool.
+"""
+import datetime
 import io
-from django.core.files.base import ContentFile
-from django.template.loader import render_to_string
-from django.utils import timezone
-from django.conf import settings
-from django.core.mail import EmailMessage
 
+import django
+from django.conf import settings
+from reportlab.lib.colors import HexColor
 from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.rl_accel import escapePDF, fp_str
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm, cm
-from reportlab.lib.colors import HexColor
 
-from .models import Certificate
 
-def generate_certificate_pdf(ticket, issuer_name=None):
+FORM_NAME = "certificate_static"
+
+
+class CertificateTemplate:
+    key = None
+    label = None
+    pagesize = landscape(A4)
+    # every font draw_fields may select
+    field_fonts = ("Helvetica", "Helvetica-Bold")
+
+    def draw_static(self, c, width, height, issuer):
+        raise NotImplementedError
+
+    def draw_fields(self, c, width, height, fields):
+        raise NotImplementedError
+
+
+class ClassicTemplate(CertificateTemplate):
+    """The original "Certificate of Participation" design."""
+    key = "classic"
+    label = "Classic (Participation)"
+
+    def draw_static(self, c, width, height, issuer):
+        c.setFillColorRGB(0.95, 0.95, 0.98)
+        c.rect(0.5 * cm, 0.5 * cm, width - 1 * cm, height - 1 * cm, fill=1, stroke=0)
+
+        c.setFont("Helvetica-Bold", 34)
+        c.setFillColorRGB(0.05, 0.2, 0.45)
+        c.drawCentredString(width / 2, height - 4 * cm, "Certificate of Participation")
+
+        c.setFont("Helvetica", 18)
+        c.setFillColorRGB(0.15, 0.15, 0.15)
+        c.drawCentredString(width / 2, height - 6 * cm, "Presented to")
+
+        c.setFont("Helvetica", 12)
+        c.drawString(3 * cm, 2.5 * cm, f"Issued by: {issuer}")
+
+        c.line(width / 2 - 4 * cm, 3.5 * cm, width / 2 + 4 * cm, 3.5 * cm)
+        c.setFont("Helvetica-Oblique", 10)
+        c.drawCentredString(width / 2, 3.1 * cm, "Organizer Signature")
+
+    def draw_fields(self, c, width, height, fields):
+        c.setFillColorRGB(0.15, 0.15, 0.15)
+        c.setFont("Helvetica-Bold", 26)
+        c.drawCentredString(width / 2, height - 8 * cm, fields["name"])
+
+        c.setFont("Helvetica", 16)
+        c.drawCentredString(
+            width / 2, height - 10 * cm,
+            f"For participating in \"{fields['event_title']}\" on {fields['event_date']}",
+        )
+
+        c.setFont("Helvetica", 12)
+        c.drawRightString(width - 3 * cm, 2.5 * cm, f"Date: {fields['issued_on']}")
+
+
+class AttendanceTemplate(CertificateTemplate):
+    """Bordered "Certificate of Attendance" design."""
+    key = "attendance"
+    label = "Attendance (bordered)"
+    field_fonts = ("Helvetica", "Helvetica-Bold", "Helvetica-BoldOblique")
+    margin = 30
+
+    def draw_static(self, c, width, height, issuer):
+        margin = self.margin
+        c.setFillColor(HexColor('#f9f9f9'))
+        c.rect(0, 0, width, height, fill=True, stroke=False)
+
+        c.setLineWidth(2)
+        c.setStrokeColor(HexColor('#0d6efd'))
+        c.rect(margin, margin, width - 2 * margin, height - 2 * margin, stroke=True, fill=False)
+
+        title_y = height - 90
+        c.setFont("Helvetica-Bold", 30)
+        c.setFillColor(HexColor('#0d6efd'))
+        c.drawCentredString(width / 2, title_y, "Certificate of Attendance")
+
+        c.setFont("Helvetica", 14)
+        c.setFillColor(HexColor('#333333'))
+        c.drawCentredString(width / 2, title_y - 26, "This certifies that")
+
+        c.setFont("Helvetica", 16)
+        c.drawCentredString(width / 2, title_y - 110, "has attended the event:")
+
+        sig_y = margin + 70
+        c.setFont("Helvetica", 12)
+        c.drawString(margin + 40, sig_y, f"Issued by: {issuer}")
+        c.line(width - margin - 220, sig_y + 6, width - margin - 20, sig_y + 6)
+        c.drawString(width - margin - 220, sig_y - 14, "Organizer / Signature")
+
+    def draw_fields(self, c, width, height, fields):
+        title_y = height - 90
+        c.setFillColor(HexColor('#333333'))
+        c.setFont("Helvetica-Bold", 24)
+        c.drawCentredString(width / 2, title_y - 70, fields["name"])
+
+        c.setFont("Helvetica-BoldOblique", 20)
+        c.drawCentredString(width / 2, title_y - 140, fields["event_title"])
+
+        c.setFont("Helvetica", 12)
+        c.drawCentredString(
+            width / 2, title_y - 170,
+            f"Date: {fields['event_date']} • Tickets: {fields['quantity']}",
+        )
+
+
+TEMPLATES = {t.key: t for t in (ClassicTemplate(), AttendanceTemplate())}
+DEFAULT_TEMPLATE = ClassicTemplate.key
+TEMPLATE_CHOICES = tuple((t.key, t.label) for t in TEMPLATES.values())
+
+
+def get_template(key):
+    return TEMPLATES.get(key) or TEMPLATES[DEFAULT_TEMPLATE]
+
+
+def default_issuer():
+    return getattr(settings, 'DEFAULT_FROM_EMAIL', '') or 'organizer@example.com'
+
+
+class _NeedsCanvas(Exception):
+    """Text the fast path can't encode (needs a substitution font)."""
+
+
+class _OpWriter:
     """
-    Create a simple PDF certificate for a Ticket.
-    Returns (certificate_instance, bytes_content)
+    Canvas stand-in for ``draw_fields``: turns the few text calls a design
+    makes into raw PDF operators, using the font names of the compiled document.
     """
-   
-    cert, created = Certificate.objects.get_or_create(ticket=ticket)
 
-  
-    if cert.pdf_file:
-       
-        cert.pdf_file.open('rb')
-        content = cert.pdf_file.read()
-        cert.pdf_file.close()
-        return cert, content
+    def __init__(self, font_names):
+        self._font_names = font_names
+        self._font = None
+        self._size = 12
+        self.ops = []
 
-  
-    buffer = io.BytesIO()
-  
-    c = canvas.Canvas(buffer, pagesize=landscape(A4))
+    def setFont(self, name, size, leading=None):
+        if name not in self._font_names:
+            raise _NeedsCanvas(name)
+        self._font = pdfmetrics.getFont(name)
+        self._size = size
+        self.ops.append(f"BT {self._font_names[name]} {fp_str(size)} Tf ET")
 
-  
-    width, height = landscape(A4)
+    def setFillColorRGB(self, r, g, b):
+        self.ops.append(f"{fp_str(r, g, b)} rg")
 
-  
-    c.setFillColor(HexColor('#f9f9f9'))
-    c.rect(0, 0, width, height, fill=True, stroke=False)
+    def setFillColor(self, color):
+        self.setFillColorRGB(*color.rgb())
 
+    def _text(self, x, y, text):
+        chunks = pdfmetrics.unicode2T1(text, [self._font] + self._font.substitutionFonts)
+        if any(f is not self._font for f, _ in chunks):
+            raise _NeedsCanvas(text)
+        encoded = ''.join(f"({escapePDF(t)}) Tj " for _, t in chunks)
+        self.ops.append(f"BT 1 0 0 1 {fp_str(x)} {fp_str(y)} Tm {encoded}ET")
 
-    c.setLineWidth(2)
-    c.setStrokeColor(HexColor('#0d6efd'))
-    margin = 30
-    c.rect(margin, margin, width - 2*margin, height - 2*margin, stroke=True, fill=False)
+    def _width(self, text):
+        return pdfmetrics.stringWidth(text, self._font.fontName, self._size)
+
+    def drawString(self, x, y, text):
+        self._text(x, y, text)
+
+    def drawCentredString(self, x, y, text):
+        self._text(x - self._width(text) / 2, y, text)
 
-    c.setFont("Helvetica-Bold", 30)
-    title_y = height - 90
-    c.setFillColor(HexColor('#0d6efd'))
-    c.drawCentredString(width/2, title_y, "Certificate of Attendance")
+    def drawRightString(self, x, y, text):
+        self._text(x - self._width(text), y, text)
 
-    c.setFont("Helvetica", 14)
-    c.setFillColor(HexColor('#333333'))
-    c.drawCentredString(width/2, title_y - 26, "This certifies that")
 
-   
-    attendee_name = ticket.user.get_full_name() if getattr(ticket, 'user', None) and ticket.user.get_full_name() else ticket.email
-    c.setFont("Helvetica-Bold", 24)
-    c.drawCentredString(width/2, title_y - 70, attendee_name)
+class CompiledTemplate:
+    """
+    A design rendered once to a complete PDF whose page stream holds the
+    static form plus a placeholder. Rendering a certificate splices the
+    per-ticket operators into the placeholder and rewrites /Length and the
+    xref table, so no canvas is built per ticket.
+    """
+    MARKER = b"%%CERTIFICATE-FIELDS%%"
 
-  
-    c.setFont("Helvetica", 16)
-    event_line_y = title_y - 110
-    c.drawCentredString(width/2, event_line_y, f"has attended the event:")
+    def __init__(self, template, issuer):
+        self.template = template
+        buf = io.BytesIO()
+        c = canvas.Canvas(buf, pagesize=template.pagesize, invariant=1, pageCompression=0)
+        width, height = template.pagesize
+        c.beginForm(FORM_NAME)
+        template.draw_static(c, width, height, issuer)
+        c.endForm()
+        c.doForm(FORM_NAME)
+        for name in template.field_fonts:
+            c._doc.getInternalFontName(name)
+        self.font_names = dict(c._doc.fontMapping)
+        c._code.append(self.MARKER.decode())
+        c.showPage()
+        c.save()
+        self._split(buf.getvalue())
 
-    c.setFont("Helvetica-BoldOblique", 20)
-    c.drawCentredString(width/2, event_line_y - 30, ticket.event.title)
+    def _split(self, pdf):
+        m = pdf.index(self.MARKER)
+        len_start = pdf.rindex(b"/Length ", 0, m) + len(b"/Length ")
+        len_end = len_start
+        while pdf[len_end:len_end + 1].isdigit():
+            len_end += 1
+        xref_at = pdf.rindex(b"\nxref\n") + 1
+        trailer_at = pdf.index(b"trailer", xref_at)
+        rows = pdf[xref_at:trailer_at].split(b"\n")[2:]
+        self._entries = [row for row in rows if row.strip()]
+        self._stream_len = int(pdf[len_start:len_end])
+        self._len_span = (len_start, len_end)
+        self._marker_at = m
+        self._head = pdf[:len_start]
+        self._mid = pdf[len_end:m]
+        self._tail = pdf[m + len(self.MARKER):xref_at]
+        self._trailer = pdf[trailer_at:pdf.index(b"startxref", trailer_at)]
 
-    
-    c.setFont("Helvetica", 12)
-    date_str = ticket.event.date.strftime("%B %d, %Y") if getattr(ticket.event, 'date', None) else ""
-    c.drawCentredString(width/2, event_line_y - 60, f"Date: {date_str} • Tickets: {ticket.quantity}")
+    def render(self, fields):
+        writer = _OpWriter(self.font_names)
+        width, height = self.template.pagesize
+        self.template.draw_fields(writer, width, height, fields)
+        ops = "\n".join(writer.ops).encode("latin-1")
 
-  
-    sig_y = margin + 70
-    c.setFont("Helvetica", 12)
-    issuer = issuer_name or getattr(settings, 'DEFAULT_FROM_EMAIL', '')
-    c.drawString(margin + 40, sig_y, f"Issued by: {issuer}")
-    c.line(width - margin - 220, sig_y + 6, width - margin - 20, sig_y + 6)
-    c.drawString(width - margin - 220, sig_y - 14, "Organizer / Signature")
+        length = str(self._stream_len - len(self.MARKER) + len(ops)).encode()
+        len_start, len_end = self._len_span
+        len_shift = len(length) - (len_end - len_start)
+        ops_shift = len(ops) - len(self.MARKER)
 
+        body = b"".join((self._head, length, self._mid, ops, self._tail))
+        xref = [b"xref", b"0 %d" % len(self._entries)]
+        for row in self._entries:
+            offset, gen, kind = row.split()
+            offset = int(offset)
+            if kind == b"n":
+                if offset > len_start:
+                    offset += len_shift
+                if offset > self._marker_at:
+                    offset += ops_shift
+            xref.append(b"%010d %s %s " % (offset, gen, kind))
+        return b"".join((
+            body, b"\n".join(xref), b"\n", self._trailer,
+            b"startxref\n%d\n%%%%EOF\n" % len(body),
+        ))
 
-    c.showPage()
-    c.save()
 
-    buffer.seek(0)
-    content = buffer.getvalue()
-    buffer.close()
+# (template key, issuer) -> CompiledTemplate
+_compiled = {}
 
 
-    filename = f"certificate_ticket_{ticket.id}.pdf"
-    cert.pdf_file.save(filename, ContentFile(content), save=True)
+def compile_template(key, issuer=None):
+    """Build (once per process) the compiled form of a design."""
+    template = get_template(key)
+    issuer = issuer or default_issuer()
+    cache_key = (template.key, issuer)
+    if cache_key not in _compiled:
+        _compiled[cache_key] = CompiledTemplate(template, issuer)
+    return _compiled[cache_key]
 
-    return cert, content
 
+def _render_on_canvas(template, fields, issuer):
+    """Slow path: draw everything with reportlab (non-Latin-1 names etc.)."""
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=template.pagesize)
+    width, height = template.pagesize
+    template.draw_static(c, width, height, issuer)
+    template.draw_fields(c, width, height, fields)
+    c.showPage()
+    c.save()
+    return buf.getvalue()
 
-def _send_certificate_email(ticket, cert, subject_prefix="Certificate of Attendance"):
+
+def render_certificate(fields, template_key=DEFAULT_TEMPLATE, issuer=None):
     """
-    Send email with certificate attached.
-    ticket: Ticket instance
-    cert: Certificate instance (with cert.pdf_file)
+    Render one certificate and return the PDF bytes.
+    ``fields``: name, event_title, event_date, issued_on, quantity.
     """
-    to_email = ticket.email
-    subject = f"{subject_prefix} — {ticket.event.title}"
-    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
-
-   
-    html_content = render_to_string('email/certificate_email.html', {'ticket': ticket, 'certificate': cert})
-    msg = EmailMessage(subject, html_content, from_email, [to_email])
-    msg.content_subtype = "html"
-
-  
-    if cert.pdf_file:
-        cert.pdf_file.open('rb')
-        pdf_bytes = cert.pdf_file.read()
-        cert.pdf_file.close()
-        msg.attach(f"{cert.pdf_file.name.split('/')[-1]}", pdf_bytes, 'application/pdf')
-
-    msg.send(fail_silently=False)
+    template = get_template(template_key)
+    issuer = issuer or default_issuer()
+    try:
+        return compile_template(template.key, issuer).render(fields)
+    except _NeedsCanvas:
+        return _render_on_canvas(template, fields, issuer)
+
+
+def init_pool_worker():
+    """Process pool initializer: spawned processes (macOS, Windows) start without Django set up."""
+    django.setup()
+
+
+def render_item(item):
+    """Pool task: ``(pk, fields, template_key, issuer)`` -> ``(pk, pdf bytes)``."""
+    pk, fields, template_key, issuer = item
+    return pk, render_certificate(fields, template_key, issuer)
+
+
+def certificate_fields(ticket):
+    """Plain, picklable per-ticket values for ``render_certificate``."""
+    event = ticket.event
+    user = ticket.user
+    name = user.get_full_name() if user and user.get_full_name() else ticket.email
+    return {
+        "name": name,
+        "event_title": event.title if event else "Event",
+        "event_date": event.date.strftime("%B %d, %Y") if getattr(event, 'date', None) else "",
+        "issued_on": datetime.date.today().strftime('%B %d, %Y'),
+        "quantity": ticket.quantity,
+    }
+
+
+def render_ticket_certificate(ticket):
+    template_key = getattr(ticket.event, 'certificate_template', None) or DEFAULT_TEMPLATE
+    return render_certificate(certificate_fields(ticket), template_key)
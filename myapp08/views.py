@@ -6,25 +6,21 @@ from django.contrib import messages
 from django.urls import reverse
 from django.conf import settings
 
-from django.core.mail import EmailMultiAlternatives, EmailMessage
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-
 from django.db import transaction
-from django.db.models import F, Sum, Q
-from django.db.models.functions import TruncDate
+from django.db.models import F, Prefetch, Q
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import JsonResponse, FileResponse, Http404
-from decimal import Decimal
+from django.http import JsonResponse, FileResponse, Http404, HttpResponse, HttpResponseNotModified
 
 from django.utils import timezone
-from django.core.files.base import ContentFile
-
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
+from django.utils.cache import patch_cache_control
 
-from .models import Event, RSVP, Ticket, TicketTier, UserProfile
+from .models import Event, EventStats, RSVP, SeatHold, Ticket, TicketTier, UserProfile
+from . import (
+    analytics, caching, calendar_feed, event_pages, inventory, outbox, ownership, pagination, profile_stats, qr, search,
+    waiting_room,
+)
+from .jobs import enqueue
+from .fulfillment import certificate_filename, ensure_certificate, qr_payload
 from .forms import (
     CustomUserCreationForm,
     EventForm,
@@ -32,226 +28,95 @@ from .forms import (
     ProfileForm,
 )
 
-import datetime
-import traceback
 import io
-import qrcode
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 
 
 def _event_is_past(event) -> bool:
-    """Returns True if event date/time has passed (local timezone aware)."""
-    today = timezone.localdate()
-    now_t = timezone.localtime().time()
-    if event.date < today:
-        return True
-    if event.date == today and event.time and event.time < now_t:
-        return True
-    return False
+    """Returns True if event date/time has passed (untimed events last until the end of their day)."""
+    return event.starts_at < timezone.now()
 
 
-def _create_ticket_with_qr(event, user, email, tier, qty, total):
+def _create_ticket(event, user, email, tier, qty, total, request):
     """
-    Create Ticket, generate & attach QR image, and mark RSVP.
+    Create Ticket (owned by the account of ``email``, else the buyer; see
+    ownership.py), mark RSVP, enqueue its fulfillment job (QR + certificate)
+    and queue the confirmation email in the outbox.
+    Call inside the transaction that reserved the seats so the job and outbox
+    rows commit together with the ticket.
     IMPORTANT: This function does NOT increment tier.sold.
     """
     ticket = Ticket.objects.create(
         event=event,
-        user=user if user.is_authenticated else None,
+        user=ownership.owner_for(email, user),
         email=email,
         tier=tier,
         quantity=qty,
         total_amount=total,
     )
 
-    RSVP.objects.update_or_create(user=user, event=event, defaults={'status': 'A'})
+    analytics.set_rsvp(user, event, analytics.RSVP_GOING)
 
-   
-    payload = f"EVT:{event.id}|TCK:{ticket.code}|EMAIL:{email}|TIER:{tier.name}|QTY:{qty}"
-    img = qrcode.make(payload)
-    buf = io.BytesIO()
-    img.save(buf, format='PNG')
-    ticket.qr_image.save(f"{ticket.code}.png", ContentFile(buf.getvalue()), save=True)
-    buf.close()
+    enqueue("ticket.fulfill", ticket_id=ticket.pk)
+    outbox.add(outbox.KIND_CONFIRMATION, email, ticket=ticket, base_url=request.build_absolute_uri('/'))
     return ticket
 
 
-def generate_certificate_pdf(ticket):
-    """
-    Generate a simple certificate PDF (in-memory) and return (filename, ContentFile).
-    """
-    buffer = io.BytesIO()
-  
-    c = canvas.Canvas(buffer, pagesize=landscape(A4))
-    width, height = landscape(A4)
-
-   
-    c.setFillColorRGB(0.95, 0.95, 0.98)
-    c.rect(0.5 * cm, 0.5 * cm, width - 1 * cm, height - 1 * cm, fill=1, stroke=0)
-
-  
-    c.setFont("Helvetica-Bold", 34)
-    c.setFillColorRGB(0.05, 0.2, 0.45)
-    c.drawCentredString(width / 2, height - 4 * cm, "Certificate of Participation")
-
-   
-    c.setFont("Helvetica", 18)
-    c.setFillColorRGB(0.15, 0.15, 0.15)
-    event_title = ticket.event.title if ticket.event else "Event"
-    c.drawCentredString(width / 2, height - 6 * cm, f"Presented to")
-
-   
-    recipient = ticket.user.get_full_name() if ticket.user and ticket.user.get_full_name() else ticket.email
-    c.setFont("Helvetica-Bold", 26)
-    c.drawCentredString(width / 2, height - 8 * cm, recipient)
-
-    
-    c.setFont("Helvetica", 16)
-    date_str = ticket.event.date.strftime("%B %d, %Y") if getattr(ticket.event, 'date', None) else ""
-    c.drawCentredString(width / 2, height - 10 * cm, f"For participating in \"{event_title}\" on {date_str}")
-
-   
-    c.setFont("Helvetica", 12)
-    c.drawString(3 * cm, 2.5 * cm, f"Issued by: {getattr(settings, 'DEFAULT_FROM_EMAIL', 'organizer@example.com')}")
-    c.drawRightString(width - 3 * cm, 2.5 * cm, f"Date: {datetime.date.today().strftime('%B %d, %Y')}")
-
-  
-    c.line(width / 2 - 4 * cm, 3.5 * cm, width / 2 + 4 * cm, 3.5 * cm)
-    c.setFont("Helvetica-Oblique", 10)
-    c.drawCentredString(width / 2, 3.1 * cm, "Organizer Signature")
-
-    c.showPage()
-    c.save()
-
-    buffer.seek(0)
-    pdf_bytes = buffer.read()
-    buffer.close()
-
-    filename = f"certificate_{ticket.code}.pdf"
-    return filename, ContentFile(pdf_bytes, name=filename)
-
-
-def send_certificate_email(ticket, request=None):
-    """
-    Send the certificate as an email attachment to the ticket.email.
-    Also saves the certificate to ticket.certificate_file if that FileField exists.
-    """
-    try:
-        filename, pdf_content = generate_certificate_pdf(ticket)
-
-        subject = f"Your Certificate for {ticket.event.title}"
-        html_body = render_to_string('email/certificate_email.html', {'ticket': ticket})
-        text_body = strip_tags(html_body)
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
-        to = [ticket.email]
-
-        msg_alt = EmailMultiAlternatives(subject, text_body, from_email, to)
-        msg_alt.attach_alternative(html_body, "text/html")
-
-     
-        pdf_content.seek(0)
-        msg_alt.attach(filename, pdf_content.read(), 'application/pdf')
-
-      
-        try:
-            if ticket.qr_image:
-                ticket.qr_image.open('rb')
-                qr_data = ticket.qr_image.read()
-                ticket.qr_image.close()
-                msg_alt.attach("e-ticket-qr.png", qr_data, 'image/png')
-        except Exception:
-          
-            pass
-
-        msg_alt.send(fail_silently=False)
-
-      
-        try:
-            pdf_content.seek(0)
-            if hasattr(ticket, 'certificate_file'):
-                ticket.certificate_file.save(filename, pdf_content, save=True)
-        except Exception:
-           
-            pass
-
-    except Exception:
-       
-        traceback.print_exc()
-
-
-def _send_ticket_email(request, ticket: Ticket, free: bool):
-    """Send HTML email with QR attachment (if present)."""
-    try:
-        event = ticket.event
-        event_url = request.build_absolute_uri(event.get_absolute_url())
-        subject = ("Free Ticket Confirmation: " if free else "Payment Confirmation & Ticket: ") + event.title
-        context = {
-            'user': request.user,
-            'event': event,
-            'event_url': event_url,
-            'ticket': ticket,
-        }
-        html_content = render_to_string('email/event_confirmation_email.html', context)
-        text_content = strip_tags(html_content)
-        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
-
-        msg = EmailMultiAlternatives(subject, text_content, from_email, [ticket.email])
-        msg.attach_alternative(html_content, "text/html")
-
-        if ticket.qr_image:
-            ticket.qr_image.open('rb')
-            msg.attach(filename='e-ticket-qr.png', content=ticket.qr_image.read(), mimetype='image/png')
-            ticket.qr_image.close()
-
-        msg.send(fail_silently=False)
-    except Exception:
-        traceback.print_exc()
-
-
-def _finalize_ticket_send(request, ticket: Ticket, free: bool):
-    """
-    Send ticket email and certificate email. Each send has its own try/except so failure
-    of one doesn't stop the other or the checkout flow.
-    """
-  
-    try:
-        _send_ticket_email(request, ticket, free)
-    except Exception:
-        traceback.print_exc()
-
-   
-    try:
-        send_certificate_email(ticket, request=request)
-    except Exception:
-        traceback.print_exc()
-
-
+def _release_session_hold(data):
+    """Give back the seats of the hold recorded in a ``booking_<pk>`` session entry."""
+    if data.get('hold_id'):
+        inventory.release_hold(SeatHold(pk=data['hold_id'], tier_id=data['tier_id'], quantity=int(data['qty'])))
 
 
 def _upcoming_events_qs():
-    """Return events that haven't finished yet (date in future,
-    or today with time still to come, or no time set)."""
-    today = timezone.localdate()
-    now_t = timezone.localtime().time()
-    return (
-        Event.objects.filter(
-            Q(date__gt=today) |
-            Q(date=today, time__isnull=True) |
-            Q(date=today, time__gte=now_t)
-        )
-        .order_by('date', 'time')
-    )
+    """Events that haven't finished yet: one range over the indexed starts_at column."""
+    return Event.objects.filter(starts_at__gte=timezone.now())
 
 
 def home(request):
-    events = _upcoming_events_qs()
-    return render(request, 'home.html', {'events': events})
+    page = pagination.paginate(request, _upcoming_events_qs(), getattr(settings, 'HOME_EVENTS_PER_PAGE', 9))
+    return render(request, 'home.html', {'events': page, 'page_obj': page})
 
 
 def event_list(request):
-    events = _upcoming_events_qs()
-    return render(request, 'event_list.html', {'events': events})
+    # category + tiers (with availability computed in SQL) in a fixed number of queries per page
+    events = (
+        _upcoming_events_qs()
+        .select_related('category')
+        .prefetch_related(Prefetch('tiers', queryset=inventory.with_available(TicketTier.objects.order_by('price'))))
+    )
+    page = pagination.paginate(request, events, getattr(settings, 'EVENTS_PER_PAGE', 20))
+    return render(request, 'event_list.html', {'events': page, 'page_obj': page})
+
+
+def event_search(request):
+    """Full-text search over title/location/description (search.py), best match first."""
+    query = request.GET.get('q', '').strip()
+    results = search.search(query) if query else []
+    return render(request, 'event_search.html', {'query': query, 'results': results})
+
+
+def event_search_json(request):
+    query = request.GET.get('q', '').strip()
+    results = [
+        {
+            'id': e.pk,
+            'title': e.title,
+            'title_html': e.search_title,
+            'snippet_html': e.search_snippet,
+            'date': e.date.isoformat(),
+            'location': e.location,
+            'category': e.category.name if e.category else None,
+            'score': e.search_score,
+            'url': e.get_absolute_url(),
+        }
+        for e in (search.search(query) if query else [])
+    ]
+    return JsonResponse({'query': query, 'results': results})
 
 
 def event_detail(request, pk):
@@ -259,10 +124,24 @@ def event_detail(request, pk):
     Event detail — visible to anonymous users as well.
     Includes RSVP status for authenticated users + tiers, schedule, media.
     Shows past-event banner and disables actions when past.
+
+    Anonymous visitors get a cached page (event_pages.py). Seats left are
+    not part of it; the page loads them from event_availability_json.
     """
-    event = get_object_or_404(Event, pk=pk)
+    if event_pages.cacheable(request):
+        response, hit = event_pages.get_or_render(pk, lambda: _render_event_detail(request, pk, live=False))
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+    return _render_event_detail(request, pk, live=True)[0]
+
+
+def _render_event_detail(request, pk, live):
+    """``(response, event)``; ``live`` renders the seats left into the page as well."""
+    event = get_object_or_404(Event.objects.select_related('category'), pk=pk)
     rsvp_status = None
     tiers = event.tiers.all().order_by('price')
+    if live:
+        tiers = inventory.with_available(tiers)
     schedule_items = event.schedule_items.all()
     media = event.media.all()
     is_past = _event_is_past(event)
@@ -276,11 +155,25 @@ def event_detail(request, pk):
         'event': event,
         'rsvp_status': rsvp_status,
         'tiers': tiers,
+        'live_availability': live,
         'schedule_items': schedule_items,
         'media_items': media,
         'is_past': is_past,
     }
-    return render(request, 'event_detail.html', ctx)
+    return render(request, 'event_detail.html', ctx), event
+
+
+def event_availability_json(request, pk):
+    """Seats left per tier of one event, never cached: {event, tiers: [{id, available, sold_out}]}."""
+    rows = list(inventory.with_available(TicketTier.objects.filter(event_id=pk)).values_list('pk', 'seats_left'))
+    if not rows and not Event.objects.filter(pk=pk).exists():
+        raise Http404('No such event.')
+    response = JsonResponse({
+        'event': pk,
+        'tiers': [{'id': tier_id, 'available': left, 'sold_out': left <= 0} for tier_id, left in rows],
+    })
+    response['Cache-Control'] = 'no-store'
+    return response
 
 
 # =========================================
@@ -325,12 +218,14 @@ def event_create(request):
 # ===================================================
 
 @login_required
+@waiting_room.gate
 def book_event(request, pk):
     """
+    Gated by the event's waiting room when it has an admission_rate (waiting_room.py).
     GET: show form (email + tier + quantity).
     POST:
-      - Free tier (price == 0): atomically reserve (sold += qty), then issue ticket(s) with QR and email + certificate.
-      - Paid tier (price > 0): store selection in session and redirect to pay_event (no email yet).
+      - Free tier (price == 0): reserve with one guarded UPDATE (inventory.py), issue the ticket and queue email/certificate.
+      - Paid tier (price > 0): hold the seats for SEAT_HOLD_TTL, store selection in session and redirect to pay_event.
     """
     event = get_object_or_404(Event, pk=pk)
     if _event_is_past(event):
@@ -360,37 +255,39 @@ def book_event(request, pk):
         tier = get_object_or_404(TicketTier, pk=tier_id, event=event)
         total = tier.price * qty
 
-        # Paid tiers: store selection and go to payment page — do not send email yet
+        # Paid tiers: hold the seats for the checkout, then go to the payment page
         if tier.price > 0:
-            request.session[f'booking_{event.pk}'] = {
+            key = f'booking_{event.pk}'
+            previous = request.session.get(key)
+            if previous and previous.get('hold_id'):
+                _release_session_hold(previous)
+            try:
+                seat_hold = inventory.hold(tier, qty, confirmation_email, user=request.user)
+            except inventory.SoldOut as e:
+                messages.error(request, f"Only {e.available} tickets left for {tier.name}.")
+                return redirect('book_event', pk=pk)
+            request.session[key] = {
                 'email': confirmation_email,
                 'tier_id': tier.id,
                 'qty': qty,
                 'total': float(total),
+                'hold_id': seat_hold.pk,
             }
             return redirect('pay_event', pk=event.pk)
 
-        # Free tiers: reserve atomically, then issue ticket(s) and emails
+        # Free tiers: reserve atomically, then issue the ticket; certificate + email run in the background
         try:
             with transaction.atomic():
-                locked = TicketTier.objects.select_for_update().get(pk=tier.id, event=event)
-                if qty > locked.available:
-                    messages.error(request, f"Only {locked.available} tickets left for {locked.name}.")
-                    return redirect('book_event', pk=pk)
-
-                locked.sold = F('sold') + qty
-                locked.save(update_fields=['sold'])
-                locked.refresh_from_db()
+                inventory.reserve(tier, qty)
+                _create_ticket(event, request.user, confirmation_email, tier, qty, total, request)
 
-            ticket = _create_ticket_with_qr(event, request.user, confirmation_email, tier, qty, total)
-
-            # send emails (ticket + certificate)
-            _finalize_ticket_send(request, ticket, free=True)
-
-            messages.success(request, f"Free ticket confirmed. Email & certificate sent to {confirmation_email}.")
+            messages.success(request, f"Free ticket confirmed. Email & certificate will be sent to {confirmation_email} shortly.")
+        except inventory.SoldOut as e:
+            messages.error(request, f"Only {e.available} tickets left for {tier.name}.")
+            return redirect('book_event', pk=pk)
         except Exception:
-            traceback.print_exc()
-            messages.warning(request, "Ticket created, but sending email/certificate failed. Check server logs.")
+            logger.exception("Free booking failed for event %s", event.pk)
+            messages.warning(request, "Booking failed. Please try again.")
         return redirect('confirmation_page')
 
     # GET: render booking page
@@ -402,11 +299,49 @@ def book_event(request, pk):
     })
 
 
+@login_required
+def waiting_room_view(request, pk):
+    """Queue page: shows the user's position and polls waiting_room_status until admitted."""
+    event = get_object_or_404(Event, pk=pk)
+    admission_rate = waiting_room.rate(event.pk)
+    if not admission_rate or _event_is_past(event):
+        return redirect('book_event', pk=pk)
+
+    number, issued = waiting_room.ticket(request, event.pk)
+    state = waiting_room.status(event.pk, number, admission_rate)
+    if state['admitted']:
+        response = redirect('book_event', pk=pk)
+    else:
+        response = render(request, 'waiting_room.html', {'event': event, **state})
+    if issued:
+        waiting_room.set_token(response, event.pk, number)
+    return response
+
+
+def waiting_room_status(request, pk):
+    """
+    JSON polled by the waiting-room page: {admitted, position, eta}. Reads the
+    signed queue cookie and the cache only -- no session, user or DB access.
+    """
+    admission_rate = waiting_room.rate(pk)
+    number = waiting_room.read_token(request, pk)
+    if not admission_rate:
+        state = {'admitted': True, 'position': 0, 'eta': 0}
+    elif number is None:
+        return JsonResponse({'error': 'No queue token; open the waiting room page.'}, status=400)
+    else:
+        state = waiting_room.status(pk, number, admission_rate)
+    response = JsonResponse({**state, 'next': reverse('book_event', args=[pk]) if state['admitted'] else None})
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
 @login_required
 def pay_event(request, pk):
     """
-    GET: show payment summary from session (email, tier, qty, total).
-    POST: simulate payment -> atomically reserve (sold += qty) -> issue ticket(s) with QR -> email & certificate -> clear session.
+    GET: show payment summary from session (email, tier, qty, total) and how long the seats are held.
+    POST: simulate payment -> convert the seat hold (inventory.py) -> issue ticket -> queue email/certificate -> clear session.
+    POST action=cancel: release the hold.
     """
     event = get_object_or_404(Event, pk=pk)
     if _event_is_past(event):
@@ -420,6 +355,17 @@ def pay_event(request, pk):
         return redirect('book_event', pk=pk)
 
     tier = get_object_or_404(TicketTier, pk=data['tier_id'], event=event)
+    seat_hold = SeatHold(pk=data.get('hold_id'), tier=tier, quantity=int(data['qty']))
+    hold_expires_at = (
+        SeatHold.objects.filter(pk=seat_hold.pk).values_list('expires_at', flat=True).first()
+        if seat_hold.pk else None
+    )
+
+    if request.method == 'POST' and request.POST.get('action') == 'cancel':
+        _release_session_hold(data)
+        del request.session[key]
+        messages.info(request, "Booking cancelled.")
+        return redirect('event_detail', pk=pk)
 
     if request.method == 'POST':
         try:
@@ -428,29 +374,25 @@ def pay_event(request, pk):
             total = data['total']
 
             with transaction.atomic():
-                locked = TicketTier.objects.select_for_update().get(pk=tier.id, event=event)
-                if qty > locked.available:
-                    messages.error(request, f"Only {locked.available} tickets left for {locked.name}.")
-                    return redirect('book_event', pk=pk)
-
-                locked.sold = F('sold') + qty
-                locked.save(update_fields=['sold'])
-                locked.refresh_from_db()
-
-            # Payment simulated OK -> issue ticket
-            ticket = _create_ticket_with_qr(event, request.user, email, tier, qty, total)
-
-            # send ticket email and certificate
-            _finalize_ticket_send(request, ticket, free=False)
+                if seat_hold.pk:
+                    inventory.convert(seat_hold)
+                else:
+                    inventory.reserve(tier, qty)
+                # Payment simulated OK -> issue ticket (certificate + email are queued)
+                ticket = _create_ticket(event, request.user, email, tier, qty, total, request)
 
             # clear session
             if key in request.session:
                 del request.session[key]
 
-            messages.success(request, f"Payment successful. Ticket & certificate sent to {ticket.email}.")
+            messages.success(request, f"Payment successful. Ticket & certificate will be sent to {ticket.email} shortly.")
+        except inventory.SoldOut as e:
+            del request.session[key]
+            messages.error(request, f"Your seat hold expired and only {e.available} tickets are left for {tier.name}.")
+            return redirect('book_event', pk=pk)
         except Exception:
-            traceback.print_exc()
-            messages.warning(request, "Payment ok, but sending email/certificate failed. Check server logs.")
+            logger.exception("Paid booking failed for event %s", event.pk)
+            messages.warning(request, "Payment failed. Please try again.")
         return redirect('confirmation_page')
 
     return render(request, 'pay_event.html', {
@@ -459,6 +401,7 @@ def pay_event(request, pk):
         'tier': tier,
         'qty': data['qty'],
         'total': data['total'],
+        'hold_expires_at': hold_expires_at,
     })
 
 
@@ -472,14 +415,12 @@ def rsvp_event(request, pk):
 
     if request.method == 'POST':
         status = request.POST.get('status')
-        rsvp, created = RSVP.objects.update_or_create(
-            user=request.user, event=event, defaults={'status': status}
-        )
-        try:
-            display = rsvp.get_status_display()
-        except Exception:
-            display = status
-        messages.success(request, f'Your RSVP is set to "{display}".')
+        if status not in dict(RSVP.STATUS_CHOICES):
+            messages.error(request, "Please choose Going or Not Going.")
+            return redirect('event_detail', pk=pk)
+        # keeps the event's going counter in step (analytics.py)
+        rsvp, created = analytics.set_rsvp(request.user, event, status)
+        messages.success(request, f'Your RSVP is set to "{rsvp.get_status_display()}".')
     return redirect('event_detail', pk=pk)
 
 
@@ -488,12 +429,24 @@ def rsvp_event(request, pk):
 # =========================
 
 def calendar_view(request):
-    events = Event.objects.all().order_by('date')
-    events_for_calendar = [
-        {'title': e.title, 'date': e.date.isoformat(), 'url': reverse('event_detail', args=[e.pk])}
-        for e in events
-    ]
-    return render(request, 'calendar.html', {'events': events_for_calendar})
+    """The calendar page; events come from calendar_events_json for the visible range."""
+    return render(request, 'calendar.html')
+
+
+def calendar_events_json(request):
+    """
+    FullCalendar event source: events dated within [start, end), served from
+    per-month cached chunks (calendar_feed.py). Public and cacheable.
+    """
+    start = calendar_feed.parse_bound(request.GET.get('start'))
+    end = calendar_feed.parse_bound(request.GET.get('end'))
+    if not start or not end or end <= start:
+        return JsonResponse({'error': 'start and end must be ISO 8601 dates with start < end.'}, status=400)
+    if (end - start).days > getattr(settings, 'CALENDAR_FEED_MAX_DAYS', 100):
+        return JsonResponse({'error': 'Requested range is too long.'}, status=400)
+    response = JsonResponse(calendar_feed.window(start, end), safe=False)
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'CALENDAR_FEED_MAX_AGE', 300))
+    return response
 
 
 # ==================================
@@ -548,25 +501,43 @@ def dashboard(request):
 @user_passes_test(is_organizer)
 def organizer_dashboard(request):
     """Organizer view: my events + sales summary."""
-    my_events = Event.objects.filter(organizer=request.user).order_by('-date')
+    my_events = (
+        Event.objects.filter(organizer=request.user)
+        .select_related('category').prefetch_related('tiers__shards').order_by('-date')
+    )
+    # per-event counters maintained by the booking and RSVP paths (analytics.py)
     stats = (
-        Ticket.objects.filter(event__organizer=request.user)
-        .values('event__id', 'event__title')
-        .annotate(total_sold=Sum('quantity'), revenue=Sum('total_amount'))
-        .order_by('-revenue')
+        EventStats.objects.filter(event__organizer=request.user)
+        .filter(Q(tickets__gt=0) | Q(rsvps_going__gt=0))
+        .order_by('-revenue', 'event__title')
+        .values('event__id', 'event__title', 'revenue', 'rsvps_going', total_sold=F('attendees'))
     )
     return render(request, 'dashboard_organizer.html', {
         'events': my_events,
         'stats': stats,
+        'tier_shards': getattr(settings, 'TIER_SHARDS', 8),
     })
 
 
+@login_required
+@user_passes_test(is_organizer)
+def tier_sharding(request, pk):
+    """POST: switch one of my tiers into (or out of) flash-sale mode with sharded sold counters."""
+    tier = get_object_or_404(TicketTier, pk=pk, event__organizer=request.user)
+    if request.method == 'POST':
+        enable = request.POST.get('mode') == 'sharded'
+        inventory.set_sharding(tier, getattr(settings, 'TIER_SHARDS', 8) if enable else 0)
+        if enable:
+            messages.success(request, f"Flash-sale mode on for {tier.name}: sales spread over {tier.shard_count} counters.")
+        else:
+            messages.success(request, f"Flash-sale mode off for {tier.name}.")
+    return redirect('organizer_dashboard')
+
+
 @login_required
 def attendee_dashboard(request):
-    """Attendee view: my tickets (by user or email)."""
-    my_tickets = Ticket.objects.filter(
-        Q(user=request.user) | Q(email=request.user.email)
-    ).select_related('event', 'tier').order_by('-created_at')
+    """Attendee view: my tickets (owner lookup on the (user, created_at) index; see ownership.py)."""
+    my_tickets = Ticket.objects.filter(user=request.user).select_related('event', 'tier').order_by('-created_at')
     return render(request, 'dashboard_attendee.html', {
         'tickets': my_tickets,
     })
@@ -583,67 +554,37 @@ def admin_dashboard(request):
 
 @staff_member_required
 def admin_analytics(request):
-    totals = Ticket.objects.aggregate(
-        total_attendees=Sum('quantity'),
-        total_revenue=Sum('total_amount'),
-    )
-    total_attendees = totals.get('total_attendees') or 0
-    total_revenue = totals.get('total_revenue') or Decimal('0.00')
-
-    popular = (
-        Ticket.objects
-        .values('event__title')
-        .annotate(attendees=Sum('quantity'))
-        .order_by('-attendees')
-        .first()
-    )
-    most_popular_title = popular['event__title'] if popular else "—"
-    most_popular_count = popular['attendees'] if popular else 0
+    # all-time KPIs from the rollup tables (analytics.py), cached; the charts load analytics_json
+    summary = analytics.summary()
 
     return render(request, 'admin_analytics.html', {
-        'total_attendees': total_attendees,
-        'total_revenue': total_revenue,
-        'most_popular_title': most_popular_title,
-        'most_popular_count': most_popular_count,
+        'total_attendees': summary['attendees'],
+        'total_revenue': summary['revenue'],
+        'most_popular_title': summary['popular_title'] or "—",
+        'most_popular_count': summary['popular_attendees'],
+        'filters': request.GET,
+        'cache_stats': caching.stats(analytics.NAMESPACE),
+        'cache_namespaces': [(name, caching.stats(name)) for name in caching.NAMESPACES],
     })
 
 
 @staff_member_required
 def analytics_json(request):
-    revenue_by_event_qs = (
-        Ticket.objects
-        .values('event__title')
-        .annotate(revenue=Sum('total_amount'), attendees=Sum('quantity'))
-        .order_by('-revenue')
-    )
-    rev_labels = [r['event__title'] for r in revenue_by_event_qs]
-    rev_values = [float(r['revenue'] or 0) for r in revenue_by_event_qs]
-
-    attendees_by_date_qs = (
-        Ticket.objects
-        .annotate(day=TruncDate('created_at'))
-        .values('day')
-        .annotate(attendees=Sum('quantity'))
-        .order_by('day')
-    )
-    att_labels = [a['day'].isoformat() for a in attendees_by_date_qs]
-    att_values = [int(a['attendees'] or 0) for a in attendees_by_date_qs]
-
-    revenue_by_date_qs = (
-        Ticket.objects
-        .annotate(day=TruncDate('created_at'))
-        .values('day')
-        .annotate(revenue=Sum('total_amount'))
-        .order_by('day')
-    )
-    revd_labels = [r['day'].isoformat() for r in revenue_by_date_qs]
-    revd_values = [float(r['revenue'] or 0) for r in revenue_by_date_qs]
-
-    return JsonResponse({
-        'revenue_by_event': {'labels': rev_labels, 'values': rev_values},
-        'attendees_by_date': {'labels': att_labels, 'values': att_values},
-        'revenue_by_date': {'labels': revd_labels, 'values': revd_values},
-    })
+    """
+    Dashboard series from the analytics rollups. Filters: ``from``/``to``
+    (ISO dates, inclusive; default the last ANALYTICS_DEFAULT_DAYS days),
+    ``bucket`` (day, week or month), ``event`` and ``organizer`` ids.
+    Cached per filter set until the next ticket is booked; ``X-Cache`` tells
+    whether this response was a hit and ``cache`` carries the running hit rate.
+    """
+    try:
+        filters = analytics.parse_filters(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    payload, hit = analytics.report(**filters)
+    response = JsonResponse({**payload, 'cache': {'hit': hit, **caching.stats(analytics.NAMESPACE)}})
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
 
 
 # =========================
@@ -652,42 +593,30 @@ def analytics_json(request):
 
 @login_required
 def profile_view(request):
-    """Rich profile page: shows user info + booking stats + ticket list."""
+    """Rich profile page: user info, cached booking stats (profile_stats.py) and the latest tickets."""
     user = request.user
+    stats = profile_stats.get(user)
+    limit = getattr(settings, 'PROFILE_TICKETS_LIMIT', 20)
 
-    tickets_qs = (
-        Ticket.objects
-        .filter(Q(user=user) | Q(email=user.email))
-        .select_related('event', 'tier')
-        .order_by('-created_at')
-    )
-
-    agg = tickets_qs.aggregate(
-        total_tickets=Sum('quantity'),
-        total_spent=Sum('total_amount'),
-    )
-    total_tickets = agg.get('total_tickets') or 0
-    total_spent = agg.get('total_spent') or 0
+    tickets_qs = Ticket.objects.filter(user=user).select_related('event', 'tier').order_by('-created_at')
+    now = timezone.now()
+    # the stats say which lists are empty, so those are never queried
+    upcoming_tickets = list(tickets_qs.filter(event__starts_at__gte=now)[:limit]) if stats['upcoming_bookings'] else []
+    past_tickets = list(tickets_qs.filter(event__starts_at__lt=now)[:limit]) if stats['past_bookings'] else []
 
-    booked_event_ids = list(tickets_qs.values_list('event_id', flat=True).distinct())
-    booked_events_count = len(booked_event_ids)
-
-    today = datetime.date.today()
-    # correct lookups to the related Event.date field
-    upcoming_tickets = tickets_qs.filter(event__date__gte=today)
-    past_tickets = tickets_qs.filter(event__date__lt=today)
-
-    user_rsvps = RSVP.objects.filter(user=user).select_related('event').order_by('-event__date')
+    user_rsvps = RSVP.objects.filter(user=user).select_related('event').order_by('-event__date')[:limit]
 
     context = {
         'user_obj': user,
         'profile': getattr(user, 'profile', None),
-        'booked_events_count': booked_events_count,
-        'total_tickets': total_tickets,
-        'total_spent': total_spent,
+        'stats': stats,
+        'booked_events_count': stats['events'],
+        'total_tickets': stats['tickets'],
+        'total_spent': stats['spent'],
         'upcoming_tickets': upcoming_tickets,
         'past_tickets': past_tickets,
-        'tickets': tickets_qs[:20],
+        'more_upcoming': stats['upcoming_bookings'] - len(upcoming_tickets),
+        'more_past': stats['past_bookings'] - len(past_tickets),
         'rsvps': user_rsvps,
     }
     return render(request, 'profile.html', context)
@@ -748,29 +677,50 @@ def download_certificate(request, ticket_id):
     """
     Download the certificate PDF for a ticket.
     - Admins/staff can download any.
-    - Regular users can download only their own tickets (or tickets sent to their email).
+    - Regular users can download only tickets they own (see ownership.py).
     If certificate file is missing we generate it on-demand and attach it to the ticket.
     """
     ticket = get_object_or_404(Ticket, pk=ticket_id)
 
     # permission check: owner or staff
-    is_owner = (ticket.user == request.user) or (ticket.email == request.user.email)
+    is_owner = ticket.user_id == request.user.pk
     if not (is_owner or request.user.is_staff):
         messages.error(request, "You don't have permission to access that certificate.")
         return redirect('profile')
 
-    # if file does not exist, generate and attach
+    # if file does not exist, generate and attach (pipeline stage, so only once)
     try:
         if not ticket.certificate_file:
-            filename, content = generate_certificate_pdf(ticket)
-            # save to the ticket.filefield
-            ticket.certificate_file.save(filename, content, save=True)
+            # stored once by whoever claims the stage; a request that loses the race gets an unstored copy
+            return FileResponse(
+                io.BytesIO(ensure_certificate(ticket)), as_attachment=True, filename=certificate_filename(ticket),
+            )
 
         # Open file and return as attachment
         ticket.certificate_file.open('rb')
         response = FileResponse(ticket.certificate_file, as_attachment=True, filename=ticket.certificate_file.name)
         return response
-    except Exception as e:
-        # log if you want; fallback to 404
-        # import traceback; traceback.print_exc()
+    except Exception:
+        logger.exception("Certificate download failed for ticket %s", ticket.pk)
         raise Http404("Certificate not available.")
+
+
+def ticket_qr(request, code, fmt):
+    """
+    E-ticket QR as SVG or PNG, rendered on first request and cached (see qr.py).
+    The ticket code is an unguessable UUID already printed in the confirmation
+    email, so it works as the access token (door scanners, mail clients).
+    """
+    if fmt not in qr.FORMATS:
+        raise Http404("Unknown QR format.")
+    ticket = get_object_or_404(Ticket.objects.select_related('tier'), code=code)
+    payload = qr_payload(ticket)
+    etag = qr.etag(qr.cache_key(payload, fmt))
+
+    if etag in [t.strip() for t in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(qr.get(payload, fmt), content_type=qr.FORMATS[fmt])
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
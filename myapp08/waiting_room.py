@@ -0,0 +1,172 @@
+# myapp08/waiting_room.py
+"""
+Virtual waiting room in front of ``book_event``.
+
+An event with ``admission_rate`` > 0 admits that many users per minute to the
+booking page; everybody else waits on a page that polls a JSON status
+endpoint. The queue is two numbers per event in the ``waiting_room`` cache
+(point it at Redis/Memcached when running several processes), nothing in the
+database:
+
+* ``tail`` -- the last queue number issued (atomic ``incr``).
+* ``head`` -- numbers up to here are admitted. It moves forward by
+  ``admission_rate`` per minute, lazily, whenever somebody asks, and may run
+  at most a burst (``WAITING_ROOM_BURST_SECONDS`` worth of admissions) ahead
+  of ``tail``, so a quiet event lets people straight through while an
+  on-sale spike is metered out.
+
+A queue number is handed to the browser in a signed cookie (the queue token);
+it can't be forged or moved to another event, and stays valid for
+``WAITING_ROOM_TOKEN_MAX_AGE`` seconds.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+from django.shortcuts import redirect
+
+from .models import Event
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _store():
+    alias = _setting('WAITING_ROOM_CACHE', 'waiting_room')
+    return caches[alias if alias in settings.CACHES else 'default']
+
+
+def _key(event_id, name):
+    return f"wr:{event_id}:{name}"
+
+
+def rate(event_id):
+    """Admissions per minute for the event (0 = no waiting room), cached briefly."""
+    store = _store()
+    value = store.get(_key(event_id, 'rate'))
+    if value is None:
+        value = Event.objects.filter(pk=event_id).values_list('admission_rate', flat=True).first() or 0
+        store.set(_key(event_id, 'rate'), value, _setting('WAITING_ROOM_RATE_TTL', 30))
+    return value
+
+
+def burst(admission_rate):
+    return max(1, math.ceil(admission_rate * _setting('WAITING_ROOM_BURST_SECONDS', 10) / 60))
+
+
+# -- queue ---------------------------------------------------------------------
+
+def join(event_id):
+    """Issue the next queue number."""
+    store = _store()
+    store.add(_key(event_id, 'tail'), 0, None)
+    return store.incr(_key(event_id, 'tail'))
+
+
+def head(event_id, admission_rate, now=None):
+    """Highest admitted queue number, advanced for the time elapsed since the last call."""
+    store = _store()
+    now = time.time() if now is None else now
+    allowance = burst(admission_rate)
+    state_key = _key(event_id, 'head')
+    if store.add(state_key, (allowance, now), None):
+        return allowance
+    admitted, since = store.get(state_key, (allowance, now))
+    gained = int((now - since) * admission_rate / 60)
+    if gained <= 0:
+        return admitted
+
+    # one caller advances the state; the others use the value they read
+    lock = _key(event_id, 'lock')
+    if not store.add(lock, 1, 5):
+        return admitted
+    try:
+        admitted, since = store.get(state_key, (admitted, since))
+        gained = int((now - since) * admission_rate / 60)
+        if gained > 0:
+            ceiling = (store.get(_key(event_id, 'tail')) or 0) + allowance
+            if admitted + gained >= ceiling:
+                # queue is empty: don't bank idle time beyond one burst
+                admitted, since = max(admitted, ceiling), now
+            else:
+                admitted, since = admitted + gained, since + gained * 60 / admission_rate
+            store.set(state_key, (admitted, since), None)
+    finally:
+        store.delete(lock)
+    return admitted
+
+
+def status(event_id, number, admission_rate, now=None):
+    """``{'admitted', 'position', 'eta'}`` for a queue number; ``eta`` in seconds."""
+    ahead = max(number - head(event_id, admission_rate, now=now), 0)
+    return {
+        'admitted': ahead == 0,
+        'position': ahead,
+        'eta': math.ceil(ahead * 60 / admission_rate) if ahead else 0,
+    }
+
+
+def reset(event_id):
+    """Forget the event's queue state, e.g. after the on-sale is over."""
+    _store().delete_many([_key(event_id, name) for name in ('tail', 'head', 'rate', 'lock')])
+
+
+# -- tokens --------------------------------------------------------------------
+
+def cookie_name(event_id):
+    return f"wr_{event_id}"
+
+
+def _salt(event_id):
+    return f"myapp08.waiting_room.{event_id}"
+
+
+def read_token(request, event_id):
+    """Queue number from the request's signed cookie, or None."""
+    try:
+        return int(request.get_signed_cookie(
+            cookie_name(event_id), default=None, salt=_salt(event_id),
+            max_age=_setting('WAITING_ROOM_TOKEN_MAX_AGE', 2 * 3600),
+        ))
+    except (TypeError, ValueError, signing.BadSignature):
+        return None
+
+
+def set_token(response, event_id, number):
+    response.set_signed_cookie(
+        cookie_name(event_id), number, salt=_salt(event_id),
+        max_age=_setting('WAITING_ROOM_TOKEN_MAX_AGE', 2 * 3600), httponly=True, samesite='Lax',
+    )
+
+
+def ticket(request, event_id):
+    """``(number, issued)``: the request's queue number, joining the queue if it has none."""
+    number = read_token(request, event_id)
+    if number is not None:
+        return number, False
+    return join(event_id), True
+
+
+def gate(view):
+    """
+    Let a ``view(request, pk, ...)`` run only for users admitted from the
+    event's queue; send everybody else to the waiting room.
+    """
+    @wraps(view)
+    def wrapper(request, pk, *args, **kwargs):
+        admission_rate = rate(pk)
+        if not admission_rate:
+            return view(request, pk, *args, **kwargs)
+        number, issued = ticket(request, pk)
+        if status(pk, number, admission_rate)['admitted']:
+            response = view(request, pk, *args, **kwargs)
+        else:
+            response = redirect('waiting_room', pk=pk)
+        if issued:
+            set_token(response, pk, number)
+        return response
+    return wrapper
@@ -83,6 +83,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # seconds a writer waits for SQLite's lock before "database is locked"
+        'OPTIONS': {'timeout': 20},
+        # file-backed test DB: threads in the concurrency tests need their own
+        # connections to one database (in-memory shared cache fails fast instead)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -152,4 +157,109 @@ EMAIL_HOST_USER = 'shajid22092005@gmail.com'
 EMAIL_HOST_PASSWORD = 'axqe qlnl sopz oxxi'  # DO NOT commit to source control
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
-
+# Mail dispatch (myapp08/mail.py): messages per SMTP session batch, sending
+# limit (0 = unlimited) and how long an idle connection is kept before reconnecting
+MAIL_BATCH_SIZE = 50
+MAIL_RATE_PER_MINUTE = 0
+MAIL_CONNECTION_IDLE_TIMEOUT = 60
+
+# Absolute base URL for links in emails sent outside a request (workers, commands)
+SITE_URL = 'http://127.0.0.1:8000/'
+
+
+
+# Background job queue (myapp08/jobs.py, run with `python manage.py run_workers`)
+JOB_VISIBILITY_TIMEOUT = 300   # seconds a claimed job stays invisible to other workers
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_DELAY = 5       # seconds; doubles on every failed attempt
+JOB_RETRY_MAX_DELAY = 3600
+
+# Email outbox (myapp08/outbox.py, delivered by `python manage.py drain_outbox`)
+OUTBOX_MAX_ATTEMPTS = 8          # failed deliveries before a message is dead-lettered
+OUTBOX_RETRY_BASE_DELAY = 30     # seconds; doubles on every failed attempt
+OUTBOX_RETRY_MAX_DELAY = 6 * 3600
+OUTBOX_LEASE = 300               # seconds a claimed batch stays invisible to other drainers
+
+# E-ticket QR codes (myapp08/qr.py): fixed symbol version / error correction /
+# mask (None = let qrcode pick, ~7x slower), PNG pixels per module, the
+# in-process LRU size (entries), and the size `python manage.py prune_qr_cache`
+# trims the on-disk cache to
+QR_VERSION = 8
+QR_ERROR_CORRECTION = 'M'
+QR_MASK_PATTERN = 2
+QR_BOX_SIZE = 8
+QR_BORDER = 4
+QR_MEMORY_CACHE_SIZE = 512
+QR_CACHE_DIR = 'qr_cache'
+QR_CACHE_MAX_MB = 256
+
+# Paid checkout seat holds (myapp08/inventory.py): seconds a held seat is kept
+# for the buyer; expired holds are released by `python manage.py run_workers`
+# every SEAT_HOLD_SWEEP_INTERVAL seconds (or by `python manage.py sweep_holds`)
+SEAT_HOLD_TTL = 600
+SEAT_HOLD_SWEEP_INTERVAL = 15
+
+# Counter shards used when a tier is switched to flash-sale mode
+# (myapp08/inventory.py; fold them back with `python manage.py consolidate_shards`)
+TIER_SHARDS = 8
+
+# Waiting room in front of booking (myapp08/waiting_room.py), enabled per event
+# by Event.admission_rate. Queue counters live in this cache; use a shared
+# backend with atomic incr (Redis, Memcached) when running several processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'waiting_room': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'waiting-room',
+    },
+}
+WAITING_ROOM_BURST_SECONDS = 10       # admissions allowed straight through when the queue is empty
+WAITING_ROOM_TOKEN_MAX_AGE = 2 * 3600  # seconds a queue token (signed cookie) stays valid
+WAITING_ROOM_RATE_TTL = 30            # seconds an event's admission_rate is cached
+
+# Listing pages (home, event_list) use keyset pagination on
+# (starts_at, id) with ?after= / ?before= cursors (myapp08/pagination.py)
+HOME_EVENTS_PER_PAGE = 9
+EVENTS_PER_PAGE = 20
+
+# Event search (myapp08/search.py): SQLite FTS5 index, Postgres full-text
+# search, or icontains elsewhere; rebuild with `python manage.py rebuild_search_index`
+SEARCH_RESULTS_LIMIT = 50
+SEARCH_MAX_TERMS = 8
+SEARCH_POSTGRES_CONFIG = 'english'
+
+# Calendar JSON feed (myapp08/calendar_feed.py): longest range served, browser
+# cache lifetime of a response, and how long a cached month is kept (seconds)
+CALENDAR_FEED_MAX_DAYS = 100
+CALENDAR_FEED_MAX_AGE = 300
+CALENDAR_MONTH_CACHE_TTL = 3600
+
+# Analytics API (myapp08/analytics.py): served from the rollup tables, cached
+# per filter set until the next booking (versioned keys, myapp08/caching.py)
+ANALYTICS_CACHE_TTL = 300       # seconds a cached report is kept at most
+ANALYTICS_DEFAULT_DAYS = 90     # range when no ?from= is given
+ANALYTICS_MAX_BUCKETS = 400     # longest series (days, weeks or months) per request
+ANALYTICS_TOP_EVENTS = 20       # events in the revenue-by-event chart
+
+# Profile page (myapp08/profile_stats.py): per-user booking stats are cached
+# until the user's tickets/RSVPs change (at most this many seconds)
+PROFILE_STATS_TTL = 600
+PROFILE_TICKETS_LIMIT = 20      # upcoming / past tickets listed on the page
+
+# Template fragment cache ({% fragment %}, myapp08/fragments.py): event cards
+# and the upcoming-events block, keyed on per-event versions
+FRAGMENT_CACHE_TTL = 3600
+
+# Anonymous event_detail pages (myapp08/event_pages.py); purged when the event,
+# its tiers, schedule or media change, and never kept past the event's start
+EVENT_PAGE_CACHE_TTL = 600
+
+# Resized WebP/JPEG variants of event images (myapp08/image_variants.py),
+# built in the background on upload; `manage.py build_image_variants` backfills
+# The worker's purge of cached cards/pages only reaches other processes with a
+# shared cache backend; with locmem they switch after IMAGE_VARIANT_PENDING_TTL.
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_PENDING_TTL = 10  # seconds markup showing a not-yet-resized image is cached